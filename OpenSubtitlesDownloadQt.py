@@ -38,27 +38,171 @@ import sys
 if sys.version_info <= (3,0):
     print("Python 3 is not available on your system, exiting...")
     sys.exit(2)
-try:
-    from PyQt5 import QtCore, QtGui, QtWidgets
-except ImportError:
-    print("PyQt5 is not available on your system, exiting...")
-    sys.exit(2)
-
 import os
 import re
 import struct
 import mimetypes
+import fnmatch
+import itertools
 import time
+import zlib
+import binascii
 import gzip
+import hashlib
+import shutil
 import argparse
-import subprocess
-import urllib.request
+import threading
+import urllib.parse
+import http.client
+import xmlrpc.client
+import concurrent.futures
+import queue
+import select
+import signal
+import collections
+import contextlib
 from xmlrpc.client import ServerProxy
 import configparser
+import json
+import csv
+try:
+    import fcntl
+except ImportError:
+    fcntl = None # No lock file for the session on Windows
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None # The local cache is optional
+
+# ==== HTTP connection pool ====================================================
+# Keep-alive HTTP connections are shared by the XML-RPC requests and the subtitles
+# downloads, of every thread. At most opt_http_pool_size idle connections are kept
+# per host, for opt_http_idle_timeout seconds. Requests time out after
+# opt_http_timeout seconds.
+
+class connectionPool():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = collections.defaultdict(list) # (scheme, host) -> [(connection, last use)]
+
+    def acquire(self, scheme, host):
+        """Get an idle connection to this host, or open a new one"""
+        with self.lock:
+            connections = self.idle[(scheme, host)]
+            while connections:
+                connection, lastUse = connections.pop()
+                if time.monotonic() - lastUse < opt_http_idle_timeout:
+                    return connection
+                connection.close()
+
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, timeout=opt_http_timeout)
+        return http.client.HTTPConnection(host, timeout=opt_http_timeout)
+
+    def release(self, scheme, host, connection):
+        """Give a connection back to the pool, once its response has been read"""
+        with self.lock:
+            connections = self.idle[(scheme, host)]
+            if len(connections) < opt_http_pool_size:
+                connections.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+connections = connectionPool()
+
+class pooledTransport(xmlrpc.client.Transport):
+    """XML-RPC transport borrowing keep-alive connections from the connection pool"""
+    scheme = 'http'
+
+    def make_connection(self, host):
+        chost, self._extra_headers, x509 = self.get_host_info(host)
+        self._connection = host, connections.acquire(self.scheme, chost)
+        return self._connection[1]
+
+    def single_request(self, host, handler, request_body, verbose=False):
+        quota.request() # rate limit
+        try:
+            return super(pooledTransport, self).single_request(host, handler, request_body, verbose)
+        finally:
+            # After an error the connection is already closed (and forgotten)
+            connectionHost, connection = self._connection
+            if connection:
+                self._connection = (None, None)
+                connections.release(self.scheme, self.get_host_info(connectionHost)[0], connection)
+
+    def parse_response(self, response):
+        metricsCount('bytesReceived', int(response.getheader('Content-Length') or 0))
+        return super(pooledTransport, self).parse_response(response)
+
+class pooledSafeTransport(pooledTransport):
+    """XML-RPC transport over HTTPS, borrowing keep-alive connections from the connection pool"""
+    scheme = 'https'
+
+def newServerProxy():
+    """Create an XML-RPC server proxy using the connection pool"""
+    if osd_server_url.startswith('https'):
+        return ServerProxy(osd_server_url, transport=pooledSafeTransport())
+    return ServerProxy(osd_server_url, transport=pooledTransport())
+
+def httpRequest(url):
+    """Send a GET request using a connection from the connection pool, retry once
+    with a new connection if the idle one has been closed by the server.
+    Return the connection and its response"""
+    path = url.path + ('?' + url.query if url.query else '')
+    for attempt in (0, 1):
+        quota.request() # rate limit
+        connection = connections.acquire(url.scheme, url.netloc)
+        try:
+            connection.request('GET', path or '/')
+            return connection, connection.getresponse()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            if attempt:
+                raise
+            metricsCount('retries')
+
+def httpGet(url, write=None, redirects=5):
+    """Get the content of an URL, using a connection from the connection pool (and
+    following redirections). The content is returned, or streamed by chunks to write()"""
+    url = urllib.parse.urlsplit(url)
+    connection, response = httpRequest(url)
+    try:
+        location = response.getheader('Location')
+        if response.status in (301, 302, 303, 307, 308) and location and redirects > 0:
+            response.read()
+            data = None
+        elif response.status != 200:
+            response.read()
+            raise IOError("HTTP error " + str(response.status) + " for " + url.geturl())
+        elif write is None:
+            data = response.read()
+            metricsCount('bytesReceived', len(data))
+        else:
+            data = None
+            while True:
+                chunk = response.read(16384)
+                if not chunk:
+                    break
+                metricsCount('bytesReceived', len(chunk))
+                write(chunk)
+    except:
+        connection.close()
+        raise
+
+    if response.will_close:
+        connection.close()
+    else:
+        connections.release(url.scheme, url.netloc, connection)
+
+    if response.status in (301, 302, 303, 307, 308) and location and redirects > 0:
+        return httpGet(urllib.parse.urljoin(url.geturl(), location), write, redirects - 1)
+
+    return data
 
 # ==== Opensubtitles.org XML-RPC server= =======================================
 
-osd_server = ServerProxy('http://api.opensubtitles.org/xml-rpc')
+osd_server_url = 'http://api.opensubtitles.org/xml-rpc'
+osd_server = newServerProxy()
 osd_username = ""
 osd_password = ""
 
@@ -77,11 +221,35 @@ opt_display_match = "off"
 opt_display_hi = "off"
 opt_display_rating = "off"
 opt_display_count = "off"
+opt_batch_workers = 4
+opt_search_batch = 10
+opt_hash_cache_size = 100000
+opt_hash_workers_rotational = 1
+opt_search_cache_ttl = 24
+opt_search_cache_size = 10000
+opt_http_pool_size = 8
+opt_http_idle_timeout = 30
+opt_http_timeout = 30
+opt_watch_interval = 60
+opt_watch_settle = 10
+opt_download_limit = 200
+opt_download_reserve = 20
+opt_search_rate = 2
+opt_search_burst = 19
+opt_store_size = 50
+opt_store_path = ""
 
 opt_byname = "on" # DEPRECATED
 
 def readSettings():
     """Read settings from file, or initialize them"""
+    global osd_username, osd_password, opt_search_overwrite, opt_search_mode, opt_selection_mode, \
+           opt_language_suffix, opt_language_separator, opt_display_language, opt_display_match, \
+           opt_display_hi, opt_display_rating, opt_display_count, opt_batch_workers, opt_search_batch, \
+           opt_hash_cache_size, opt_hash_workers_rotational, opt_search_cache_ttl, opt_search_cache_size, \
+           opt_http_pool_size, opt_http_idle_timeout, opt_http_timeout, opt_watch_interval, opt_watch_settle, \
+           opt_download_limit, opt_download_reserve, opt_search_rate, opt_search_burst, opt_store_size, \
+           opt_store_path
 
     # Get options from config file, if it exists
     if os.path.isfile(confpath):
@@ -108,6 +276,23 @@ def readSettings():
             opt_display_hi = confparser.get('gui', 'opt_display_hi')
             opt_display_rating = confparser.get('gui', 'opt_display_rating')
             opt_display_count = confparser.get('gui', 'opt_display_count')
+            opt_batch_workers = confparser.getint('settings', 'opt_batch_workers', fallback=opt_batch_workers)
+            opt_search_batch = confparser.getint('settings', 'opt_search_batch', fallback=opt_search_batch)
+            opt_hash_cache_size = confparser.getint('settings', 'opt_hash_cache_size', fallback=opt_hash_cache_size)
+            opt_hash_workers_rotational = confparser.getint('settings', 'opt_hash_workers_rotational', fallback=opt_hash_workers_rotational)
+            opt_search_cache_ttl = confparser.getfloat('settings', 'opt_search_cache_ttl', fallback=opt_search_cache_ttl)
+            opt_search_cache_size = confparser.getint('settings', 'opt_search_cache_size', fallback=opt_search_cache_size)
+            opt_http_pool_size = confparser.getint('settings', 'opt_http_pool_size', fallback=opt_http_pool_size)
+            opt_http_idle_timeout = confparser.getfloat('settings', 'opt_http_idle_timeout', fallback=opt_http_idle_timeout)
+            opt_http_timeout = confparser.getfloat('settings', 'opt_http_timeout', fallback=opt_http_timeout)
+            opt_watch_interval = confparser.getfloat('settings', 'opt_watch_interval', fallback=opt_watch_interval)
+            opt_watch_settle = confparser.getfloat('settings', 'opt_watch_settle', fallback=opt_watch_settle)
+            opt_download_limit = confparser.getint('settings', 'opt_download_limit', fallback=opt_download_limit)
+            opt_download_reserve = confparser.getint('settings', 'opt_download_reserve', fallback=opt_download_reserve)
+            opt_search_rate = confparser.getfloat('settings', 'opt_search_rate', fallback=opt_search_rate)
+            opt_search_burst = confparser.getint('settings', 'opt_search_burst', fallback=opt_search_burst)
+            opt_store_size = confparser.getfloat('settings', 'opt_store_size', fallback=opt_store_size)
+            opt_store_path = confparser.get('settings', 'opt_store_path', fallback=opt_store_path)
 
             return True
 
@@ -136,6 +321,23 @@ def saveSettings():
     confparser.set('settings', 'opt_selection_mode', str(opt_selection_mode))
     confparser.set('settings', 'opt_language_suffix', str(opt_language_suffix))
     confparser.set('settings', 'opt_language_separator', str(opt_language_separator))
+    confparser.set('settings', 'opt_batch_workers', str(opt_batch_workers))
+    confparser.set('settings', 'opt_search_batch', str(opt_search_batch))
+    confparser.set('settings', 'opt_hash_cache_size', str(opt_hash_cache_size))
+    confparser.set('settings', 'opt_hash_workers_rotational', str(opt_hash_workers_rotational))
+    confparser.set('settings', 'opt_search_cache_ttl', str(opt_search_cache_ttl))
+    confparser.set('settings', 'opt_search_cache_size', str(opt_search_cache_size))
+    confparser.set('settings', 'opt_http_pool_size', str(opt_http_pool_size))
+    confparser.set('settings', 'opt_http_idle_timeout', str(opt_http_idle_timeout))
+    confparser.set('settings', 'opt_http_timeout', str(opt_http_timeout))
+    confparser.set('settings', 'opt_watch_interval', str(opt_watch_interval))
+    confparser.set('settings', 'opt_watch_settle', str(opt_watch_settle))
+    confparser.set('settings', 'opt_download_limit', str(opt_download_limit))
+    confparser.set('settings', 'opt_download_reserve', str(opt_download_reserve))
+    confparser.set('settings', 'opt_search_rate', str(opt_search_rate))
+    confparser.set('settings', 'opt_search_burst', str(opt_search_burst))
+    confparser.set('settings', 'opt_store_size', str(opt_store_size))
+    confparser.set('settings', 'opt_store_path', str(opt_store_path))
 
     confparser.add_section('gui')
     confparser.set('gui', 'opt_display_language', str(opt_display_language))
@@ -155,8 +357,20 @@ def saveSettings():
 # title: box title
 # message: full text, with tags and breaks
 
+superPrintQueue = [] # (priority, title, message) printed by the batch workers, for the main thread
+superPrintLock = threading.Lock()
+
 def superPrint(priority, title, message):
-    """Print messages through Qt QMessageBox"""
+    """Print messages through Qt QMessageBox (or stderr in headless mode)"""
+    if headless or threading.current_thread() is not threading.main_thread():
+        # Qt widgets can only be used from the main thread, batch workers print to stderr
+        # (and queue their messages for superPrintQueued() with the GUI)
+        print(title + " " + re.sub('<[^>]*>', '', message).replace("\n", " "), file=sys.stderr)
+        if not headless:
+            with superPrintLock:
+                superPrintQueue.append((priority, title, message))
+        return
+    loadQt()
     message = message.replace("\n", "<br>")
     alert = QtWidgets.QMessageBox()
     alert.setWindowTitle(title)
@@ -164,86 +378,450 @@ def superPrint(priority, title, message):
     alert.setText(message)
     alert.exec_()
 
+def superPrintQueued():
+    """Show the messages queued by the batch workers in a single message box (main thread only).
+    Return True if there was any"""
+    with superPrintLock:
+        messages = superPrintQueue[:]
+        del superPrintQueue[:]
+    if not messages:
+        return False
+
+    errors = [item for item in messages if item[0] == 'error'] or messages
+    priority, title = errors[0][0], errors[0][1]
+    superPrint(priority, title, "\n\n".join(item[2] for item in errors[:10]) + \
+               ("\n\n... and " + str(len(errors) - 10) + " more" if len(errors) > 10 else ""))
+    return True
+
+# ==== Metrics =================================================================
+# With --metrics, each stage (session, hash, search, select, download) writes a
+# JSON line with its wall time, the bytes read from disk or received from the
+# network, its retries and cache hits: one line per video (or per search call).
+# A summary of every stage is written at the end of the run. When metrics are
+# off, each stage only checks metricsFile.
+
+metricsFile = None
+metricsLock = threading.Lock()
+metricsLocal = threading.local() # bytes received and retries of the current stage, per thread
+metricsTotals = {} # stage -> totals of all its lines
+metricsOpened = 0
+
+def openMetrics(path):
+    """Write the metrics into a file (appended), or on stderr if path is '-'
+    (stdout is used by the exit code of each video)"""
+    global metricsFile, metricsOpened
+    metricsFile = sys.stderr if path == '-' else open(path, 'a')
+    metricsOpened = time.perf_counter()
+
+def closeMetrics(**fields):
+    """Write the summary of every stage, then close the metrics file"""
+    global metricsFile
+    if metricsFile is None:
+        return
+    with metricsLock:
+        fields['stage'] = 'summary'
+        fields['seconds'] = round(time.perf_counter() - metricsOpened, 6)
+        fields['stages'] = metricsTotals
+        metricsFile.write(json.dumps(fields) + "\n")
+        if metricsFile is sys.stderr:
+            metricsFile.flush()
+        else:
+            metricsFile.close()
+        metricsFile = None
+
+def metricsStart():
+    """Start measuring a stage on this thread, return its start time"""
+    if metricsFile is None:
+        return 0
+    metricsLocal.bytesReceived = 0
+    metricsLocal.retries = 0
+    return time.perf_counter()
+
+def metricsCount(name, value=1):
+    """Count bytes received (bytesReceived) or retries for the current stage of this thread"""
+    if metricsFile is not None:
+        setattr(metricsLocal, name, getattr(metricsLocal, name, 0) + value)
+
+def metricsStage(stage, start, **fields):
+    """Write the line of a stage started by metricsStart() on this thread (with extra fields)"""
+    if metricsFile is None:
+        return
+    fields['stage'] = stage
+    fields['seconds'] = round(time.perf_counter() - start, 6)
+    for name in ('bytesReceived', 'retries'):
+        if getattr(metricsLocal, name, 0):
+            fields[name] = fields.get(name, 0) + getattr(metricsLocal, name)
+
+    with metricsLock:
+        if metricsFile is None:
+            return
+        totals = metricsTotals.setdefault(stage, {'count': 0, 'seconds': 0})
+        totals['count'] += 1
+        for name, value in fields.items():
+            if name in ('seconds', 'bytesRead', 'bytesReceived', 'retries', 'queries', 'cacheHits'):
+                totals[name] = round(totals.get(name, 0) + value, 6)
+            elif value is True:
+                totals[name] = totals.get(name, 0) + 1
+        metricsFile.write(json.dumps(fields) + "\n")
+
 # ==== Check file path & type ==================================================
 
+videoExtensions = frozenset(['avi', 'mp4', 'mov', 'mkv', 'mk3d', 'webm', \
+                             'ts', 'mts', 'm2ts', 'ps', 'vob', 'evo', 'mpeg', 'mpg', \
+                             'm1v', 'm2p', 'm2v', 'm4v', 'movhd', 'movx', 'qt', \
+                             'mxf', 'ogg', 'ogm', 'ogv', 'rm', 'rmvb', 'flv', 'swf', \
+                             'asf', 'wm', 'wmv', 'wmx', 'divx', 'x264', 'xvid'])
+
+def checkFileName(name):
+    """Check file extension and/or mimetype to detect valid video file name"""
+    if '.' in name and name.rsplit('.', 1)[1].lower() in videoExtensions:
+        return True
+
+    fileMimeType, encoding = mimetypes.guess_type(name)
+    if fileMimeType is None or fileMimeType.split('/', 1)[0] != 'video':
+        #superPrint("error", "File type error!", "This file is not a video (unknown mimetype AND invalid file extension):\n<i>" + name + "</i>")
+        return False
+
+    return True
+
 def checkFileValidity(path):
     """Check mimetype and/or file extension to detect valid video file"""
     if os.path.isfile(path) is False:
         return False
 
-    fileMimeType, encoding = mimetypes.guess_type(path)
-    if fileMimeType is None:
-        fileExtension = path.rsplit('.', 1)
-        if fileExtension[1] not in ['avi', 'mp4', 'mov', 'mkv', 'mk3d', 'webm', \
-                                    'ts', 'mts', 'm2ts', 'ps', 'vob', 'evo', 'mpeg', 'mpg', \
-                                    'm1v', 'm2p', 'm2v', 'm4v', 'movhd', 'movx', 'qt', \
-                                    'mxf', 'ogg', 'ogm', 'ogv', 'rm', 'rmvb', 'flv', 'swf', \
-                                    'asf', 'wm', 'wmv', 'wmx', 'divx', 'x264', 'xvid']:
-            #superPrint("error", "File type error!", "This file is not a video (unknown mimetype AND invalid file extension):\n<i>" + path + "</i>")
-            return False
-    else:
-        fileMimeType = fileMimeType.split('/', 1)
-        if fileMimeType[0] != 'video':
-            #superPrint("error", "File type error!", "This file is not a video (unknown mimetype):\n<i>" + path + "</i>")
-            return False
-
-    return True
+    return checkFileName(os.path.basename(path))
+
+def scanVideos(paths, depth=-1, include=None, exclude=None):
+    """Lazily yield the valid video paths from a list of files and directories.
+    Directories are scanned recursively (up to depth levels of subdirectories,
+    or without limit if depth < 0), keeping the files whose name match one of
+    the include globs (if any) and none of the exclude globs.
+    The path '-' reads more paths from stdin, see readVideoPaths()"""
+    for path in paths:
+        if path == '-':
+            for videoPath in scanVideos(readVideoPaths(sys.stdin), depth, include, exclude):
+                yield videoPath
+            continue
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            for videoPath in scanDirectory(path, depth, include, exclude):
+                yield videoPath
+        elif checkFileValidity(path):
+            yield path
+
+def scanDirectory(path, depth, include, exclude):
+    """Lazily yield the valid video paths of a directory tree, see scanVideos()"""
+    directories = [(path, 0)]
+    while directories:
+        directory, level = directories.pop()
+        try:
+            with os.scandir(directory) as iterator:
+                entries = sorted(iterator, key=lambda entry: entry.name)
+        except OSError:
+            continue # Unreadable directory
+
+        subdirectories = []
+        for entry in entries:
+            if exclude and any(fnmatch.fnmatch(entry.name, pattern) for pattern in exclude):
+                continue
+            try:
+                # Reuse the file type cached by scandir, and don't follow symlinks to directories (loops)
+                if entry.is_dir(follow_symlinks=False):
+                    if depth < 0 or level < depth:
+                        subdirectories.append((entry.path, level + 1))
+                elif entry.is_file() and checkFileName(entry.name):
+                    if not include or any(fnmatch.fnmatch(entry.name, pattern) for pattern in include):
+                        yield entry.path
+            except OSError:
+                continue
+
+        # Depth first, in alphabetical order
+        directories.extend(reversed(subdirectories))
 
 # ==== Check for existing subtitles file =======================================
+# Each directory is listed once, into an index of the subtitles files it contains,
+# made of (file name without extension and language code, language code) tuples.
+# Language codes are matched in both ISO 639-2 (configured languages) and ISO 639-1
+# (suffix of the downloaded subtitles) forms, after any usual separator.
+
+subtitlesExtensions = frozenset(['srt', 'sub', 'sbv', 'smi', 'ssa', 'ass', 'usf'])
+
+subtitlesLanguageCodes = {'ara':'ar', 'ben':'bn', 'nld':'nl', 'dut':'nl', 'eng':'en', 'fre':'fr', 'ger':'de',
+                          'hin':'hi', 'ind':'id', 'ita':'it', 'jpn':'ja', 'kor':'ko', 'per':'fa', 'por':'pt',
+                          'rus':'ru', 'spa':'es', 'swa':'sw', 'tur':'tr', 'vie':'vi', 'chi':'zh'}
+
+subtitlesIndexes = collections.OrderedDict() # Indexes of the last listed directories
+
+def indexSubtitles(directory):
+    """List the subtitles files of a directory (once), return its index"""
+    if directory in subtitlesIndexes:
+        subtitlesIndexes.move_to_end(directory)
+        return subtitlesIndexes[directory]
+
+    try:
+        index = indexSubtitlesNames(os.listdir(directory))
+    except OSError:
+        index = set()
+
+    # The videos are scanned directory by directory, no need to keep many indexes
+    subtitlesIndexes[directory] = index
+    if len(subtitlesIndexes) > 64:
+        subtitlesIndexes.popitem(last=False)
+
+    return index
+
+def indexSubtitlesNames(names):
+    """Build the index of the subtitles files of a directory, from its file names"""
+    index = set()
+    separators = set(separator for separator in ['_', '-', '.', opt_language_separator] if separator)
+
+    for name in names:
+        if '.' not in name:
+            continue
+        stem, extension = name.rsplit('.', 1)
+        if extension.lower() not in subtitlesExtensions:
+            continue
+        index.add((stem, ''))
+        for separator in separators:
+            if separator in stem:
+                prefix, code = stem.rsplit(separator, 1)
+                index.add((prefix, code.lower()))
+
+    return index
 
 def checkSubtitlesExists(path):
-    """Check if a subtitles already exists for the current file"""
+    """Check if a subtitles already exists for the current file (in any of the configured languages)"""
+    index = indexSubtitles(os.path.dirname(path))
+    stem = os.path.basename(path).rsplit('.', 1)[0]
 
-    for ext in ['srt', 'sub', 'sbv', 'smi', 'ssa', 'ass', 'usf']:
-        subPath = path.rsplit('.', 1)[0] + '.' + ext
-        if os.path.isfile(subPath) is True:
-            superPrint("info", "Subtitles already downloaded!", "A subtitles file already exists for this file:\n<i>" + subPath + "</i>")
-            return True
-        # With language code? Only check the first language (and probably using the wrong language suffix format)
-        if opt_language_suffix in ('on', 'auto'):
-            if len(opt_languages) == 1:
-                splitted_languages_list = opt_languages[0].split(',')
-            else:
-                splitted_languages_list = opt_languages
-            subPath = path.rsplit('.', 1)[0] + opt_language_separator + splitted_languages_list[0] + '.' + ext
-            if os.path.isfile(subPath) is True:
-                superPrint("info", "Subtitles already downloaded!", "A subtitles file already exists for this file:\n<i>" + subPath + "</i>")
-                return True
+    if (stem, '') in index:
+        return True
+
+    # With language code?
+    if opt_language_suffix in ('on', 'auto'):
+        for languages in opt_languages:
+            for language in languages.split(','):
+                if language and ((stem, language.lower()) in index or
+                                 (stem, subtitlesLanguageCodes.get(language.lower())) in index):
+                    return True
 
     return False
 
+def skipSubtitlesExists(videoPaths, skippedList):
+    """Lazily filter out the videos that already have subtitles (except the languages
+    missing in an audit report), and add them to skippedList"""
+    for videoPath in videoPaths:
+        if videoPath not in pipedLanguages and checkSubtitlesExists(videoPath):
+            skippedList.append(videoPath)
+        else:
+            yield videoPath
+
+# ==== Library audit ===========================================================
+# With --audit, the directory trees are checked for the videos missing subtitles
+# in each configured language (as ranked by getLanguageRanks()), without any network
+# access. The directories are listed once each, by a pool of worker threads, and
+# the subtitles files are matched with the index used to skip the videos that
+# already have subtitles: a language code after any usual separator, or no code.
+#
+# The download path only writes a subtitles file without language code for the
+# first language found (or for every language if opt_language_suffix is off), so
+# such a file only covers the first language (or every language).
+#
+# The report is printed on stdout, as CSV (one row per video) or JSON (coverage
+# of each language, and the videos missing its subtitles). It can be piped into
+# a download run using '-' as path, see readVideoPaths(): only the languages
+# missing for each video are searched, with a language code in the file name.
+
+pipedLanguages = {} # video path -> languages missing in the audit report read by readVideoPaths()
+
+def subtitlesLanguages(videoPath, index):
+    """Check which configured languages have a subtitles file for a video, using the
+    index of its directory. Return a list of booleans, one per language of getLanguageRanks()"""
+    stem = os.path.basename(subtitlesRoot(videoPath))
+    untagged = (stem, '') in index
+    coverage = []
+    for rank, language in enumerate(getLanguageRanks()):
+        coverage.append((untagged and (rank == 0 or opt_language_suffix == 'off')) or
+                        (stem, language.lower()) in index or
+                        (stem, subtitlesLanguageCodes.get(language.lower())) in index)
+    return coverage
+
+def auditDirectory(directory, level, depth, include, exclude):
+    """List a directory (see scanDirectory()), return the coverage of its videos and its subdirectories"""
+    try:
+        with os.scandir(directory) as iterator:
+            entries = list(iterator)
+    except OSError:
+        return [], [] # Unreadable directory
+
+    videoPaths = []
+    subdirectories = []
+    for entry in entries:
+        if exclude and any(fnmatch.fnmatch(entry.name, pattern) for pattern in exclude):
+            continue
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                if depth < 0 or level < depth:
+                    subdirectories.append((entry.path, level + 1))
+            elif entry.is_file() and checkFileName(entry.name):
+                if not include or any(fnmatch.fnmatch(entry.name, pattern) for pattern in include):
+                    videoPaths.append(entry.path)
+        except OSError:
+            continue
+
+    if not videoPaths:
+        return [], subdirectories
+    index = indexSubtitlesNames(entry.name for entry in entries)
+    return [(videoPath, subtitlesLanguages(videoPath, index)) for videoPath in videoPaths], subdirectories
+
+def auditVideos(paths, depth=-1, include=None, exclude=None, workers=1):
+    """Check the subtitles files of the videos of a list of files and directories (see scanVideos()),
+    the directories being listed concurrently. Return a list of (path, coverage), sorted by path"""
+    results = []
+    pending = set()
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        for path in paths:
+            path = os.path.abspath(path)
+            if os.path.isdir(path):
+                pending.add(pool.submit(auditDirectory, path, 0, depth, include, exclude))
+            elif checkFileValidity(path):
+                results.append((path, subtitlesLanguages(path, indexSubtitles(os.path.dirname(path)))))
+
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                videos, subdirectories = future.result()
+                results.extend(videos)
+                for subdirectory, level in subdirectories:
+                    pending.add(pool.submit(auditDirectory, subdirectory, level, depth, include, exclude))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    results.sort()
+    return results
+
+def printAudit(results, format):
+    """Print the report of an audit, as 'csv' or 'json'.
+    Return 0 if every video has subtitles in every language, 1 otherwise"""
+    languages = list(getLanguageRanks())
+    missing = [[path for path, coverage in results if not coverage[rank]] for rank in range(len(languages))]
+    summary = {}
+    for language, paths in zip(languages, missing):
+        summary[language] = {'subtitles': len(results) - len(paths), 'missing': len(paths),
+                             'coverage': round((len(results) - len(paths)) / len(results), 4) if results else 0}
+
+    if format == 'json':
+        json.dump({'videos': len(results), 'languages': summary, 'missing': dict(zip(languages, missing))}, sys.stdout, indent=1)
+        print()
+    else:
+        writer = csv.writer(sys.stdout, lineterminator='\n')
+        writer.writerow(['path'] + languages)
+        for path, coverage in results:
+            writer.writerow([path] + [int(covered) for covered in coverage])
+        superPrint("info", "Subtitles audit", "<b>" + str(len(results)) + "</b> videos.\n" + \
+                   "\n".join("<b>" + language + "</b>: " + str(counts['subtitles']) + " with subtitles, " + str(counts['missing']) + " missing"
+                             for language, counts in summary.items()))
+
+    return 0 if results and not any(missing) else 1
+
+def readVideoPaths(stream):
+    """Lazily yield the paths read from a stream: the videos missing subtitles in an
+    audit report (CSV or JSON, their missing languages are kept in pipedLanguages),
+    or one path per line"""
+    first = stream.readline()
+    if first.startswith('{'):
+        report = json.loads(first + stream.read())
+        for language, paths in report['missing'].items():
+            for path in paths:
+                pipedLanguages.setdefault(os.path.abspath(path), []).append(language)
+        for path in sorted(set(itertools.chain.from_iterable(report['missing'].values()))):
+            yield path
+    elif first.startswith('path,'):
+        languages = next(csv.reader([first]))[1:]
+        for row in csv.reader(stream):
+            if '0' in row[1:]:
+                pipedLanguages[os.path.abspath(row[0])] = [language for language, covered in zip(languages, row[1:]) if covered == '0']
+                yield row[0]
+    else:
+        for line in itertools.chain([first], stream):
+            if line.rstrip('\r\n'):
+                yield line.rstrip('\r\n')
+
 # ==== Hashing algorithm =======================================================
 # Info: http://trac.opensubtitles.org/projects/opensubtitles/wiki/HashSourceCodes
 # This particular implementation is coming from SubDownloader: http://subdownloader.net
+# (reworked to use positional reads and to sum the 64bit words in bulk, see benchmarks/hash_benchmark.py)
+
+hashBuffers = threading.local()
+
+# NumPy (if available) sums the 64bit words about 60 times faster: it is loaded by
+# the first hash (not at startup), otherwise the words are unpacked with struct
+numpy = None
+numpyLoaded = False
+numpyLock = threading.Lock()
+
+def hashBlock(fd, offset):
+    """Produce the 64bit chksum of the 64k block starting at offset, read with
+    positional reads into a reused (per thread) buffer"""
+    global numpy, numpyLoaded
+    if not hasattr(hashBuffers, 'buffer'):
+        hashBuffers.buffer = bytearray(65536)
+    buffer = memoryview(hashBuffers.buffer)
+
+    count = 0
+    while count < 65536:
+        if hasattr(os, 'preadv'):
+            read = os.preadv(fd, [buffer[count:]], offset + count)
+        else:
+            # No positional reads available (ex: Windows)
+            os.lseek(fd, offset + count, os.SEEK_SET)
+            data = os.read(fd, 65536 - count)
+            read = len(data)
+            buffer[count:count + read] = data
+        if read == 0:
+            raise IOError("Unexpected end of file")
+        count += read
+
+    if not numpyLoaded:
+        with numpyLock:
+            if not numpyLoaded:
+                try:
+                    import numpy
+                except ImportError:
+                    pass
+                numpyLoaded = True
+
+    if numpy is not None:
+        return int(numpy.frombuffer(buffer, dtype='<u8').sum(dtype=numpy.uint64)) # wraps around 2^64, just like the hash
+    return sum(struct.unpack('<8192Q', buffer)) # unsigned long long little endian
 
 def hashFile(path):
     """Produce a hash for a video file: size + 64bit chksum of the first and
     last 64k (even if they overlap because the file is smaller than 128k)"""
     try:
-        longlongformat = 'Q' # unsigned long long little endian
-        bytesize = struct.calcsize(longlongformat)
-        format = "<%d%s" % (65536//bytesize, longlongformat)
-
-        f = open(path, "rb")
-
-        filesize = os.fstat(f.fileno()).st_size
-        hash = filesize
-
-        if filesize < 65536 * 2:
-            superPrint("error", "File size error!", "File size error while generating hash for this file:\n<i>" + path + "</i>")
-            return "SizeError"
-
-        buffer = f.read(65536)
-        longlongs = struct.unpack(format, buffer)
-        hash += sum(longlongs)
-
-        f.seek(-65536, os.SEEK_END) # size is always > 131072
-        buffer = f.read(65536)
-        longlongs = struct.unpack(format, buffer)
-        hash += sum(longlongs)
-        hash &= 0xFFFFFFFFFFFFFFFF
+        fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+        try:
+            filesize = os.fstat(fd).st_size
+            hash = filesize
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_NOREUSE)
+
+            if filesize < 65536 * 2:
+                superPrint("error", "File size error!", "File size error while generating hash for this file:\n<i>" + path + "</i>")
+                return "SizeError"
+
+            hash += hashBlock(fd, 0)
+            hash += hashBlock(fd, filesize - 65536) # size is always > 131072
+            hash &= 0xFFFFFFFFFFFFFFFF
+
+            # We won't read these blocks again, don't keep them in the page cache
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, 65536, os.POSIX_FADV_DONTNEED)
+                os.posix_fadvise(fd, filesize - 65536, 65536, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
 
-        f.close()
         returnedhash = "%016x" % hash
         return returnedhash
 
@@ -251,37 +829,419 @@ def hashFile(path):
         superPrint("error", "I/O error!", "Input/Output error while generating hash for this file:\n<i>" + path + "</i>")
         return "IOError"
 
+# ==== Local cache =============================================================
+# Hashes and search results are stored in a SQLite database next to the config
+# file (the cache is skipped if the sqlite3 module is not available).
+#
+# Hashes are keyed by the device and inode of the video. A cached hash is only
+# used if the size and modification time of the video did not change, so we
+# don't even open the file. The least recently used hashes are evicted above
+# opt_hash_cache_size entries.
+#
+# Search results are keyed by query (hash + size or filename, and languages)
+# and only keep the fields we use. They expire after opt_search_cache_ttl hours,
+# and the least recently used are evicted above opt_search_cache_size entries.
+#
+# The requests of the last 24 hours, and the downloads queued for the next runs
+# (for a week at most), are also kept here, see the download quota. So are the
+# journals of the batches (for a week at most), see the job journal.
+
+cachepath = ""
+localCache = None
+localCacheLock = threading.Lock()
+localCacheWrites = 0
+localCacheRefresh = False # Ignore cached search results (but still update them)
+
+searchCacheFields = ('IDSubtitleFile', 'SubFileName', 'SubFormat', 'SubDownloadLink', 'SubSize',
+                     'SubLanguageID', 'ISO639', 'LanguageName', 'MovieName', 'MatchedBy',
+                     'SubHearingImpaired', 'SubRating', 'SubDownloadsCnt', 'SubHash')
+
+def openCache():
+    """Open (or create) the local cache database"""
+    global localCache
+    if sqlite3 is None or not cachepath:
+        return False
+    try:
+        localCache = sqlite3.connect(cachepath, check_same_thread=False)
+        localCache.execute("CREATE TABLE IF NOT EXISTS hashes (device INTEGER, inode INTEGER, size INTEGER, mtime INTEGER, hash TEXT, used REAL, PRIMARY KEY (device, inode))")
+        localCache.execute("CREATE INDEX IF NOT EXISTS hashes_used ON hashes (used)")
+        localCache.execute("CREATE TABLE IF NOT EXISTS searches (query TEXT PRIMARY KEY, data TEXT, created REAL, used REAL)")
+        localCache.execute("CREATE INDEX IF NOT EXISTS searches_used ON searches (used)")
+        localCache.execute("CREATE TABLE IF NOT EXISTS requests (username TEXT, kind TEXT, time REAL)")
+        localCache.execute("CREATE INDEX IF NOT EXISTS requests_time ON requests (username, time)")
+        localCache.execute("CREATE TABLE IF NOT EXISTS queue (username TEXT, path TEXT, url TEXT, subPath TEXT PRIMARY KEY, size INTEGER, language INTEGER, created REAL)")
+        localCache.execute("CREATE TABLE IF NOT EXISTS journal (job TEXT, path TEXT, stage TEXT, size INTEGER, mtime INTEGER, hash TEXT, data TEXT, exitCode INTEGER, reason TEXT, updated REAL, PRIMARY KEY (job, path))")
+        return True
+    except sqlite3.Error:
+        localCache = None
+        return False
+
+def closeCache():
+    """Evict the least recently used entries, then save and close the local cache database"""
+    global localCache
+    if localCache is None:
+        return
+    with localCacheLock:
+        try:
+            localCache.execute("DELETE FROM hashes WHERE rowid NOT IN (SELECT rowid FROM hashes ORDER BY used DESC LIMIT ?)", (max(0, opt_hash_cache_size),))
+            localCache.execute("DELETE FROM searches WHERE created < ?", (time.time() - opt_search_cache_ttl * 3600,))
+            localCache.execute("DELETE FROM searches WHERE rowid NOT IN (SELECT rowid FROM searches ORDER BY used DESC LIMIT ?)", (max(0, opt_search_cache_size),))
+            localCache.execute("DELETE FROM requests WHERE time < ?", (time.time() - 86400,))
+            localCache.execute("DELETE FROM queue WHERE created < ?", (time.time() - 7 * 86400,))
+            localCache.execute("DELETE FROM journal WHERE updated < ?", (time.time() - 7 * 86400,))
+            localCache.commit()
+            localCache.close()
+        except sqlite3.Error:
+            pass
+        localCache = None
+
+def commitCache():
+    """Save the local cache database, without closing it (long running instances)"""
+    if localCache is None:
+        return
+    with localCacheLock:
+        try:
+            localCache.commit()
+        except sqlite3.Error:
+            pass
+
+def writeCache(statement, parameters):
+    """Write into the local cache (the caller must hold localCacheLock)"""
+    global localCacheWrites
+    try:
+        localCache.execute(statement, parameters)
+        # Do not lose every new entry if the batch is interrupted
+        localCacheWrites += 1
+        if localCacheWrites % 100 == 0:
+            localCache.commit()
+    except sqlite3.Error:
+        pass
+
+def getCachedHash(st):
+    """Get the cached hash of a video file, or None if there is no (valid) cached hash"""
+    with localCacheLock:
+        try:
+            row = localCache.execute("SELECT hash FROM hashes WHERE device=? AND inode=? AND size=? AND mtime=?",
+                                     (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)).fetchone()
+            if row:
+                localCache.execute("UPDATE hashes SET used=? WHERE device=? AND inode=?", (time.time(), st.st_dev, st.st_ino))
+                return row[0]
+        except sqlite3.Error:
+            pass
+
+    return None
+
+def putCachedHash(st, hash):
+    """Save the hash of a video file into the local cache"""
+    with localCacheLock:
+        writeCache("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)",
+                   (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, hash, time.time()))
+
+def hashFileCached(path, st=None):
+    """Get the hash of a video file from the local cache, or produce it (and cache it)"""
+    start = metricsStart()
+    useCache = localCache is not None and opt_hash_cache_size > 0
+
+    if useCache:
+        if st is None:
+            st = os.stat(path)
+        hash = getCachedHash(st)
+        if hash is not None:
+            metricsStage('hash', start, path=path, cacheHit=True)
+            return hash
+
+    hash = hashFile(path)
+    if hash in ('SizeError', 'IOError'):
+        metricsStage('hash', start, path=path, cacheHit=False, error=hash)
+        return hash
+
+    if useCache:
+        putCachedHash(st, hash)
+    metricsStage('hash', start, path=path, cacheHit=False, bytesRead=65536 * 2)
+
+    return hash
+
+def searchCacheKey(query):
+    """Get the local cache key of a search query, or None if it must not be cached"""
+    if 'moviehash' in query:
+        if query['moviehash'] in ('SizeError', 'IOError'):
+            return None
+        return "hash:" + query['moviehash'] + ":" + query['moviebytesize'] + ":" + query['sublanguageid']
+    return "query:" + query['query'] + ":" + query['sublanguageid']
+
+def getCachedSearch(query):
+    """Get the cached results of a search query, or None if there is no (valid) cached results"""
+    key = searchCacheKey(query)
+    if localCache is None or localCacheRefresh or opt_search_cache_size <= 0 or key is None:
+        return None
+
+    with localCacheLock:
+        try:
+            row = localCache.execute("SELECT data FROM searches WHERE query=? AND created>=?",
+                                     (key, time.time() - opt_search_cache_ttl * 3600)).fetchone()
+            if row:
+                localCache.execute("UPDATE searches SET used=? WHERE query=?", (time.time(), key))
+                return {'data': json.loads(row[0]) or False}
+        except (sqlite3.Error, ValueError):
+            pass
+
+    return None
+
+def putCachedSearch(query, subtitlesList):
+    """Save the results of a search query into the local cache, keeping only the fields we use"""
+    key = searchCacheKey(query)
+    if localCache is None or opt_search_cache_size <= 0 or key is None:
+        return
+
+    data = [{field: subtitle[field] for field in searchCacheFields if field in subtitle}
+            for subtitle in subtitlesList['data'] or []]
+    with localCacheLock:
+        writeCache("INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?)",
+                   (key, json.dumps(data), time.time(), time.time()))
+
+# ==== Job journal =============================================================
+# The stage reached by each video of a batch (scanned, hashed, searched, selected,
+# downloaded, or failed with its reason) is written into the local cache, so that
+# a batch interrupted by a network drop, the download limit or a reboot can be
+# resumed with --resume: the videos that are done are skipped, the others start
+# again from the stage they reached, without being hashed nor searched again.
+#
+# A job is identified by its arguments (paths, filters and languages), its journal
+# is cleared when it is run again without --resume. A journal entry is only used
+# if the size and modification time of the video did not change. The journal
+# writes are committed with the other cache writes, by groups of 100.
+
+journalJob = None # key of the job of this run, None if the journal is not used
+journalEntries = {} # path -> journal entry of the job, when resumed
+
+def journalKey(paths, depth, include, exclude):
+    """Key of the job processing these arguments (with the paths read from stdin in place of '-')"""
+    arguments = [sorted(os.path.abspath(path) for path in paths), depth, include, exclude, opt_languages]
+    if pipedLanguages:
+        arguments.append(sorted(pipedLanguages.items()))
+    return hashlib.md5(json.dumps(arguments).encode()).hexdigest()
+
+def openJournal(job, resume):
+    """Use the journal of a job (the local cache must be open), cleared unless the job is resumed.
+    Return the number of videos found in the journal"""
+    global journalJob
+    if localCache is None:
+        return 0
+    with localCacheLock:
+        try:
+            if resume:
+                for path, stage, size, mtime, hash, data, exitCode in localCache.execute(
+                        "SELECT path, stage, size, mtime, hash, data, exitCode FROM journal WHERE job=?", (job,)):
+                    journalEntries[path] = {'stage': stage, 'size': size, 'mtime': mtime, 'hash': hash,
+                                            'selected': json.loads(data) if data else None, 'exitCode': exitCode}
+            else:
+                localCache.execute("DELETE FROM journal WHERE job=?", (job,))
+        except (sqlite3.Error, ValueError):
+            return 0
+    journalJob = job
+    return len(journalEntries)
+
+def journalEntry(path, st):
+    """Get (and forget) the journal entry of a video, or None if there is no (valid) entry"""
+    entry = journalEntries.pop(path, None)
+    if entry and entry['size'] == st.st_size and entry['mtime'] == st.st_mtime_ns:
+        return entry
+    return None
+
+def journalScanned(path, st):
+    """Start the journal entry of a video"""
+    if journalJob is None:
+        return
+    with localCacheLock:
+        if localCache is not None:
+            writeCache("INSERT OR REPLACE INTO journal VALUES (?, ?, 'scanned', ?, ?, NULL, NULL, NULL, NULL, ?)",
+                       (journalJob, path, st.st_size, st.st_mtime_ns, time.time()))
+
+def journalStage(path, stage, hash=None, selected=None, exitCode=None, reason=None):
+    """Write the stage reached by a video into the journal (its hash and selected subtitles are kept)"""
+    if journalJob is None:
+        return
+    with localCacheLock:
+        if localCache is not None:
+            writeCache("UPDATE journal SET stage=?, hash=COALESCE(?, hash), data=COALESCE(?, data), exitCode=?, reason=?, updated=? WHERE job=? AND path=?",
+                       (stage, hash, json.dumps(selected) if selected else None, exitCode, reason, time.time(), journalJob, path))
+
+def journalDone(path, exitCode, reason=None):
+    """Write the exit code of a video into the journal: done (0 or 1), or failed (2) and why"""
+    journalStage(path, ('downloaded', 'searched', 'failed')[exitCode], exitCode=exitCode, reason=(reason or 'download') if exitCode == 2 else None)
+
+# ==== Hashing stage ===========================================================
+# Videos are hashed by a pool of worker threads, but the number of concurrent
+# hashes is limited per device: a spinning disk would be thrashed by concurrent
+# reads (opt_hash_workers_rotational), while an SSD or a network share can be
+# used at full width.
+
+deviceLimits = {}
+
+def deviceLimit(device, workers):
+    """Get the maximum number of concurrent hashes for a device"""
+    if device not in deviceLimits:
+        deviceLimits[device] = workers
+        # Linux only: ask sysfs if this block device (or the disk of this partition) is rotational
+        sysfsPath = "/sys/dev/block/" + str(os.major(device)) + ":" + str(os.minor(device))
+        for rotationalPath in [os.path.join(sysfsPath, "queue/rotational"),
+                               os.path.join(os.path.realpath(sysfsPath), "../queue/rotational")]:
+            try:
+                with open(rotationalPath) as f:
+                    if f.read().strip() == '1':
+                        deviceLimits[device] = max(1, min(workers, opt_hash_workers_rotational))
+                break
+            except (OSError, IOError, ValueError):
+                continue
+
+    return deviceLimits[device]
+
+def hashStream(videoPaths, workers):
+    """Hash video files using a pool of worker threads, with a concurrency limit per device.
+    Yield (path, hash, size) tuples, in completion order"""
+    waiting = collections.defaultdict(collections.deque) # device -> videos waiting to be hashed
+    running = collections.defaultdict(int) # device -> videos being hashed
+    waitingCount = 0
+    pending = {}
+    scanning = True
+    videoPaths = iter(videoPaths)
+    workers = max(1, workers)
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    try:
+        while True:
+            # Do not read too far ahead in the list of videos
+            while scanning and waitingCount + len(pending) < workers * 4:
+                videoPath = next(videoPaths, None)
+                if videoPath is None:
+                    scanning = False
+                    break
+                try:
+                    st = os.stat(videoPath)
+                except OSError:
+                    yield (videoPath, 'IOError', 0)
+                    continue
+                waiting[st.st_dev].append((videoPath, st))
+                waitingCount += 1
+
+            # Start hashing on the devices that are not busy
+            for device, videos in waiting.items():
+                while videos and running[device] < deviceLimit(device, workers):
+                    videoPath, st = videos.popleft()
+                    pending[pool.submit(hashFileCached, videoPath, st)] = (device, videoPath, st.st_size)
+                    running[device] += 1
+                    waitingCount -= 1
+
+            if not pending:
+                break
+
+            done, notDone = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                device, videoPath, videoSize = pending.pop(future)
+                running[device] -= 1
+                try:
+                    videoHash = future.result()
+                except (OSError, IOError):
+                    videoHash = 'IOError'
+                yield (videoPath, videoHash, videoSize)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
 # ==== Automatic selection mode ================================================
+# Each subtitles is scored by language priority (100 points per rank, the first
+# configured language gets the most), +1 if found by file hash, and +1 for each
+# token of its file name also found in the video file name (multiset intersection).
+# The video file name is only split into tokens once, and the language ranks
+# are computed once per languages setting.
+
+languageRanks = {} # tuple(opt_languages) -> {SubLanguageID: rank}
+
+def getLanguageRanks():
+    """Rank of each configured language (0 for the first one)"""
+    key = tuple(opt_languages)
+    if key not in languageRanks:
+        languageRanks.clear()
+        ranks = {}
+        for language in ",".join(opt_languages).split(','):
+            if language:
+                ranks.setdefault(language, len(ranks))
+        languageRanks[key] = ranks
+    return languageRanks[key]
+
+def languageRank(SubLanguageID):
+    """Priority of a subtitles language (0 for the first configured language)"""
+    ranks = getLanguageRanks()
+    return ranks.get(SubLanguageID, len(ranks))
+
+def splitTokens(fileName):
+    """Split a file name into lowercase tokens"""
+    return fileName.replace('-', '.').replace(' ', '.').replace('_', '.').lower().split('.')
+
+def selectionAutoScores(subtitlesList, videoFileName):
+    """Score every subtitles of the list, return the list of their scores"""
+    ranks = getLanguageRanks()
+    points = {language: (len(ranks) - 1 - rank) * 100 for language, rank in ranks.items()}
+    videoTokens = collections.Counter(splitTokens(videoFileName))
+    # Without repeated tokens in the video file name, the intersection of the sets is enough
+    videoTokensSet = frozenset(videoTokens) if max(videoTokens.values(), default=0) <= 1 else None
+    overlaps = {} # SubFileName -> number of tokens also found in the video file name
+
+    scores = []
+    for subtitle in subtitlesList['data']:
+        subFileName = subtitle['SubFileName']
+        overlap = overlaps.get(subFileName)
+        if overlap is None:
+            if videoTokensSet is not None:
+                overlap = len(videoTokensSet.intersection(splitTokens(subFileName)))
+            else:
+                overlap = sum((collections.Counter(splitTokens(subFileName)) & videoTokens).values())
+            overlaps[subFileName] = overlap
 
-def selectionAuto(subtitlesList):
-    """Automatic subtitles selection using filename match"""
+        # points to respect languages priority (unknown languages come last), extra
+        # point if the sub is found by hash, and points for filename match
+        scores.append(points.get(subtitle['SubLanguageID'], -100) + (subtitle['MatchedBy'] == 'moviehash') + overlap)
 
-    if len(opt_languages) == 1:
-        splitted_languages_list = list(reversed(opt_languages[0].split(',')))
-    else:
-        splitted_languages_list = opt_languages
+    return scores
 
-    videoFileParts = videoFileName.replace('-', '.').replace(' ', '.').replace('_', '.').lower().split('.')
-    maxScore = -1
+def selectionAutoRanking(subtitlesList, videoFileName):
+    """Return the subtitles of the list sorted from the best to the worst
+    (subtitles with the same score keep the order of the server)"""
+    scores = selectionAutoScores(subtitlesList, videoFileName)
+    return [subtitlesList['data'][i] for i in sorted(range(len(scores)), key=scores.__getitem__, reverse=True)]
 
-    for subtitle in subtitlesList['data']:
-        score = 0
-        # points to respect languages priority
-        score += splitted_languages_list.index(subtitle['SubLanguageID']) * 100
-        # extra point if the sub is found by hash
-        if subtitle['MatchedBy'] == 'moviehash':
-            score += 1
-        # points for filename mach
-        subFileParts = subtitle['SubFileName'].replace('-', '.').replace(' ', '.').replace('_', '.').lower().split('.')
-        for subPart in subFileParts:
-            for filePart in videoFileParts:
-                if subPart == filePart:
-                    score += 1
-        if score > maxScore:
-            maxScore = score
-            subtitlesSelected = subtitle['SubFileName']
-
-    return subtitlesSelected
+def selectionAuto(subtitlesList, videoFileName):
+    """Automatic subtitles selection using filename match"""
+    scores = selectionAutoScores(subtitlesList, videoFileName)
+    if not scores:
+        return ''
+    return subtitlesList['data'][max(range(len(scores)), key=scores.__getitem__)]['SubFileName']
+
+# ==== Qt GUI ==================================================================
+# PyQt5 is only imported when a window is actually needed (and never in headless
+# mode), so the Qt classes are only defined by loadQt().
+
+headless = False
+QtCore = None
+QtGui = None
+QtWidgets = None
+Application = None
+
+def loadQt():
+    """Import PyQt5, create the QApplication and define the Qt classes (only once)"""
+    global QtCore, QtGui, QtWidgets, Application
+    if QtWidgets is not None:
+        return
+    try:
+        from PyQt5 import QtCore, QtGui, QtWidgets
+    except ImportError:
+        print("PyQt5 is not available on your system, exiting...")
+        sys.exit(2)
+
+    Application = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    loadSettingsWindow()
+    loadSubsWindow()
+    loadBatchWindow()
+    loadDownloadWindow()
 
 # ==== Qt Settings Management Window ===========================================
 # If config file does not exists create it, put the default values and print the
@@ -291,701 +1251,2508 @@ def selectionAuto(subtitlesList):
 
 subLang=[("Arabic","ara"),("Bengali","ben"),("Cantonese","yue"),("Dutch","nld"),("English","eng"),("Filipino","fil"),("French","fre"),("German","ger"),("Hindi","hin"),("Indonesian","ind"),("Italian","ita"),("Japanese","jpn"),("Korean","kor"),("Mandarin","mdr"),("Persian","per"),("Portuguese","por"),("Russian","rus"),("Spanish","spa"),("Swahili","swa"),("Turkish","tur"),("Vietnamese","vie")]
 
-class settingsWindow(QtWidgets.QDialog):
-    def __init__(self,parent=None):
-        super(settingsWindow,self).__init__(parent)
-        QtWidgets.QMainWindow.__init__(self)
-        self.setWindowTitle('OpenSubtitlesDownloadQt settings panel')
-        self.setWindowIcon(QtGui.QIcon.fromTheme("document-properties"))
-
-        # Read (or init) settings
-        readSettings()
-
-        # Create titles font
-        titleFont = QtGui.QFont()
-        titleFont.setBold(True)
-        titleFont.setUnderline(True)
-
-        # Languages selection gui (puchbuttons)
-        self.langLabel = QtWidgets.QLabel("1/ Select the language(s) you need:")
-        self.langLabel.setFont(titleFont)
-
-        # Preferences selection gui (comboboxes)
-        self.prefLabel = QtWidgets.QLabel("2/ Select your preferences:")
-        self.prefLabel.setFont(titleFont)
-        self.suffixLabel = QtWidgets.QLabel("Write 2-letter language code (ex: _en) at the end of the subtitles file:")
-        self.opt_suffixBox = QtWidgets.QComboBox()
-        self.opt_suffixBox.setMaximumWidth(100)
-        self.opt_suffixBox.addItems(['auto','on','off'])
-        self.opt_suffixBox.setCurrentIndex(self.opt_suffixBox.findText(opt_language_suffix, QtCore.Qt.MatchFixedString))
-        self.bynameLabel = QtWidgets.QLabel("If the search by movie hash fails, search by file name will be used:")
-        self.opt_bynameBox = QtWidgets.QComboBox()
-        self.opt_bynameBox.setMaximumWidth(100)
-        self.opt_bynameBox.addItems(['on','off'])
-        self.opt_bynameBox.setCurrentIndex(self.opt_bynameBox.findText(opt_byname, QtCore.Qt.MatchFixedString))
-        self.modeLabel = QtWidgets.QLabel("Subtitles selection mode:")
-        self.opt_modeBox = QtWidgets.QComboBox()
-        self.opt_modeBox.setMinimumWidth(100)
-        self.opt_modeBox.addItems(['manual','auto'])
-        self.opt_modeBox.setCurrentIndex(self.opt_modeBox.findText(opt_selection_mode, QtCore.Qt.MatchFixedString))
-        self.overwriteLabel = QtWidgets.QLabel("Overwite existing subtitle:")
-        self.opt_overwriteBox = QtWidgets.QComboBox()
-        self.opt_overwriteBox.setMinimumWidth(100)
-        self.opt_overwriteBox.addItems(['on','off'])
-        self.opt_overwriteBox.setCurrentIndex(self.opt_overwriteBox.findText(opt_search_overwrite, QtCore.Qt.MatchFixedString))
-
-        # Columns in selection window (checkboxes)
-        self.columnLabel = QtWidgets.QLabel("3/ Select the colums to show in the selection window:")
-        self.columnLabel.setFont(titleFont)
-
-        self.opt_languageBox = QtWidgets.QCheckBox("Subtitles language")
-        if opt_display_language == "on": self.opt_languageBox.setChecked(True)
-        self.opt_hiBox = QtWidgets.QCheckBox("Hearing impaired version")
-        if opt_display_hi == "on": self.opt_hiBox.setChecked(True)
-        self.opt_ratingBox = QtWidgets.QCheckBox("Users rating")
-        if opt_display_rating == "on": self.opt_ratingBox.setChecked(True)
-        self.opt_countBox = QtWidgets.QCheckBox("Downloads count")
-        if opt_display_count == "on": self.opt_countBox.setChecked(True)
-
-        # OSD user account
-        self.accountTitle = QtWidgets.QLabel("4/ Opensubtitles.org account:")
-        self.accountTitle.setFont(titleFont)
-        self.accountLabel = QtWidgets.QLabel("You can use your account to avoid ads and bypass download limits.")
-        self.usernameLabel = QtWidgets.QLabel("Username: ")
-        self.usernameEdit = QtWidgets.QLineEdit()
-        self.usernameEdit.setText(osd_username)
-        self.passwordLabel = QtWidgets.QLabel("Password: ")
-        self.passwordEdit = QtWidgets.QLineEdit()
-        self.passwordEdit.setText(osd_password)
-        self.passwordEdit.setEchoMode(QtWidgets.QLineEdit.Password)
-
-        # Help / Link to the wiki
-        self.helpLabel = QtWidgets.QLabel("If you have any troubles you can <a href=https://github.com/emericg/OpenSubtitlesDownloadQt/wiki>visit the wiki pages!</a> ")
-        self.helpLabel.setOpenExternalLinks(True)
-
-        # Finish button and its function
-        self.finishButton = QtWidgets.QPushButton("Save settings",self)
-        self.finishButton.clicked.connect(self.doFinish)
-
-        self.vbox = QtWidgets.QVBoxLayout()          # Main vertical layout
-        self.vbox.setSpacing(4)
-        self.grid = QtWidgets.QGridLayout()          # Grid layout for the languages buttons
-        self.grid.setSpacing(4)
-        self.prefLabelHBox = QtWidgets.QHBoxLayout() # Horizontal layout for the preferences labels
-        self.prefLabelHBox.setSpacing(4)
-        self.prefBoxHBox = QtWidgets.QHBoxLayout()   # Horizontal layout for the preferences boxes
-        self.prefBoxHBox.setAlignment(QtCore.Qt.AlignLeft)
-        self.prefBoxHBox.setSpacing(4)
-        self.haccountbox = QtWidgets.QHBoxLayout()   # Horizontal layout for the account labels and edits
-        self.haccountbox.setSpacing(4)
-
-        # Language section:
-        self.vbox.addWidget(self.langLabel)
-        self.vbox.addSpacing(4)
-
-        # Create the buttons for languages from the list and add them to the layout
-        x=0
-        y=0
-        self.pushLang=[]
-        for i in range(0,len(subLang)):
-            self.pushLang.append(QtWidgets.QPushButton(subLang[i][0],self))
-            self.pushLang[i].setCheckable(True)
-
-            if str(subLang[i][1]) in str(opt_languages):
-                self.pushLang[i].setChecked(True)
-            self.grid.addWidget(self.pushLang[i],x,y)
-            y=(y+1)%3 # Coz we want 3 columns
-            if y==0: x+=1
-
-        self.vbox.addLayout(self.grid)
-
-        # Add the other widgets to the vertical layout
-        self.vbox.addSpacing(10)
-        self.vbox.addWidget(self.prefLabel)
-        self.vbox.addWidget(self.suffixLabel)
-        self.vbox.addWidget(self.opt_suffixBox)
-        self.vbox.addWidget(self.bynameLabel)
-        self.vbox.addWidget(self.opt_bynameBox)
-        self.prefLabelHBox.addWidget(self.modeLabel)
-        self.prefLabelHBox.addWidget(self.overwriteLabel)
-        self.prefBoxHBox.addWidget(self.opt_modeBox)
-        self.prefBoxHBox.addSpacing(120)
-        self.prefBoxHBox.addWidget(self.opt_overwriteBox)
-        self.vbox.addLayout(self.prefLabelHBox)
-        self.vbox.addLayout(self.prefBoxHBox)
-        self.vbox.addSpacing(10)
-        self.vbox.addWidget(self.columnLabel)
-        self.vbox.addWidget(self.opt_languageBox)
-        self.vbox.addWidget(self.opt_hiBox)
-        self.vbox.addWidget(self.opt_ratingBox)
-        self.vbox.addWidget(self.opt_countBox)
-        self.vbox.addSpacing(10)
-        self.vbox.addWidget(self.accountTitle)
-        self.vbox.addWidget(self.accountLabel)
-        self.haccountbox.addWidget(self.usernameLabel)
-        self.haccountbox.addWidget(self.usernameEdit)
-        self.haccountbox.addWidget(self.passwordLabel)
-        self.haccountbox.addWidget(self.passwordEdit)
-        self.vbox.addLayout(self.haccountbox)
-        self.vbox.addSpacing(10)
-        self.vbox.addWidget(self.helpLabel)
-        self.vbox.addSpacing(10)
-        self.vbox.addWidget(self.finishButton)
-
-        self.setLayout(self.vbox)
-
-    def doFinish(self):
-
-        # Get all the selected languages and construct the IDsList:
-        opt_languages.clear()
-        for i in range(0, len(subLang)):
-            if self.pushLang[i].isChecked():
-                opt_languages.append(subLang[i][1])
-
-        if len(opt_languages) == 0:
-            superPrint(self,self.windowTitle(),"Cannot save with those settings: choose at least one language please")
-        else:
-            # Get the values of the comboboxes:
-            opt_language_suffix = self.opt_suffixBox.currentText()
-            opt_language_separator = "_" #self.opt_separatorBox.currentText()
-            opt_search_overwrite = self.opt_overwriteBox.currentText()
-            opt_search_mode = "hash_then_filename" #self.opt_searchModeBox.currentText()
-            opt_selection_mode = self.opt_modeBox.currentText()
-
-            # Same for the checkboxes:
-            opt_display_language='off'
-            opt_display_match='off'
-            opt_display_hi='off'
-            opt_display_rating='off'
-            opt_display_count='off'
-            if self.opt_languageBox.isChecked(): opt_display_language='on'
-            if self.opt_hiBox.isChecked(): opt_display_hi='on'
-            if self.opt_ratingBox.isChecked(): opt_display_rating='on'
-            if self.opt_countBox.isChecked(): opt_display_count='on'
-
-            # Get the account:
-            osd_username = self.usernameEdit.text()
-            osd_password = self.passwordEdit.text()
-
-            # Write the conf file with the parser:
-            saveSettings()
-
-            # Close the window when its all saved
-            self.close()
+def loadSettingsWindow():
+    global settingsWindow
+
+    class settingsWindow(QtWidgets.QDialog):
+        def __init__(self,parent=None):
+            super(settingsWindow,self).__init__(parent)
+            QtWidgets.QMainWindow.__init__(self)
+            self.setWindowTitle('OpenSubtitlesDownloadQt settings panel')
+            self.setWindowIcon(QtGui.QIcon.fromTheme("document-properties"))
+
+            # Read (or init) settings
+            readSettings()
+
+            # Create titles font
+            titleFont = QtGui.QFont()
+            titleFont.setBold(True)
+            titleFont.setUnderline(True)
+
+            # Languages selection gui (puchbuttons)
+            self.langLabel = QtWidgets.QLabel("1/ Select the language(s) you need:")
+            self.langLabel.setFont(titleFont)
+
+            # Preferences selection gui (comboboxes)
+            self.prefLabel = QtWidgets.QLabel("2/ Select your preferences:")
+            self.prefLabel.setFont(titleFont)
+            self.suffixLabel = QtWidgets.QLabel("Write 2-letter language code (ex: _en) at the end of the subtitles file:")
+            self.opt_suffixBox = QtWidgets.QComboBox()
+            self.opt_suffixBox.setMaximumWidth(100)
+            self.opt_suffixBox.addItems(['auto','on','off'])
+            self.opt_suffixBox.setCurrentIndex(self.opt_suffixBox.findText(opt_language_suffix, QtCore.Qt.MatchFixedString))
+            self.bynameLabel = QtWidgets.QLabel("If the search by movie hash fails, search by file name will be used:")
+            self.opt_bynameBox = QtWidgets.QComboBox()
+            self.opt_bynameBox.setMaximumWidth(100)
+            self.opt_bynameBox.addItems(['on','off'])
+            self.opt_bynameBox.setCurrentIndex(self.opt_bynameBox.findText(opt_byname, QtCore.Qt.MatchFixedString))
+            self.modeLabel = QtWidgets.QLabel("Subtitles selection mode:")
+            self.opt_modeBox = QtWidgets.QComboBox()
+            self.opt_modeBox.setMinimumWidth(100)
+            self.opt_modeBox.addItems(['manual','auto'])
+            self.opt_modeBox.setCurrentIndex(self.opt_modeBox.findText(opt_selection_mode, QtCore.Qt.MatchFixedString))
+            self.overwriteLabel = QtWidgets.QLabel("Overwite existing subtitle:")
+            self.opt_overwriteBox = QtWidgets.QComboBox()
+            self.opt_overwriteBox.setMinimumWidth(100)
+            self.opt_overwriteBox.addItems(['on','off'])
+            self.opt_overwriteBox.setCurrentIndex(self.opt_overwriteBox.findText(opt_search_overwrite, QtCore.Qt.MatchFixedString))
+
+            # Columns in selection window (checkboxes)
+            self.columnLabel = QtWidgets.QLabel("3/ Select the colums to show in the selection window:")
+            self.columnLabel.setFont(titleFont)
+
+            self.opt_languageBox = QtWidgets.QCheckBox("Subtitles language")
+            if opt_display_language == "on": self.opt_languageBox.setChecked(True)
+            self.opt_hiBox = QtWidgets.QCheckBox("Hearing impaired version")
+            if opt_display_hi == "on": self.opt_hiBox.setChecked(True)
+            self.opt_ratingBox = QtWidgets.QCheckBox("Users rating")
+            if opt_display_rating == "on": self.opt_ratingBox.setChecked(True)
+            self.opt_countBox = QtWidgets.QCheckBox("Downloads count")
+            if opt_display_count == "on": self.opt_countBox.setChecked(True)
+
+            # OSD user account
+            self.accountTitle = QtWidgets.QLabel("4/ Opensubtitles.org account:")
+            self.accountTitle.setFont(titleFont)
+            self.accountLabel = QtWidgets.QLabel("You can use your account to avoid ads and bypass download limits.")
+            self.usernameLabel = QtWidgets.QLabel("Username: ")
+            self.usernameEdit = QtWidgets.QLineEdit()
+            self.usernameEdit.setText(osd_username)
+            self.passwordLabel = QtWidgets.QLabel("Password: ")
+            self.passwordEdit = QtWidgets.QLineEdit()
+            self.passwordEdit.setText(osd_password)
+            self.passwordEdit.setEchoMode(QtWidgets.QLineEdit.Password)
+
+            # Help / Link to the wiki
+            self.helpLabel = QtWidgets.QLabel("If you have any troubles you can <a href=https://github.com/emericg/OpenSubtitlesDownloadQt/wiki>visit the wiki pages!</a> ")
+            self.helpLabel.setOpenExternalLinks(True)
+
+            # Finish button and its function
+            self.finishButton = QtWidgets.QPushButton("Save settings",self)
+            self.finishButton.clicked.connect(self.doFinish)
+
+            self.vbox = QtWidgets.QVBoxLayout()          # Main vertical layout
+            self.vbox.setSpacing(4)
+            self.grid = QtWidgets.QGridLayout()          # Grid layout for the languages buttons
+            self.grid.setSpacing(4)
+            self.prefLabelHBox = QtWidgets.QHBoxLayout() # Horizontal layout for the preferences labels
+            self.prefLabelHBox.setSpacing(4)
+            self.prefBoxHBox = QtWidgets.QHBoxLayout()   # Horizontal layout for the preferences boxes
+            self.prefBoxHBox.setAlignment(QtCore.Qt.AlignLeft)
+            self.prefBoxHBox.setSpacing(4)
+            self.haccountbox = QtWidgets.QHBoxLayout()   # Horizontal layout for the account labels and edits
+            self.haccountbox.setSpacing(4)
+
+            # Language section:
+            self.vbox.addWidget(self.langLabel)
+            self.vbox.addSpacing(4)
+
+            # Create the buttons for languages from the list and add them to the layout
+            x=0
+            y=0
+            self.pushLang=[]
+            for i in range(0,len(subLang)):
+                self.pushLang.append(QtWidgets.QPushButton(subLang[i][0],self))
+                self.pushLang[i].setCheckable(True)
+
+                if str(subLang[i][1]) in str(opt_languages):
+                    self.pushLang[i].setChecked(True)
+                self.grid.addWidget(self.pushLang[i],x,y)
+                y=(y+1)%3 # Coz we want 3 columns
+                if y==0: x+=1
+
+            self.vbox.addLayout(self.grid)
+
+            # Add the other widgets to the vertical layout
+            self.vbox.addSpacing(10)
+            self.vbox.addWidget(self.prefLabel)
+            self.vbox.addWidget(self.suffixLabel)
+            self.vbox.addWidget(self.opt_suffixBox)
+            self.vbox.addWidget(self.bynameLabel)
+            self.vbox.addWidget(self.opt_bynameBox)
+            self.prefLabelHBox.addWidget(self.modeLabel)
+            self.prefLabelHBox.addWidget(self.overwriteLabel)
+            self.prefBoxHBox.addWidget(self.opt_modeBox)
+            self.prefBoxHBox.addSpacing(120)
+            self.prefBoxHBox.addWidget(self.opt_overwriteBox)
+            self.vbox.addLayout(self.prefLabelHBox)
+            self.vbox.addLayout(self.prefBoxHBox)
+            self.vbox.addSpacing(10)
+            self.vbox.addWidget(self.columnLabel)
+            self.vbox.addWidget(self.opt_languageBox)
+            self.vbox.addWidget(self.opt_hiBox)
+            self.vbox.addWidget(self.opt_ratingBox)
+            self.vbox.addWidget(self.opt_countBox)
+            self.vbox.addSpacing(10)
+            self.vbox.addWidget(self.accountTitle)
+            self.vbox.addWidget(self.accountLabel)
+            self.haccountbox.addWidget(self.usernameLabel)
+            self.haccountbox.addWidget(self.usernameEdit)
+            self.haccountbox.addWidget(self.passwordLabel)
+            self.haccountbox.addWidget(self.passwordEdit)
+            self.vbox.addLayout(self.haccountbox)
+            self.vbox.addSpacing(10)
+            self.vbox.addWidget(self.helpLabel)
+            self.vbox.addSpacing(10)
+            self.vbox.addWidget(self.finishButton)
+
+            self.setLayout(self.vbox)
+
+        def doFinish(self):
+            global osd_username, osd_password, opt_search_overwrite, opt_search_mode, opt_selection_mode, \
+                   opt_language_suffix, opt_language_separator, opt_display_language, opt_display_match, \
+                   opt_display_hi, opt_display_rating, opt_display_count
+
+            # Get all the selected languages and construct the IDsList:
+            opt_languages.clear()
+            for i in range(0, len(subLang)):
+                if self.pushLang[i].isChecked():
+                    opt_languages.append(subLang[i][1])
+
+            if len(opt_languages) == 0:
+                superPrint(self,self.windowTitle(),"Cannot save with those settings: choose at least one language please")
+            else:
+                # Get the values of the comboboxes:
+                opt_language_suffix = self.opt_suffixBox.currentText()
+                opt_language_separator = "_" #self.opt_separatorBox.currentText()
+                opt_search_overwrite = self.opt_overwriteBox.currentText()
+                opt_search_mode = "hash_then_filename" #self.opt_searchModeBox.currentText()
+                opt_selection_mode = self.opt_modeBox.currentText()
+
+                # Same for the checkboxes:
+                opt_display_language='off'
+                opt_display_match='off'
+                opt_display_hi='off'
+                opt_display_rating='off'
+                opt_display_count='off'
+                if self.opt_languageBox.isChecked(): opt_display_language='on'
+                if self.opt_hiBox.isChecked(): opt_display_hi='on'
+                if self.opt_ratingBox.isChecked(): opt_display_rating='on'
+                if self.opt_countBox.isChecked(): opt_display_count='on'
+
+                # Get the account:
+                osd_username = self.usernameEdit.text()
+                osd_password = self.passwordEdit.text()
+
+                # Write the conf file with the parser:
+                saveSettings()
+
+                # Close the window when its all saved
+                self.close()
 
 def spawnSettingsWindow():
+    loadQt()
     gui = settingsWindow()
     gui.exec_()
 
 # ==== Qt subs window: Cross platform subtitles selection window ===============
 
-class subsWindow(QtWidgets.QDialog):
-    def __init__(self,parent=None):
-        super(subsWindow,self).__init__(parent)
-        QtWidgets.QMainWindow.__init__(self)
-        self.setWindowTitle('Subtitles available!')
-        self.setWindowIcon(QtGui.QIcon.fromTheme("document-properties"))
-        self.resize(720, 320)
-
-        self.vBox = QtWidgets.QVBoxLayout() # Main vertical layout
-
-        # Title and filename of the video , each in a horizontal layout
-        labelFont = QtGui.QFont()
-        labelFont.setBold(True)
-        self.titleTxtLabel = QtWidgets.QLabel("Title: ")
-        self.titleTxtLabel.setFont(labelFont)
-        self.titleLabel = QtWidgets.QLabel(videoTitle.replace("\\", ""))
-        self.titleHBox = QtWidgets.QHBoxLayout()
-        self.titleHBox.addWidget(self.titleTxtLabel)
-        self.titleHBox.addWidget(self.titleLabel)
-        self.titleHBox.addStretch(1)
-
-        self.nameTxtLabel = QtWidgets.QLabel("Filename: ")
-        self.nameTxtLabel.setFont(labelFont)
-        self.nameLabel = QtWidgets.QLabel(videoFileName)
-        self.nameHBox = QtWidgets.QHBoxLayout()
-        self.nameHBox.addWidget(self.nameTxtLabel)
-        self.nameHBox.addWidget(self.nameLabel)
-        self.nameHBox.addStretch(1)
-
-        # Table containing the list of the subtitles:
-        self.subTable = QtWidgets.QTableWidget()
-        self.subTable.setShowGrid(False)   # Don't show the table grid
-        self.subTable.setSelectionBehavior(1) # 1 = QAbstractItemView::SelectRows, selecting only rows
-        self.subTable.verticalHeader().setVisible(False)  # Don't print the lines number
-
-        ## Set col and lines nunbers depending on on the user's choices and the number of item in the list
-        self.hLabels = "Available subtitles (synchronized)"
-        self.colCount = 1
-
-        # Build the colums an their labels, depending on the user's choices
-        if opt_display_language == "on":
-            self.hLabels += ";Language"
-            self.colCount += 1
-
-        if opt_display_hi == "on":
-            self.hLabels += ";HI"
-            self.colCount += 1
-
-        if opt_display_rating == "on":
-            self.hLabels += ";Rating"
-            self.colCount += 1
-
-        if opt_display_count == "on":
-            self.hLabels += ";Downloads"
-            self.colCount += 1
-
-        self.subTable.setColumnCount(self.colCount)
-        self.subTable.setHorizontalHeaderLabels(self.hLabels.split(";"))
-        self.subTable.setRowCount(len(subtitlesList['data']))
-
-        # Set the content of the table:
-        rowIndex = 0
-
-        for sub in subtitlesList['data']:
-            colIndex = 0
-            item = QtWidgets.QTableWidgetItem(sub['SubFileName'])
-            item.setFlags(QtCore.Qt.ItemIsEnabled|QtCore.Qt.ItemIsSelectable)  # Flags to disable editing of the cells
-            self.subTable.setItem(rowIndex, colIndex, item)
+def loadSubsWindow():
+    global subsModel, subsWindow, searchTask
+
+    # Table model over the list of subtitles: cells are only computed when they are shown
+    class subsModel(QtCore.QAbstractTableModel):
+        def __init__(self, subtitles, parent=None):
+            super(subsModel, self).__init__(parent)
+            self.subtitles = subtitles
+
+            # Build the colums and their labels, depending on the user's choices ('auto' columns are hidden by the window until needed)
+            self.columns = [("Available subtitles (synchronized)", 'SubFileName')]
+            if opt_display_language != "off":
+                self.columns.append(("Language", 'LanguageName'))
+            if opt_display_hi != "off":
+                self.columns.append(("HI", 'SubHearingImpaired'))
+            if opt_display_rating != "off":
+                self.columns.append(("Rating", 'SubRating'))
+            if opt_display_count != "off":
+                self.columns.append(("Downloads", 'SubDownloadsCnt'))
+
+        def appendSubtitles(self, subtitles):
+            """Add subtitles at the end of the list (results arriving while the window is open)"""
+            if subtitles:
+                self.beginInsertRows(QtCore.QModelIndex(), len(self.subtitles), len(self.subtitles) + len(subtitles) - 1)
+                self.subtitles.extend(subtitles)
+                self.endInsertRows()
+
+        def rowCount(self, parent=QtCore.QModelIndex()):
+            return 0 if parent.isValid() else len(self.subtitles)
+
+        def columnCount(self, parent=QtCore.QModelIndex()):
+            return 0 if parent.isValid() else len(self.columns)
+
+        def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+            if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+                return self.columns[section][0]
+            return None
+
+        def data(self, index, role=QtCore.Qt.DisplayRole):
+            field = self.columns[index.column()][1]
+            value = self.subtitles[index.row()].get(field, '')
+            if role == QtCore.Qt.DisplayRole:
+                if field == 'SubHearingImpaired':
+                    return u'\u2713' if value == '1' else ''
+                return value
+            if role == QtCore.Qt.UserRole: # Sort by value (numbers for rating and downloads)
+                if field in ('SubRating', 'SubDownloadsCnt'):
+                    try:
+                        return float(value)
+                    except (TypeError, ValueError):
+                        return 0.0
+                return value
+            if role == QtCore.Qt.TextAlignmentRole and index.column() > 0:
+                return QtCore.Qt.AlignCenter # Center the content of the cell
+            return None
+
+    class subsWindow(QtWidgets.QDialog):
+        def __init__(self,subtitlesList,videoTitle,videoFileName,parent=None):
+            super(subsWindow,self).__init__(parent)
+            QtWidgets.QMainWindow.__init__(self)
+            self.setWindowTitle('Subtitles available!')
+            self.setWindowIcon(QtGui.QIcon.fromTheme("document-properties"))
+            self.resize(720, 320)
+
+            self.vBox = QtWidgets.QVBoxLayout() # Main vertical layout
+
+            # Title and filename of the video , each in a horizontal layout
+            labelFont = QtGui.QFont()
+            labelFont.setBold(True)
+            self.titleTxtLabel = QtWidgets.QLabel("Title: ")
+            self.titleTxtLabel.setFont(labelFont)
+            self.titleLabel = QtWidgets.QLabel(videoTitle.replace("\\", ""))
+            self.titleHBox = QtWidgets.QHBoxLayout()
+            self.titleHBox.addWidget(self.titleTxtLabel)
+            self.titleHBox.addWidget(self.titleLabel)
+            self.titleHBox.addStretch(1)
+
+            self.nameTxtLabel = QtWidgets.QLabel("Filename: ")
+            self.nameTxtLabel.setFont(labelFont)
+            self.nameLabel = QtWidgets.QLabel(videoFileName)
+            self.nameHBox = QtWidgets.QHBoxLayout()
+            self.nameHBox.addWidget(self.nameTxtLabel)
+            self.nameHBox.addWidget(self.nameLabel)
+            self.nameHBox.addStretch(1)
+
+            # Filter field: typing filters the subtitles by name
+            self.filterEdit = QtWidgets.QLineEdit()
+            self.filterEdit.setPlaceholderText("Type to filter the subtitles by name")
+            self.filterEdit.setClearButtonEnabled(True)
+            self.filterEdit.installEventFilter(self)
+
+            # Table containing the list of the subtitles, through a sorting and filtering proxy
+            self.model = subsModel(subtitlesList['data'])
+            self.proxy = QtCore.QSortFilterProxyModel(self)
+            self.proxy.setSourceModel(self.model)
+            self.proxy.setSortRole(QtCore.Qt.UserRole)
+            self.proxy.setFilterCaseSensitivity(QtCore.Qt.CaseInsensitive)
+            self.proxy.setFilterKeyColumn(0)
+            self.filterEdit.textChanged.connect(self.doFilter)
+
+            self.subTable = QtWidgets.QTableView()
+            self.subTable.setModel(self.proxy)
+            self.subTable.setShowGrid(False)   # Don't show the table grid
+            self.subTable.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows) # selecting only rows
+            self.subTable.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+            self.subTable.setWordWrap(False)
+            self.subTable.verticalHeader().setVisible(False)  # Don't print the lines number
+            # Fixed row heights and column widths: only the visible rows are ever rendered
+            self.subTable.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+            self.subTable.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Interactive)
             self.subTable.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch) # Stretch the first column
 
-            if opt_display_language == "on":
-                colIndex += 1
-                item = QtWidgets.QTableWidgetItem(sub['LanguageName'])
-                item.setTextAlignment(0x0084) # Center the content of the cell
-                item.setFlags(QtCore.Qt.ItemIsEnabled|QtCore.Qt.ItemIsSelectable)
-                self.subTable.setItem(rowIndex, colIndex, item)
-
-            if opt_display_hi == 'on':
-                colIndex += 1
-                if sub['SubHearingImpaired'] == '1':
-                    item = QtWidgets.QTableWidgetItem(u'\u2713')
-                    self.subTable.setItem(rowIndex, colIndex, item)
-                item.setTextAlignment(0x0084)
-                item.setFlags(QtCore.Qt.ItemIsEnabled|QtCore.Qt.ItemIsSelectable)
-
-            if opt_display_rating == "on":
-                colIndex += 1
-                item = QtWidgets.QTableWidgetItem(sub['SubRating'])
-                item.setTextAlignment(0x0084)
-                item.setFlags(QtCore.Qt.ItemIsEnabled)
-                item.setFlags(QtCore.Qt.ItemIsEnabled|QtCore.Qt.ItemIsSelectable)
-                self.subTable.setItem(rowIndex, colIndex, item)
-
-            if opt_display_count == "on":
-                colIndex += 1
-                item = QtWidgets.QTableWidgetItem(sub['SubDownloadsCnt'])
-                item.setTextAlignment(0x0084)
-                item.setFlags(QtCore.Qt.ItemIsEnabled|QtCore.Qt.ItemIsSelectable)
-                self.subTable.setItem(rowIndex, colIndex, item)
-
-            rowIndex += 1 # Next row
-        self.subTable.selectRow(0) # select the first row by default
-
-        # Create the buttons and connect them to the right function
-        self.settingsButton = QtWidgets.QPushButton("Settings",self)
-        self.settingsButton.clicked.connect(self.doConfig)
-        self.cancelButton = QtWidgets.QPushButton("Quit",self)
-        self.cancelButton.clicked.connect(self.doCancel)
-        self.okButton = QtWidgets.QPushButton("Download",self)
-        self.okButton.setDefault(True)
-        self.okButton.clicked.connect(self.doAccept)
-
-        # Handle double click on the selected sub
-        self.subTable.doubleClicked.connect(self.doAccept)
-
-        # Put the bottom buttons in a H layout, Cancel and validate buttons are pushed to the bottom right corner
-        self.buttonHBox = QtWidgets.QHBoxLayout()
-        self.buttonHBox.addWidget(self.settingsButton)
-        self.buttonHBox.addStretch(1)
-        self.buttonHBox.addWidget(self.cancelButton)
-        self.buttonHBox.addWidget(self.okButton)
-
-        # Put the differents layouts in the main vertical one
-        self.vBox.addLayout(self.titleHBox)
-        self.vBox.addLayout(self.nameHBox)
-        self.vBox.addWidget(self.subTable)
-        self.vBox.addLayout(self.buttonHBox)
-        self.setLayout(self.vBox)
-
-        self.next = False # Variable to know if we continue the script after this window
-
-    def doCancel(self):
-        sys.exit(0)
+            # Sort by clicking the headers, but keep the order of the server until then
+            self.subTable.horizontalHeader().setSortIndicator(-1, QtCore.Qt.AscendingOrder)
+            self.subTable.setSortingEnabled(True)
+            self.subTable.selectRow(0) # select the first row by default
+
+            # Hide the 'auto' columns until a subtitles needs them
+            for column, (label, field) in enumerate(self.model.columns):
+                if field == 'LanguageName' and opt_display_language == 'auto':
+                    self.subTable.setColumnHidden(column, len(getLanguageRanks()) < 2)
+                elif (field == 'SubHearingImpaired' and opt_display_hi == 'auto') or (field == 'SubRating' and opt_display_rating == 'auto'):
+                    self.subTable.setColumnHidden(column, True)
+            self.updateColumns(self.model.subtitles)
+
+            # Busy indicator, only shown while the subtitles are searched
+            self.busyBar = QtWidgets.QProgressBar(self)
+            self.busyBar.setRange(0,0)
+            self.busyBar.setMaximumHeight(12)
+            self.busyBar.setTextVisible(False)
+            self.statusLabel = QtWidgets.QLabel()
+            self.statusHBox = QtWidgets.QHBoxLayout()
+            self.statusHBox.addWidget(self.statusLabel)
+            self.statusHBox.addWidget(self.busyBar, 1)
+            self.busyBar.hide()
+
+            # Create the buttons and connect them to the right function
+            self.settingsButton = QtWidgets.QPushButton("Settings",self)
+            self.settingsButton.clicked.connect(self.doConfig)
+            self.cancelButton = QtWidgets.QPushButton("Quit",self)
+            self.cancelButton.clicked.connect(self.doCancel)
+            self.okButton = QtWidgets.QPushButton("Download",self)
+            self.okButton.setDefault(True)
+            self.okButton.clicked.connect(self.doAccept)
+
+            # Handle double click on the selected sub
+            self.subTable.doubleClicked.connect(self.doAccept)
+
+            # Put the bottom buttons in a H layout, Cancel and validate buttons are pushed to the bottom right corner
+            self.buttonHBox = QtWidgets.QHBoxLayout()
+            self.buttonHBox.addWidget(self.settingsButton)
+            self.buttonHBox.addStretch(1)
+            self.buttonHBox.addWidget(self.cancelButton)
+            self.buttonHBox.addWidget(self.okButton)
+
+            # Put the differents layouts in the main vertical one
+            self.vBox.addLayout(self.titleHBox)
+            self.vBox.addLayout(self.nameHBox)
+            self.vBox.addWidget(self.filterEdit)
+            self.vBox.addWidget(self.subTable)
+            self.vBox.addLayout(self.statusHBox)
+            self.vBox.addLayout(self.buttonHBox)
+            self.setLayout(self.vBox)
+
+            self.next = False # Variable to know if we continue the script after this window
+            self.selectedSub = ''
+            self.selectedSubs = []
+            self.error = None
+            self.languagesDone = 0
+            self.filterEdit.setFocus()
+
+        def startSearch(self, task):
+            """Open the window right away, and fill it with the results of a searchTask as they arrive"""
+            task.results.connect(self.appendResults)
+            task.failed.connect(self.searchFailed)
+            task.finished.connect(self.searchFinished)
+            if len(getLanguageRanks()) > 1: # the subtitles of several languages can be downloaded at once
+                self.subTable.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+            self.okButton.setEnabled(bool(self.model.subtitles))
+            self.statusLabel.setText("Searching for subtitles...")
+            self.busyBar.show()
+            task.start()
+
+        def appendResults(self, SubLanguageID, subtitlesList):
+            """Add the results of a language, while the other languages are still searched"""
+            if self.next:
+                return
+            self.languagesDone += 1
+            self.statusLabel.setText("Searching for subtitles... (" + str(self.languagesDone) + "/" + str(len(getLanguageRanks())) + " languages)")
+            if not subtitlesList['data']:
+                return
+            if not self.model.subtitles:
+                self.titleLabel.setText(subtitlesList['data'][0]['MovieName'])
+            self.model.appendSubtitles(subtitlesList['data'])
+            self.updateColumns(subtitlesList['data'])
+            if not self.subTable.selectionModel().hasSelection():
+                self.subTable.selectRow(0)
+            self.okButton.setEnabled(True)
+
+        def searchFinished(self):
+            if self.next:
+                return
+            self.busyBar.hide()
+            subtitles = self.model.subtitles
+            if not subtitles: # No subtitles found, for any of the languages
+                self.next = True
+                self.close()
+            elif len(subtitles) == 1 and subtitles[0]['MatchedBy'] == 'moviehash':
+                # If there is only one subtitles, auto-select it (only when matched by file hash)
+                self.subTable.selectRow(0)
+                self.doAccept()
+            else:
+                self.statusLabel.setText(str(len(subtitles)) + " subtitles found")
 
-    def doAccept(self):
-        self.next = True
-        self.selectedSub = str(self.subTable.item(self.subTable.currentRow(),0).text())
-        self.close()
+        def searchFailed(self, message):
+            if self.next:
+                return
+            self.error = message
+            self.next = True
+            self.close()
 
-    def doConfig(self):
-        spawnSettingsWindow()
+        def updateColumns(self, subtitles):
+            """Show the hidden 'auto' columns needed by these subtitles"""
+            for column, (label, field) in enumerate(self.model.columns):
+                if self.subTable.isColumnHidden(column):
+                    if field == 'SubHearingImpaired' and any(item['SubHearingImpaired'] == '1' for item in subtitles):
+                        self.subTable.setColumnHidden(column, False)
+                    elif field == 'SubRating' and any(item['SubRating'] != '0.0' for item in subtitles):
+                        self.subTable.setColumnHidden(column, False)
 
-    def keyPressEvent(self, event): # Handle enter and escape buttons
-        if event.key() == QtCore.Qt.Key_Return:
-            self.doAccept()
-        if event.key() == QtCore.Qt.Key_Escape:
+        def doCancel(self):
             sys.exit(0)
 
-    def closeEvent(self,event):
-        if not self.next: # If not "Accept" clicked..
-            sys.exit(0)
+        def doAccept(self):
+            indexes = sorted(self.subTable.selectionModel().selectedRows(), key=lambda index: index.row())
+            if not indexes and self.subTable.currentIndex().isValid():
+                indexes = [self.subTable.currentIndex()]
+            if not indexes:
+                return # Nothing to download, every subtitles is filtered out (or still searched)
+            self.next = True
+            self.selectedSubs = [self.model.subtitles[self.proxy.mapToSource(index).row()] for index in indexes]
+            self.selectedSub = self.selectedSubs[0]['SubFileName']
+            self.close()
+
+        def doFilter(self, text):
+            self.proxy.setFilterFixedString(text)
+            if not self.subTable.currentIndex().isValid() or not self.subTable.selectionModel().hasSelection():
+                self.subTable.selectRow(0)
+
+        def eventFilter(self, obj, event):
+            # Move in the table while typing in the filter field
+            if obj is self.filterEdit and event.type() == QtCore.QEvent.KeyPress and \
+                    event.key() in (QtCore.Qt.Key_Up, QtCore.Qt.Key_Down, QtCore.Qt.Key_PageUp, QtCore.Qt.Key_PageDown):
+                QtWidgets.QApplication.sendEvent(self.subTable, event)
+                return True
+            return super(subsWindow, self).eventFilter(obj, event)
+
+        def doConfig(self):
+            spawnSettingsWindow()
+
+        def keyPressEvent(self, event): # Handle enter and escape buttons
+            if event.key() == QtCore.Qt.Key_Return:
+                self.doAccept()
+            if event.key() == QtCore.Qt.Key_Escape:
+                sys.exit(0)
+
+        def closeEvent(self,event):
+            if not self.next: # If not "Accept" clicked..
+                sys.exit(0)
+
+    # Search for the subtitles of a video in a daemon thread (quitting never waits for the network),
+    # the results of each language are sent to the selection window as soon as they arrive
+    class searchTask(QtCore.QObject):
+        results = QtCore.pyqtSignal(str, object)
+        failed = QtCore.pyqtSignal(str)
+        finished = QtCore.pyqtSignal()
+
+        def __init__(self, video, parent=None):
+            super(searchTask,self).__init__(parent)
+            self.video = video
+            self.cancelled = False
+            self.thread = threading.Thread(target=self.run, daemon=True)
 
-def selectionQt(subtitlesList):
-    gui = subsWindow()
+        def start(self):
+            self.thread.start()
+
+        def run(self):
+            try:
+                searchVideoLanguages(self.video, self.results.emit, lambda: self.cancelled)
+            except RuntimeError as e:
+                self.failed.emit(str(e))
+            except Exception:
+                self.failed.emit("Unable to reach opensubtitles.org servers!")
+            self.finished.emit()
+
+def processGui(videoPaths):
+    """Search and download subtitles for the videos of the list (manual selection mode):
+    the selection window of a single video opens right away, while the session, hashing
+    and searches run in a worker thread, and several videos are reviewed in a single
+    window. Return a dictionary with the exit code of each video path"""
+    loadQt()
+    exitCodes = {}
+
+    # Several videos are reviewed in a single window
+    videoPaths = iter(videoPaths)
+    firstPaths = list(itertools.islice(videoPaths, 2))
+    if len(firstPaths) > 1:
+        return reviewBatch(itertools.chain(firstPaths, videoPaths))
+    if not firstPaths:
+        return exitCodes
+
+    videoPath = firstPaths[0]
+    video = newVideo(videoPath, None, None)
+    gui = subsWindow({'data': []}, 'Unknown video title', video['fileName'])
+    task = searchTask(video)
+
+    start = metricsStart()
+    gui.startSearch(task)
     gui.exec_()
-    return gui.selectedSub
+    task.cancelled = True # the user doesn't wait for the slowest languages
+    metricsStage('select', start, path=videoPath, results=len(gui.model.subtitles))
 
-# ==== Qt download window, thread and function =================================
+    if gui.error:
+        superPrint("error", "Connection error!", gui.error + "\n\nPlease check:\n- Your Internet connection status\n- www.opensubtitles.org availability\n- Your downloads limit (200 subtitles per 24h)\n\nThe subtitles search and download service is powered by opensubtitles.org. Be sure to donate if you appreciate the service provided!")
+        sys.exit(2)
 
-class downloadWindow(QtWidgets.QDialog):
-    def __init__(self,subtitleURL,subtitlePath,parent=None):
-        super(downloadWindow,self).__init__(parent)
-        QtWidgets.QMainWindow.__init__(self)
-        self.setWindowTitle('OpenSubtitlesDownload: Downloading ...')
-        self.setWindowIcon(QtGui.QIcon.fromTheme("document-properties"))
-        self.resize(380,90)
-
-        # Create a progress bar and a label, add them to the main vertical layout
-        self.vBox = QtWidgets.QVBoxLayout()
-        self.progressBar = QtWidgets.QProgressBar(self)
-        self.progressBar.setRange(0,0)
-        self.vBox.addWidget(self.progressBar)
-        self.label = QtWidgets.QLabel("Please wait while the subtitles are being downloaded")
-        self.label.setAlignment(QtCore.Qt.AlignCenter)
-        self.vBox.addWidget(self.label)
-        self.setLayout(self.vBox)
-
-        def onFinished():
-            self.progressBar.setRange(0,1)
-            self.close()
+    # Download the first selected subtitles of each language (with the language code in their names if there are several)
+    selectedSubs = []
+    for subtitle in gui.selectedSubs:
+        if all(subtitle['SubLanguageID'] != selected['SubLanguageID'] for selected in selectedSubs):
+            selectedSubs.append(subtitle)
+    exitCodes[videoPath] = 0 if selectedSubs else 1
+    languageSuffix = (opt_language_suffix == 'on') or (opt_language_suffix == 'auto' and len(selectedSubs) > 1)
+    for subtitle in selectedSubs:
+        if fetchSubtitles(video, subtitle, gui.titleLabel.text(), languageSuffix, downloadQt) != 0:
+            exitCodes[videoPath] = 2
+            break
+
+    # The cancelled search stops after its current request
+    task.thread.join()
+
+    # Send the downloads held near the download limit, highest priority first
+    for videoPath, videoExitCode in quota.release(downloadQt).items():
+        exitCodes[videoPath] = max(exitCodes.get(videoPath, 0), videoExitCode)
+
+    return exitCodes
+
+# ==== Qt batch window: review the subtitles of a batch of videos ==============
+# Every video of the batch is listed in a single window, with the subtitles chosen
+# by the automatic selection mode. Rows are added as the searches complete, and
+# only hold the best ranked subtitles of each video. The user can change any choice
+# (double click), then all the subtitles are downloaded at once.
+
+def loadBatchWindow():
+    global batchModel, batchDelegate, batchSearchTask, batchDownloadTask, batchWindow
+
+    class batchModel(QtCore.QAbstractTableModel):
+        columns = ["Video", "Subtitles", "Language", "Status"]
+
+        def __init__(self, parent=None):
+            super(batchModel, self).__init__(parent)
+            self.rows = []
+
+        def rowCount(self, parent=QtCore.QModelIndex()):
+            return 0 if parent.isValid() else len(self.rows)
+
+        def columnCount(self, parent=QtCore.QModelIndex()):
+            return 0 if parent.isValid() else len(self.columns)
+
+        def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+            if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+                return self.columns[section]
+            return None
+
+        def data(self, index, role=QtCore.Qt.DisplayRole):
+            row = self.rows[index.row()]
+            subtitle = row['candidates'][row['choice']] if row['choice'] >= 0 else None
+            if role == QtCore.Qt.DisplayRole:
+                if index.column() == 0:
+                    return row['fileName']
+                if index.column() == 1:
+                    if subtitle:
+                        return subtitle['SubFileName']
+                    return "Don't download" if row['candidates'] else "No subtitles found"
+                if index.column() == 2:
+                    return subtitle['LanguageName'] if subtitle else ''
+                return row['status']
+            if role == QtCore.Qt.EditRole:
+                return row['choice']
+            if role == QtCore.Qt.ForegroundRole and not subtitle:
+                return QtGui.QBrush(QtCore.Qt.gray)
+            if role == QtCore.Qt.TextAlignmentRole and index.column() > 1:
+                return QtCore.Qt.AlignCenter # Center the content of the cell
+            return None
+
+        def flags(self, index):
+            flags = super(batchModel, self).flags(index)
+            if index.column() == 1 and self.rows[index.row()]['candidates']:
+                flags |= QtCore.Qt.ItemIsEditable
+            return flags
+
+        def setData(self, index, value, role=QtCore.Qt.EditRole):
+            if role != QtCore.Qt.EditRole:
+                return False
+            self.rows[index.row()]['choice'] = value
+            self.dataChanged.emit(index.sibling(index.row(), 1), index.sibling(index.row(), 2))
+            return True
 
-        # Initiate the dowloading task in a thread
-        self.task = downloadThread(subtitleURL, subtitlePath)
-        self.task.finished.connect(onFinished)
-        self.task.start()
+        def setStatus(self, row, status):
+            self.rows[row]['status'] = status
+            self.dataChanged.emit(self.index(row, 3), self.index(row, 3))
+
+        def appendRows(self, rows):
+            self.beginInsertRows(QtCore.QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1)
+            self.rows.extend(rows)
+            self.endInsertRows()
+
+    # Choose the subtitles of a video from its best ranked subtitles, with a combo box
+    class batchDelegate(QtWidgets.QStyledItemDelegate):
+        def createEditor(self, parent, option, index):
+            editor = QtWidgets.QComboBox(parent)
+            for subtitle in index.model().rows[index.row()]['candidates']:
+                editor.addItem(subtitle['SubFileName'] + " (" + subtitle['LanguageName'] + ")")
+            editor.addItem("Don't download")
+            editor.activated.connect(lambda: self.commitData.emit(editor))
+            return editor
+
+        def setEditorData(self, editor, index):
+            choice = index.model().rows[index.row()]['choice']
+            editor.setCurrentIndex(choice if choice >= 0 else editor.count() - 1)
+
+        def setModelData(self, editor, model, index):
+            choice = editor.currentIndex()
+            model.setData(index, choice if choice < editor.count() - 1 else -1)
+
+    # Hash and search the videos of the batch (bounded pools of worker threads), sending the rows of each video
+    class batchSearchTask(QtCore.QObject):
+        rows = QtCore.pyqtSignal(object)
+        failed = QtCore.pyqtSignal(str)
+        finished = QtCore.pyqtSignal()
 
-# Thread for downloading the sub and when done emit the signal to close the window
-class downloadThread(QtCore.QThread):
-    def __init__(self, subtitleURL, subtitlePath, parent=None):
-        super(downloadThread,self).__init__(parent)
+        def __init__(self, videoPaths, parent=None):
+            super(batchSearchTask,self).__init__(parent)
+            self.videoPaths = videoPaths
+            self.cancelled = False
+            self.exitCodes = {}
+            self.copies = {} # path -> paths of the copies of this video
+            self.thread = threading.Thread(target=self.run, daemon=True)
+
+        def start(self):
+            self.thread.start()
+
+        def paths(self):
+            for videoPath in self.videoPaths:
+                if self.cancelled:
+                    return
+                yield videoPath
+
+        def review(self, video):
+            rows = reviewVideo(video)
+            self.rows.emit(rows)
+            return 0 if rows[0]['candidates'] else 1
+
+        def run(self):
+            try:
+                session = getSession()
+                if session['status'] != '200 OK':
+                    raise RuntimeError("Opensubtitles.org servers refused the connection: " + session['status'])
+                self.exitCodes = processBatch(session['token'], self.paths(), opt_batch_workers, self.review, self.copies)
+            except RuntimeError as e:
+                self.failed.emit(str(e))
+            except Exception:
+                self.failed.emit("Unable to reach opensubtitles.org servers!")
+            self.finished.emit()
+
+    # Download the chosen subtitles of every row (with bulk downloads), sending the exit code of each row
+    # (the rows held by the download quota are sent as queued, then updated once their download is sent)
+    class batchDownloadTask(QtCore.QObject):
+        progress = QtCore.pyqtSignal(int, int)
+        queued = QtCore.pyqtSignal(int)
         finished = QtCore.pyqtSignal()
-        self.subURL = subtitleURL
-        self.subPath = subtitlePath
 
-    def run(self):
-        file_name, headers = urllib.request.urlretrieve(self.subURL)
-        tmpFile = gzip.GzipFile(file_name)
-        open(self.subPath, 'wb').write(tmpFile.read())
-        self.finished.emit()
+        def __init__(self, rows, parent=None):
+            super(batchDownloadTask,self).__init__(parent)
+            self.rows = rows
+            self.held = {}
+            self.thread = threading.Thread(target=self.run, daemon=True)
+
+        def start(self):
+            self.thread.start()
+
+        def run(self):
+            reported = set() # rows with an exit code
+            def progress(i, exitCode):
+                reported.add(i)
+                self.progress.emit(i, exitCode)
+            try:
+                session = getSession()
+                if session['status'] != '200 OK':
+                    raise RuntimeError("Opensubtitles.org servers refused the connection: " + session['status'])
+                bulk = bulkDownload(session['token'])
+                positions = {}
+                heldRows = {}
+                for i, row in enumerate(self.rows):
+                    if row['choice'] >= 0:
+                        subtitle = row['candidates'][row['choice']]
+                        languageSuffix = (opt_language_suffix == 'on') or (opt_language_suffix == 'auto' and (row['lists'] > 1 or bool(row['languages'])))
+                        positions[id(row)] = i
+                        pending = len(bulk.pending)
+                        exitCode = fetchSubtitles(row, subtitle, subtitle['MovieName'], languageSuffix, downloadSubtitles, bulk)
+                        if row.get('held'): # near the download limit, nothing written yet
+                            heldRows[row['held'][-1]] = i
+                            self.queued.emit(i)
+                        elif len(bulk.pending) == pending: # not downloaded with the others (local store)
+                            progress(i, exitCode)
+                bulk.run(lambda row, exitCode: progress(positions[id(row)], exitCode), max(1, opt_batch_workers))
+                # Send the downloads held near the download limit, highest priority first
+                # (the rows of the downloads queued for the next runs stay queued)
+                def report(subtitles, exitCode):
+                    i = heldRows[subtitles['subPath']]
+                    if exitCode == 0: # for the copies of the video
+                        self.rows[i].setdefault('subtitles', []).append(subtitles['subPath'])
+                    progress(i, exitCode)
+                self.held = quota.release(downloadSubtitles, report)
+            except RuntimeError as e:
+                self.fail(str(e), reported)
+            except Exception:
+                self.fail("Unable to reach opensubtitles.org servers!\n<b>Download error</b>", reported)
+            finally:
+                self.finished.emit()
+
+        def fail(self, message, reported):
+            """Report an error (shown once the window is closed), and the rows not downloaded because of it"""
+            superPrint("error", "Download error!", message)
+            for i, row in enumerate(self.rows):
+                if row['choice'] >= 0 and i not in reported:
+                    self.progress.emit(i, 2)
+
+    class batchWindow(QtWidgets.QDialog):
+        def __init__(self,parent=None):
+            super(batchWindow,self).__init__(parent)
+            self.setWindowTitle('Subtitles available!')
+            self.setWindowIcon(QtGui.QIcon.fromTheme("document-properties"))
+            self.resize(860, 420)
+
+            self.vBox = QtWidgets.QVBoxLayout() # Main vertical layout
+
+            self.helpLabel = QtWidgets.QLabel("Subtitles selected for each video (double click to choose other subtitles):")
+
+            # Table containing one row per video (and per list of languages)
+            self.model = batchModel()
+            self.delegate = batchDelegate(self)
+            self.batchTable = QtWidgets.QTableView()
+            self.batchTable.setModel(self.model)
+            self.batchTable.setItemDelegateForColumn(1, self.delegate)
+            self.batchTable.setShowGrid(False)   # Don't show the table grid
+            self.batchTable.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows) # selecting only rows
+            self.batchTable.setSelectionMode(QtWidgets.QAbstractItemView.SingleSelection)
+            self.batchTable.setEditTriggers(QtWidgets.QAbstractItemView.DoubleClicked | QtWidgets.QAbstractItemView.SelectedClicked | QtWidgets.QAbstractItemView.EditKeyPressed)
+            self.batchTable.setWordWrap(False)
+            self.batchTable.verticalHeader().setVisible(False)  # Don't print the lines number
+            # Fixed row heights and column widths: only the visible rows are ever rendered
+            self.batchTable.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+            self.batchTable.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Interactive)
+            self.batchTable.horizontalHeader().setSectionResizeMode(1, QtWidgets.QHeaderView.Stretch)
+            self.batchTable.setColumnWidth(0, 280)
+
+            # Progress of the searches, then of the downloads
+            self.progressBar = QtWidgets.QProgressBar(self)
+            self.progressBar.setRange(0,0)
+            self.progressBar.setMaximumHeight(12)
+            self.progressBar.setTextVisible(False)
+            self.statusLabel = QtWidgets.QLabel()
+            self.statusHBox = QtWidgets.QHBoxLayout()
+            self.statusHBox.addWidget(self.statusLabel)
+            self.statusHBox.addWidget(self.progressBar, 1)
+
+            # Create the buttons and connect them to the right function
+            self.settingsButton = QtWidgets.QPushButton("Settings",self)
+            self.settingsButton.clicked.connect(self.doConfig)
+            self.cancelButton = QtWidgets.QPushButton("Quit",self)
+            self.cancelButton.clicked.connect(self.doCancel)
+            self.okButton = QtWidgets.QPushButton("Download all",self)
+            self.okButton.setDefault(True)
+            self.okButton.setEnabled(False)
+            self.okButton.clicked.connect(self.doAccept)
+
+            # Put the bottom buttons in a H layout, Cancel and validate buttons are pushed to the bottom right corner
+            self.buttonHBox = QtWidgets.QHBoxLayout()
+            self.buttonHBox.addWidget(self.settingsButton)
+            self.buttonHBox.addStretch(1)
+            self.buttonHBox.addWidget(self.cancelButton)
+            self.buttonHBox.addWidget(self.okButton)
+
+            # Put the differents layouts in the main vertical one
+            self.vBox.addWidget(self.helpLabel)
+            self.vBox.addWidget(self.batchTable)
+            self.vBox.addLayout(self.statusHBox)
+            self.vBox.addLayout(self.buttonHBox)
+            self.setLayout(self.vBox)
+
+            self.next = False # Variable to know if we continue the script after this window
+            self.error = None
+            self.videos = 0
+            self.downloads = None
+
+        def startSearch(self, task):
+            """Fill the list with the rows sent by a batchSearchTask, as the searches complete"""
+            task.rows.connect(self.appendRows)
+            task.failed.connect(self.searchFailed)
+            task.finished.connect(self.searchFinished)
+            self.statusLabel.setText("Searching for subtitles...")
+            task.start()
+
+        def appendRows(self, rows):
+            if self.next:
+                return
+            self.model.appendRows(rows)
+            self.videos += 1
+            self.statusLabel.setText("Searching for subtitles... (" + str(self.videos) + " videos)")
+
+        def searchFinished(self):
+            if self.next:
+                return
+            self.progressBar.hide()
+            found = len(set(row['path'] for row in self.model.rows if row['candidates']))
+            self.statusLabel.setText("Subtitles found for " + str(found) + " of " + str(self.videos) + " videos" + \
+                                     (" (" + str(duplicates['videos']) + " copies of these videos will get the same subtitles)" if duplicates['videos'] else ""))
+            self.okButton.setEnabled(found > 0)
+
+        def searchFailed(self, message):
+            if self.next:
+                return
+            self.error = message
+            self.next = True
+            self.close()
+
+        def doAccept(self):
+            """Download the chosen subtitles of every video"""
+            self.okButton.setEnabled(False)
+            self.settingsButton.setEnabled(False)
+            self.batchTable.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+            self.downloads = batchDownloadTask(self.model.rows)
+            self.progressBar.setRange(0, sum(row['choice'] >= 0 for row in self.model.rows))
+            self.progressBar.setValue(0)
+            self.progressBar.show()
+            self.statusLabel.setText("Downloading subtitles...")
+            self.downloads.progress.connect(self.downloadProgress)
+            self.downloads.queued.connect(self.downloadQueued)
+            self.downloads.finished.connect(self.downloadsFinished)
+            self.downloads.start()
+
+        def downloadProgress(self, row, exitCode):
+            if self.model.rows[row]['status'] != "Queued": # already counted
+                self.progressBar.setValue(self.progressBar.value() + 1)
+            self.model.rows[row]['exitCode'] = exitCode
+            self.model.setStatus(row, "Error" if exitCode else "Done")
+
+        def downloadQueued(self, row):
+            self.model.setStatus(row, "Queued")
+            self.progressBar.setValue(self.progressBar.value() + 1)
+
+        def downloadsFinished(self):
+            self.next = True
+            self.close()
+
+        def doConfig(self):
+            spawnSettingsWindow()
+
+        def doCancel(self):
+            sys.exit(0)
 
-def downloadQt(subtitleURL,subtitlePath):
-    gui = downloadWindow(subtitleURL,subtitlePath)
+        def keyPressEvent(self, event): # Handle escape button (enter starts editing the choice)
+            if event.key() == QtCore.Qt.Key_Escape:
+                sys.exit(0)
+
+        def closeEvent(self,event):
+            if not self.next: # If not "Download all" clicked..
+                sys.exit(0)
+
+def reviewBatch(videoPaths):
+    """Search for the subtitles of a batch of videos (lazy iterator), let the user review
+    the automatic choices in a single window, then download them all.
+    Return a dictionary with the exit code of each video path"""
+    loadQt()
+    gui = batchWindow()
+    task = batchSearchTask(videoPaths)
+    start = metricsStart()
+    gui.startSearch(task)
     gui.exec_()
+    task.cancelled = True
+    metricsStage('select', start, videos=gui.videos, results=sum(len(row['candidates']) for row in gui.model.rows))
+
+    if gui.error:
+        superPrint("error", "Connection error!", gui.error + "\n\nPlease check:\n- Your Internet connection status\n- www.opensubtitles.org availability\n- Your downloads limit (200 subtitles per 24h)\n\nThe subtitles search and download service is powered by opensubtitles.org. Be sure to donate if you appreciate the service provided!")
+        sys.exit(2)
+    task.thread.join()
+    if gui.downloads:
+        gui.downloads.thread.join()
+
+    # Videos without any downloaded subtitles: 1, any download error: 2
+    exitCodes = task.exitCodes
+    downloaded = {}
+    subPaths = {}
+    for row in gui.model.rows:
+        if 'exitCode' in row:
+            downloaded[row['path']] = max(downloaded.get(row['path'], 0), row['exitCode'])
+        subPaths.setdefault(row['path'], []).extend(row.get('subtitles', []))
+    for videoPath in exitCodes:
+        if exitCodes[videoPath] != 2:
+            exitCodes[videoPath] = downloaded.get(videoPath, 1)
+    for videoPath, videoExitCode in (gui.downloads.held if gui.downloads else {}).items():
+        exitCodes[videoPath] = max(exitCodes.get(videoPath, 0), videoExitCode)
+
+    # The copies of a video get its subtitles
+    for videoPath, copyPaths in task.copies.items():
+        for copyPath in copyPaths:
+            exitCodes[copyPath] = copyVideoSubtitles(videoPath, copyPath, exitCodes.get(videoPath, 2), subPaths.get(videoPath, []))
+
+    return exitCodes
+
+# ==== Download ================================================================
+# Every file is written into a temporary file of the destination directory, then
+# renamed once complete: an interrupted write never leaves a partial file.
+
+@contextlib.contextmanager
+def atomicPath(path):
+    """Give a temporary path next to path, renamed into path once the block ends,
+    or removed if the block raises an error (raised again)"""
+    tmpPath = path + "." + str(os.getpid()) + "-" + str(threading.get_ident()) + ".part"
+    try:
+        yield tmpPath
+        os.replace(tmpPath, path)
+    except BaseException:
+        try:
+            os.remove(tmpPath)
+        except OSError:
+            pass
+        raise
+
+def downloadSubtitles(subtitleURL, subtitlePath, subtitleSize=None, progress=None):
+    """Download and unzip subtitles, without any GUI (used by the batch workers).
+    The subtitles are decompressed while they are received, into a temporary file
+    in the destination directory that is renamed once complete (and checked against
+    the size from the search results). Progress is reported with progress(done, total)"""
+    total = int(subtitleSize or 0)
 
-    if os.path.isfile(subtitlePath):
+    try:
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) # gzip
+        with atomicPath(subtitlePath) as tmpPath, open(tmpPath, 'wb') as tmpFile:
+
+            def write(chunk):
+                tmpFile.write(decompressor.decompress(chunk))
+                if progress:
+                    progress(tmpFile.tell(), total)
+
+            httpGet(subtitleURL, write)
+            tmpFile.write(decompressor.flush())
+            if not decompressor.eof:
+                raise IOError("Truncated subtitles file")
+            if total and tmpFile.tell() != total:
+                raise IOError("Subtitles file size mismatch")
         return 0
-    else:
-        return 1
 
-# ==== Exit codes ==============================================================
+    except Exception:
+        return 1
 
-# Exit code returned by the software. You can use them to improve scripting behaviours.
-# 0: Success, and subtitles downloaded
-# 1: Success, but no subtitles found
-# 2: Failure
+# ==== Subtitles store =========================================================
+# Every downloaded subtitles is also kept (gzip compressed) in a local store, named
+# by its subtitles file ID and the MD5 of its content (SubHash), so the same file
+# is never downloaded twice: not after deleting a folder, nor for another copy of
+# a video, nor by another computer sharing the store directory (opt_store_path).
+# The least recently used files are removed above opt_store_size MB.
+
+storepath = ""
+storeLock = threading.Lock()
+storeSize = None # size of the store in bytes, computed on the first write
+
+def storeFile(subtitle):
+    """Path of the subtitles in the store, or None if it can't be stored"""
+    subID = str(subtitle.get('IDSubtitleFile') or '')
+    subHash = str(subtitle.get('SubHash') or '').lower()
+    if not storepath or opt_store_size <= 0 or not subID.isdigit() or not re.fullmatch('[0-9a-f]{32}', subHash):
+        return None
+    return os.path.join(storepath, subID[-2:], subID + "-" + subHash + ".gz")
+
+def storeFetch(subtitle, subtitlePath):
+    """Write the subtitles from the store (checking its MD5) and return True,
+    or return False if it isn't in the store"""
+    blobPath = storeFile(subtitle)
+    if not blobPath or not os.path.isfile(blobPath):
+        return False
+    try:
+        md5 = hashlib.md5()
+        with atomicPath(subtitlePath) as tmpPath:
+            with open(tmpPath, 'wb') as tmpFile:
+                try:
+                    with gzip.open(blobPath, 'rb') as blob:
+                        for chunk in iter(lambda: blob.read(65536), b''):
+                            md5.update(chunk)
+                            tmpFile.write(chunk)
+                except (EOFError, zlib.error, gzip.BadGzipFile):
+                    pass
+            if md5.hexdigest() != subtitle['SubHash'].lower():
+                os.remove(blobPath) # Corrupted file
+                raise IOError("Corrupted subtitles file in the store")
+        os.utime(blobPath) # most recently used
+        return True
+    except (OSError, IOError):
+        return False
 
-ExitCode = 2
+def storePut(subtitle, subtitlePath):
+    """Add downloaded subtitles to the store, if its content matches its MD5"""
+    global storeSize
+    blobPath = storeFile(subtitle)
+    if not blobPath or os.path.isfile(blobPath):
+        return
+    try:
+        with open(subtitlePath, 'rb') as f:
+            data = f.read()
+        if hashlib.md5(data).hexdigest() != subtitle['SubHash'].lower():
+            return
+        os.makedirs(os.path.dirname(blobPath), exist_ok=True)
+        with atomicPath(blobPath) as tmpPath, open(tmpPath, 'wb') as tmpFile:
+            tmpFile.write(gzip.compress(data, 9))
+        with storeLock:
+            if storeSize is None:
+                storeSize = sum(size for path, size, mtime in storeFiles())
+            else:
+                storeSize += os.path.getsize(blobPath)
+            if storeSize > opt_store_size * 1024 * 1024:
+                storeEvict()
+    except (OSError, IOError):
+        pass
+
+def storeFiles():
+    """List the (path, size, modification time) of every file of the store"""
+    files = []
+    for directory in os.scandir(storepath):
+        if directory.is_dir():
+            for entry in os.scandir(directory.path):
+                if entry.name.endswith('.gz'):
+                    st = entry.stat()
+                    files.append((entry.path, st.st_size, st.st_mtime))
+    return files
+
+def storeEvict():
+    """Remove the least recently used files, down to 90% of the maximum size of the store"""
+    global storeSize
+    files = sorted(storeFiles(), key=lambda file: file[2])
+    storeSize = sum(size for path, size, mtime in files)
+    for path, size, mtime in files:
+        if storeSize <= opt_store_size * 1024 * 1024 * 0.9:
+            break
+        try:
+            os.remove(path)
+            storeSize -= size
+        except OSError:
+            pass
 
-# ==== Main program (execution starts here) ====================================
-# ==============================================================================
+# ==== Bulk download ===========================================================
+# The subtitles selected for several videos are downloaded together: one
+# DownloadSubtitles call for each chunk of bulkChunkSize files (returning base64
+# encoded gzip payloads), instead of one HTTP request for each download link.
+# The download links are only used for the files missing from the answer.
 
-Application = QtWidgets.QApplication(sys.argv)
+bulkChunkSize = 20
 
-# ==== Choose a conf file and launch configuration window if it does not exists
-if os.getenv("XDG_CONFIG_HOME"):
-    confdir = os.path.join(os.getenv("XDG_CONFIG_HOME"), "OpenSubtitlesDownload")
-    confpath = os.path.join(confdir, "OpenSubtitlesDownload.conf")
-else:
-    confdir = os.path.join(os.getenv("HOME"), ".config/OpenSubtitlesDownload/")
-    confpath = os.path.join(confdir, "OpenSubtitlesDownload.conf")
+def writeSubtitlesPayload(payload, subtitlePath, subtitleSize=None):
+    """Decode and decompress a DownloadSubtitles payload (base64 encoded gzip) chunk by chunk,
+    into a temporary file renamed once complete. Return 0, or 1 on error"""
+    total = int(subtitleSize or 0)
 
-if not os.path.isfile(confpath): # Config file not found, call config window
     try:
-        os.stat(confdir)
-    except:
-        os.mkdir(confdir) # Create the conf folder if it doesn't exists
-
-    spawnSettingsWindow()
+        if re.search(r'\s', payload):
+            payload = "".join(payload.split()) # the base64 payload may be split into lines
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) # gzip
+        with atomicPath(subtitlePath) as tmpPath, open(tmpPath, 'wb') as tmpFile:
+            for start in range(0, len(payload), 65536): # multiple of 4: whole base64 blocks
+                tmpFile.write(decompressor.decompress(binascii.a2b_base64(payload[start:start + 65536])))
+            tmpFile.write(decompressor.flush())
+            if not decompressor.eof:
+                raise IOError("Truncated subtitles file")
+            if total and tmpFile.tell() != total:
+                raise IOError("Subtitles file size mismatch")
+        return 0
 
-    if not os.path.isfile(confpath): # Config file not created -> exit
-        sys.exit(ExitCode)
-else:
-    # Load settings
-    if not readSettings():
-        spawnSettingsWindow()
-
-# ==== Argument parsing
-
-# Get OpenSubtitlesDownloadQt.py script path
-execPath = sys.executable
-scriptPath = str(sys.argv[0])
-
-# Setup ArgumentParser
-parser = argparse.ArgumentParser(prog='OpenSubtitlesDownloadQt.py',
-                                 description='This software is designed to help you find and download subtitles for your favorite videos!',
-                                 formatter_class=argparse.RawTextHelpFormatter)
-
-parser.add_argument('-s', '--search', help="Search mode: hash, filename, hash_then_filename, hash_and_filename (default: hash_then_filename)")
-parser.add_argument('-t', '--select', help="Selection mode: manual, default, auto")
-parser.add_argument('-a', '--auto', help="Force automatic selection and download of the best subtitles found", action='store_true')
-parser.add_argument('-l', '--lang', help="Specify the language in which the subtitles should be downloaded (default: eng).\nSyntax:\n-l eng,fre: search in both language\n-l eng -l fre: download both language", nargs='?', action='append')
-
-parser.add_argument('filePathListArg', help="The video file(s) for which subtitles should be searched and downloaded", nargs='+')
-
-# Only use ArgumentParser if we have arguments...
-if len(sys.argv) > 1:
-    result = parser.parse_args()
-
-# ==== Get valid video paths
-
-videoPathList = []
-
-if 'result' in locals():
-    # Go through the paths taken from arguments, and extract only valid video paths
-    for i in result.filePathListArg:
-        filePath = os.path.abspath(i)
-        if os.path.isdir(filePath):
-            # If it is a folder, check all of its files
-            for item in os.listdir(filePath):
-                localPath = os.path.join(filePath, item)
-                if checkFileValidity(localPath):
-                    videoPathList.append(localPath)
-        elif checkFileValidity(filePath):
-            # If it is a valid file, use it
-            videoPathList.append(filePath)
-else:
-    superPrint("error", "No file provided!", "No file provided!")
-    sys.exit(2)
+    except (OSError, IOError, ValueError, zlib.error):
+        return 1
 
-# ==== Instances dispatcher
+def downloadSubtitlesBulk(token, downloads):
+    """Download a chunk of subtitles (dictionaries with 'id', 'url', 'subPath' and 'size') with
+    a single DownloadSubtitles call, then use the download links of the files missing from the
+    answer. Return the list of exit codes (0, or 1 on error), in the same order"""
+    start = metricsStart()
+    try:
+        answer = getServer().DownloadSubtitles(token, list(dict.fromkeys(download['id'] for download in downloads)))
+        payloads = {str(item['idsubtitlefile']): item['data'] for item in answer.get('data') or []} if answer.get('status', '').startswith('200') else {}
+    except Exception:
+        payloads = {}
+
+    exitCodes = []
+    fallbacks = 0
+    for download in downloads:
+        payload = payloads.get(str(download['id']))
+        exitCode = 1 if payload is None else writeSubtitlesPayload(payload, download['subPath'], download['size'])
+        if exitCode != 0:
+            # Fall back to the download link of this file
+            fallbacks += 1
+            exitCode = downloadSubtitles(download['url'], download['subPath'], download['size'])
+        exitCodes.append(exitCode)
+
+    metricsStage('download', start, files=len(downloads), fallbacks=fallbacks, status=max(exitCodes, default=0))
+    return exitCodes
+
+class bulkDownload():
+    """Subtitles selected for several videos, downloaded together by run()"""
+
+    def __init__(self, token):
+        self.token = token
+        self.pending = [] # (video, subtitle, subtitles path, video title)
+
+    def add(self, video, subtitle, subPath, videoTitle):
+        self.pending.append((video, subtitle, subPath, videoTitle))
+
+    def run(self, report, workers=1):
+        """Download every pending subtitles, by chunks (using a pool of worker threads if
+        workers > 1), calling report(video, exitCode) for each of them (0, or 2 on error)"""
+        pending, self.pending = self.pending, []
+        chunks = [pending[i:i + bulkChunkSize] for i in range(0, len(pending), bulkChunkSize)]
+
+        def fetch(chunk):
+            downloads = [{'id': subtitle['IDSubtitleFile'], 'url': subtitle['SubDownloadLink'], 'subPath': subPath, 'size': subtitle.get('SubSize')}
+                         for video, subtitle, subPath, videoTitle in chunk]
+            for (video, subtitle, subPath, videoTitle), exitCode in zip(chunk, downloadSubtitlesBulk(self.token, downloads)):
+                if exitCode == 0:
+                    storePut(subtitle, subPath)
+                    video.setdefault('subtitles', []).append(subPath)
+                else:
+                    superPrint("error", "Subtitling error!", "An error occurred while downloading or writing <b>" + subtitle['LanguageName'] + "</b> subtitles for <b>" + videoTitle + "</b>.")
+                    video['error'] = 'download'
+                    exitCode = 2
+                report(video, exitCode)
+
+        if workers > 1 and len(chunks) > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(fetch, chunks))
+        else:
+            for chunk in chunks:
+                fetch(chunk)
 
-# If videoPathList is empty, abort!
-if len(videoPathList) == 0:
-    parser.print_help()
-    sys.exit(1)
+# ==== Qt download window, thread and function =================================
 
-# Check if the subtitles exists videoPathList
-if opt_search_overwrite == 'off':
-    videoPathList = [path for path in videoPathList if not checkSubtitlesExists(path)]
+def loadDownloadWindow():
+    global downloadWindow, downloadThread
+
+    class downloadWindow(QtWidgets.QDialog):
+        def __init__(self,subtitleURL,subtitlePath,subtitleSize,parent=None):
+            super(downloadWindow,self).__init__(parent)
+            QtWidgets.QMainWindow.__init__(self)
+            self.setWindowTitle('OpenSubtitlesDownload: Downloading ...')
+            self.setWindowIcon(QtGui.QIcon.fromTheme("document-properties"))
+            self.resize(380,90)
+
+            # Create a progress bar and a label, add them to the main vertical layout
+            self.vBox = QtWidgets.QVBoxLayout()
+            self.progressBar = QtWidgets.QProgressBar(self)
+            self.progressBar.setRange(0,0)
+            self.vBox.addWidget(self.progressBar)
+            self.label = QtWidgets.QLabel("Please wait while the subtitles are being downloaded")
+            self.label.setAlignment(QtCore.Qt.AlignCenter)
+            self.vBox.addWidget(self.label)
+            self.setLayout(self.vBox)
+
+            def onProgress(done, total):
+                if total > 0: # otherwise, keep the progress bar indeterminate
+                    self.progressBar.setRange(0,total)
+                    self.progressBar.setValue(min(done,total))
+
+            def onFinished():
+                self.progressBar.setRange(0,1)
+                self.close()
+
+            # Initiate the dowloading task in a thread
+            self.task = downloadThread(subtitleURL, subtitlePath, subtitleSize)
+            self.task.progress.connect(onProgress)
+            self.task.finished.connect(onFinished)
+            self.task.start()
+
+    # Thread for downloading the sub, emitting its progress, and when done emit the signal to close the window
+    class downloadThread(QtCore.QThread):
+        progress = QtCore.pyqtSignal(int, int)
+
+        def __init__(self, subtitleURL, subtitlePath, subtitleSize, parent=None):
+            super(downloadThread,self).__init__(parent)
+            self.subURL = subtitleURL
+            self.subPath = subtitlePath
+            self.subSize = subtitleSize
+            self.result = 1
+            self.bytesReceived = 0
+
+        def run(self):
+            metricsStart()
+            self.result = downloadSubtitles(self.subURL, self.subPath, self.subSize, self.progress.emit)
+            self.bytesReceived = getattr(metricsLocal, 'bytesReceived', 0)
+
+def downloadQt(subtitleURL,subtitlePath,subtitleSize=None):
+    loadQt()
+    gui = downloadWindow(subtitleURL,subtitlePath,subtitleSize)
+    gui.exec_()
+    gui.task.wait()
+    metricsCount('bytesReceived', gui.task.bytesReceived)
 
-    # If videoPathList is empty, exit!
-    if len(videoPathList) == 0:
-        sys.exit(1)
+    return gui.task.result
 
-# The first video file will be processed by this instance
-videoPath = videoPathList[0]
-videoPathList.pop(0)
+# ==== Session =================================================================
+# The session token is saved next to the config file and shared by every instance
+# of this software (using a lock file), so a new LogIn is only needed when the
+# server rejects the saved token. Tokens expire after 15 minutes without requests.
 
-# The remaining file(s) are dispatched to new instance(s) of this script
-for videoPathDispatch in videoPathList:
+sessionpath = ""
+sessionTimeout = 15 * 60
+sessionLock = threading.Lock()
+sharedSession = None
 
-    # Handle current options
-    command = sys.executable + " " + scriptPath + " -s " + opt_search_mode + " -t " + opt_selection_mode
-    if not (len(opt_languages) == 1 and opt_languages[0] == 'eng'):
-        for resultlangs in opt_languages:
-            command += " -l " + resultlangs
+def logIn():
+    """Log in to opensubtitles.org, retry once if the server is momentary overloaded"""
+    try:
+        return getServer().LogIn(osd_username, osd_password, "en", 'opensubtitles-download 5.0')
+    except Exception:
+        # Retry once, it could be a momentary overloaded server?
+        time.sleep(3)
+        metricsCount('retries')
+        return getServer().LogIn(osd_username, osd_password, "en", 'opensubtitles-download 5.0')
+
+def openSession():
+    """Reuse the saved session if the server still accepts its token (using a cheap
+    NoOperation call), otherwise log in. Raise an exception if the server can't be reached"""
+    lockFile = None
+    start = metricsStart()
+    try:
+        if sessionpath and fcntl:
+            lockFile = open(sessionpath + ".lock", 'w')
+            fcntl.flock(lockFile, fcntl.LOCK_EX)
 
-    # Split command string
-    command_splitted = command.split()
-    # The videoPath filename can contain spaces, but we do not want to split that, so add it right after the split
-    command_splitted.append(videoPathDispatch)
+        try:
+            with open(sessionpath) as f:
+                saved = json.load(f)
+        except (OSError, IOError, ValueError):
+            saved = {}
 
-    # Asynchronous dispatch
-    process_videoDispatched = subprocess.Popen(command_splitted)
+        if saved.get('username') == osd_username and time.time() - saved.get('used', 0) < sessionTimeout:
+            try:
+                if getServer().NoOperation(saved['token'])['status'] == '200 OK':
+                    session = {'status': '200 OK', 'token': saved['token'], 'created': saved.get('created', time.time())}
+                    saveSession(session)
+                    metricsStage('session', start, reused=True)
+                    return session
+            except Exception:
+                pass
+
+        session = logIn()
+        if session['status'] == '200 OK':
+            session['created'] = time.time()
+            saveSession(session)
+        metricsStage('session', start, reused=False, status=session['status'])
+        return session
+
+    finally:
+        if lockFile:
+            lockFile.close()
+
+def getSession():
+    """Open the session once, from any thread (used by the GUI worker threads), then share it"""
+    global sharedSession
+    with sessionLock:
+        if sharedSession is None or sharedSession['status'] != '200 OK':
+            sharedSession = openSession()
+        return sharedSession
+
+def saveSession(session):
+    """Save the session token, and the time of its last use, for the next instances"""
+    if not sessionpath:
+        return
+    try:
+        with atomicPath(sessionpath) as tmpPath, os.fdopen(os.open(tmpPath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+            json.dump({'username': osd_username, 'token': session['token'],
+                       'created': session.get('created', time.time()), 'used': time.time()}, f)
+    except (OSError, IOError):
+        pass
+
+# ==== Download quota ==========================================================
+# opensubtitles.org allows opt_download_limit subtitles downloads per 24 hours to
+# each account (or IP address for anonymous users), and no more than 40 requests
+# per 10 seconds. Every download and search is logged into the local cache, so
+# the rolling 24 hours counts are shared by every run, and every request sent to
+# the servers (XML-RPC calls and download links, see the connection pool) is rate
+# limited by a token bucket (opt_search_rate requests per second, in bursts of
+# at most opt_search_burst requests): burst + 10 x rate must stay under 40.
+#
+# Downloads are sent right away while the quota is far from its limit. Once fewer
+# than opt_download_reserve downloads remain, they are held until the end of the
+# batch, so the highest priority ones (first languages, then first videos) are
+# downloaded first. The downloads that would exceed the limit are queued into
+# the local cache, and sent by the next runs.
+
+class quotaScheduler():
+    """Rolling counts of the downloads and searches of the account, search rate limiting,
+    and queue of the downloads held back by the download limit"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.downloads = None # times of the downloads of the last 24 hours
+        self.searches = 0 # number of searches of the last 24 hours
+        self.tokens = None # token bucket of the requests, full before the first request
+        self.tokensTime = 0
+        self.held = [] # (priority, subtitles) held until the end of the batch
+        self.queued = 0 # number of downloads queued for the next runs
+        self.delivered = set() # paths of the subtitles written by the downloads queued by the previous runs
+
+    def load(self):
+        """Load the counts of the last 24 hours from the local cache, once (the caller must hold the lock)"""
+        if self.downloads is not None:
+            return
+        self.downloads = collections.deque()
+        if localCache is None:
+            return
+        with localCacheLock:
+            try:
+                for kind, when in localCache.execute("SELECT kind, time FROM requests WHERE username=? AND time>=? ORDER BY time",
+                                                     (osd_username, time.time() - 86400)):
+                    if kind == 'download':
+                        self.downloads.append(when)
+                    else:
+                        self.searches += 1
+            except sqlite3.Error:
+                pass
+
+    def log(self, kind):
+        """Log a request into the local cache"""
+        if localCache is not None:
+            with localCacheLock:
+                writeCache("INSERT INTO requests VALUES (?, ?, ?)", (osd_username, kind, time.time()))
+
+    def remaining(self):
+        """Number of downloads left in the rolling 24 hours window (the caller must hold the lock)"""
+        self.load()
+        while self.downloads and self.downloads[0] < time.time() - 86400:
+            self.downloads.popleft()
+        return opt_download_limit - len(self.downloads)
+
+    def request(self):
+        """Wait until a request can be sent to the servers, then count it in the token bucket"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if self.tokens is None:
+                    self.tokens = opt_search_burst
+                else:
+                    self.tokens = min(opt_search_burst, self.tokens + (now - self.tokensTime) * opt_search_rate)
+                self.tokensTime = now
+                if self.tokens >= 1 or opt_search_rate <= 0:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / opt_search_rate
+            # Do not hold the lock while waiting (requests of the other workers)
+            time.sleep(wait)
+
+    def search(self):
+        """Count a search request (rate limited by the connection pool, see request())"""
+        with self.lock:
+            self.load()
+            self.searches += 1
+        self.log('search')
+
+    def reserve(self, priority, subtitles):
+        """Count a download that can be sent right away and return True,
+        or hold it until the end of the batch (near the limit) and return False"""
+        with self.lock:
+            if self.remaining() - len(self.held) <= max(0, opt_download_reserve):
+                self.held.append((priority, subtitles))
+                return False
+            self.downloads.append(time.time())
+        self.log('download')
+        return True
 
-    # Do not spawn too many instances at the same time
-    time.sleep(0.33)
+    def release(self, download, report=None):
+        """Send the held downloads by order of priority, while the quota allows it, and
+        queue the others for the next runs. Call report(subtitles, exitCode) after each download
+        sent. Return a dictionary with the exit code of their videos"""
+        exitCodes = {}
+        with self.lock:
+            held = sorted(self.held, key=lambda item: item[0])
+            self.held = []
+
+        for priority, subtitles in held:
+            with self.lock:
+                allowed = self.remaining() > 0
+                if allowed:
+                    self.downloads.append(time.time())
+            if allowed:
+                self.log('download')
+                start = metricsStart()
+                exitCode = 0 if download(subtitles['url'], subtitles['subPath'], subtitles['size']) == 0 else 2
+                metricsStage('download', start, path=subtitles['path'], status=exitCode, held=True)
+                if report:
+                    report(subtitles, exitCode)
+            else:
+                self.queue(priority, subtitles)
+                exitCode = 2
+            exitCodes[subtitles['path']] = max(exitCodes.get(subtitles['path'], 0), exitCode)
 
-# The first video file will be processed by this instance
-videoPathList.clear()
-videoPathList.append(videoPath)
+        return exitCodes
 
-# ==== Search and download subtitles ===========================================
+    def queue(self, priority, subtitles):
+        """Save a download for the next runs"""
+        self.queued += 1
+        if localCache is None:
+            return False
+        with localCacheLock:
+            writeCache("INSERT OR REPLACE INTO queue VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (osd_username, subtitles['path'], subtitles['url'], subtitles['subPath'],
+                        subtitles['size'], priority[0], time.time()))
+        return True
 
-try:
-    # ==== Connection
+    def fetchQueued(self, download):
+        """Send the downloads queued by the previous runs, while the quota allows it (and drop
+        the ones written since by another run). Return a dictionary with the exit code of their videos"""
+        exitCodes = {}
+        if localCache is None:
+            return exitCodes
+        with self.lock:
+            count = self.remaining() - max(0, opt_download_reserve)
+        if count <= 0:
+            return exitCodes
+
+        with localCacheLock:
+            try:
+                rows = localCache.execute("SELECT path, url, subPath, size, created FROM queue WHERE username=? ORDER BY language, created LIMIT ?",
+                                          (osd_username, count)).fetchall()
+            except sqlite3.Error:
+                rows = []
+
+        for videoPath, url, subPath, size, created in rows:
+            with localCacheLock:
+                writeCache("DELETE FROM queue WHERE subPath=?", (subPath,))
+            if not os.path.isfile(videoPath):
+                continue # The video has been moved or deleted since
+            if os.path.isfile(subPath) and os.path.getmtime(subPath) > created:
+                continue # The subtitles have been downloaded since
+            with self.lock:
+                self.downloads.append(time.time())
+            self.log('download')
+            start = metricsStart()
+            exitCode = 0 if download(url, subPath, size) == 0 else 2
+            metricsStage('download', start, path=videoPath, status=exitCode, queued=True)
+            if exitCode == 0:
+                self.delivered.add(subPath)
+                journalDone(videoPath, 0)
+            exitCodes[videoPath] = max(exitCodes.get(videoPath, 0), exitCode)
+
+        return exitCodes
+
+quota = quotaScheduler()
+
+# ==== Batch engine ============================================================
+# Every video is processed by this instance, using a single session: a bounded
+# pool of worker threads hashes the videos and searches for their subtitles.
+# The workers also select and download the subtitles automatically, unless the
+# videos are reviewed in the batch review window (manual selection mode).
+
+serverLocal = threading.local()
+
+def getServer():
+    """Get an XML-RPC server proxy for the current thread (ServerProxy is not thread safe)"""
+    if threading.current_thread() is threading.main_thread():
+        return osd_server
+    if not hasattr(serverLocal, 'server'):
+        serverLocal.server = newServerProxy()
+    return serverLocal.server
+
+def searchSubtitles(token, searchList):
+    """Search for subtitles, retry once if the server is momentary overloaded"""
     try:
-        session = osd_server.LogIn(osd_username, osd_password, "en", 'opensubtitles-download 5.0')
+        quota.search()
+        return getServer().SearchSubtitles(token, searchList)
     except Exception:
-        # Retry once, it could be a momentary overloaded server?
+        # Retry once, we are already connected, the server is probably momentary overloaded
         time.sleep(3)
+        metricsCount('retries')
         try:
-            session = osd_server.LogIn(osd_username, osd_password, "en", 'opensubtitles-download 5.0')
+            quota.search()
+            return getServer().SearchSubtitles(token, searchList)
         except Exception:
-            superPrint("error", "Connection error!", "Unable to reach opensubtitles.org servers!\n\nPlease check:\n- Your Internet connection status\n- www.opensubtitles.org availability\n- Your downloads limit (200 subtitles per 24h)\n\nThe subtitles search and download service is powered by opensubtitles.org. Be sure to donate if you appreciate the service provided!")
-            sys.exit(2)
-
-    # Connection refused?
+            superPrint("error", "Search error!", "Unable to reach opensubtitles.org servers!\n<b>Search error</b>")
+
+    return {'status': 'Search error', 'data': False}
+
+def searchSubtitlesBatch(token, searchList):
+    """Search for subtitles using a list of queries packed into a single call,
+    then map the results back to their query (using QueryNumber or MovieHash).
+    Queries with cached results are not sent to the server.
+    Return a list of results, with the same format as the server, for each query
+    (with 'error' set to 'search' if the search failed)"""
+    start = metricsStart()
+    cachedList = [getCachedSearch(query) for query in searchList]
+    missedList = [i for i in range(len(searchList)) if cachedList[i] is None]
+    if not missedList:
+        metricsStage('search', start, queries=len(searchList), cacheHits=len(searchList))
+        return cachedList
+
+    queryList = [searchList[i] for i in missedList]
+    resultsList = [[] for query in queryList]
+
+    subtitlesList = searchSubtitles(token, queryList)
+    for subtitle in subtitlesList['data'] or []:
+        queryNumber = int(subtitle.get('QueryNumber', -1))
+        if 0 <= queryNumber < len(queryList):
+            resultsList[queryNumber].append(subtitle)
+        elif len(queryList) == 1:
+            resultsList[0].append(subtitle)
+        else:
+            for query, results in zip(queryList, resultsList):
+                if query.get('moviehash') == subtitle.get('MovieHash') and \
+                        subtitle['SubLanguageID'] in query['sublanguageid'].split(','):
+                    results.append(subtitle)
+                    break
+
+    failed = not subtitlesList.get('status', '').startswith('200')
+    for i, query, results in zip(missedList, queryList, resultsList):
+        cachedList[i] = {'data': results or False}
+        # Only cache valid answers from the server
+        if failed:
+            cachedList[i]['error'] = 'search'
+        else:
+            putCachedSearch(query, cachedList[i])
+
+    metricsStage('search', start, queries=len(searchList), cacheHits=len(searchList) - len(missedList), status=subtitlesList.get('status'))
+    return cachedList
+
+def newVideo(videoPath, videoHash, videoSize):
+    """Create the dictionary used to follow a video across the batch"""
+    return {'path': videoPath,
+            'hash': videoHash,
+            'size': videoSize,
+            'fileName': os.path.basename(videoPath),
+            'results': [],
+            'languages': pipedLanguages.get(videoPath), # searched instead of opt_languages
+            'exitCode': 2}
+
+def searchVideos(token, videos, fetch=True):
+    """Search for the subtitles of several videos, in every language (or only the languages missing
+    in an audit report), with as few calls as possible
+    (except the videos with subtitles already selected, by an interrupted batch), then
+    select and download their subtitles automatically if fetch is set"""
+    searching = [video for video in videos if not video.get('selected')]
+
+    # Search for available subtitles using file hash and size, for every video and language at once
+    searchList = []
+    owners = [] # video of each query
+    for video in searching:
+        for SubLanguageID in video.get('languages') or opt_languages:
+            searchList.append({'sublanguageid':SubLanguageID, 'moviehash':video['hash'], 'moviebytesize':str(video['size'])})
+            owners.append(video)
+    resultsList = searchSubtitlesBatch(token, searchList) if searchList else []
+
+    # No results using search by hash? Retry with filename
+    if opt_byname == 'on':
+        retryList = [i for i in range(len(searchList)) if not resultsList[i]['data']]
+        if retryList:
+            retrySearchList = []
+            for i in retryList:
+                retrySearchList.append({'sublanguageid':searchList[i]['sublanguageid'], 'query':owners[i]['fileName']})
+            for i, subtitlesList in zip(retryList, searchSubtitlesBatch(token, retrySearchList)):
+                if subtitlesList['data'] or not resultsList[i].get('error'): # keep the failed search by hash
+                    resultsList[i] = subtitlesList
+
+    start = 0
+    for video in searching:
+        count = len(video.get('languages') or opt_languages)
+        video['results'] = resultsList[start:start + count]
+        start += count
+        journalStage(video['path'], 'searched')
+
+    # Download the subtitles of every video right away, together
+    if fetch:
+        bulk = bulkDownload(token)
+        for video in videos:
+            fetchVideo(video, selectionAutoBatch, downloadSubtitles, bulk)
+
+        def report(video, exitCode):
+            video['exitCode'] = max(video['exitCode'], exitCode)
+        bulk.run(report)
+
+    return videos
+
+def searchVideoLanguages(video, report, cancelled=None):
+    """Search for the subtitles of a single video, in each language separately and
+    concurrently (by hash, then by filename), so that report(SubLanguageID, subtitlesList)
+    is called as soon as a language is done, slowest languages last.
+    Raise RuntimeError if the server refuses the connection"""
+    session = getSession()
     if session['status'] != '200 OK':
-        superPrint("error", "Connection error!", "Opensubtitles.org servers refused the connection: " + session['status'] + ".\n\nPlease check:\n- Your Internet connection status\n- www.opensubtitles.org availability\n- Your downloads limit (200 subtitles per 24h)\n\nThe subtitles search and download service is powered by opensubtitles.org. Be sure to donate if you appreciate the service provided!")
-        sys.exit(2)
+        raise RuntimeError("Opensubtitles.org servers refused the connection: " + session['status'])
+
+    if not video['hash']:
+        video['size'] = os.path.getsize(video['path'])
+        video['hash'] = hashFileCached(video['path'])
+
+    def searchLanguage(SubLanguageID):
+        if cancelled and cancelled():
+            return {'data': False}
+        subtitlesList = searchSubtitlesBatch(session['token'], [{'sublanguageid':SubLanguageID, 'moviehash':video['hash'], 'moviebytesize':str(video['size'])}])[0]
+        # No results using search by hash? Retry with filename
+        if not subtitlesList['data'] and opt_byname == 'on' and not (cancelled and cancelled()):
+            subtitlesList = searchSubtitlesBatch(session['token'], [{'sublanguageid':SubLanguageID, 'query':video['fileName']}])[0]
+        return subtitlesList
+
+    # One daemon thread per language: nobody waits for a search cancelled by the user
+    results = queue.Queue()
+    def run(SubLanguageID):
+        try:
+            results.put((SubLanguageID, searchLanguage(SubLanguageID), None))
+        except Exception as e:
+            results.put((SubLanguageID, None, e))
+
+    languages = list(getLanguageRanks())
+    for SubLanguageID in languages:
+        threading.Thread(target=run, args=(SubLanguageID,), daemon=True).start()
+    for i in range(len(languages)):
+        SubLanguageID, subtitlesList, error = results.get()
+        if error:
+            raise error
+        if cancelled and cancelled():
+            break
+        video['results'].append(subtitlesList)
+        report(SubLanguageID, subtitlesList)
+
+    return video
+
+def selectionAutoBatch(subtitlesList, videoTitle, videoFileName):
+    """Automatic subtitles selection, with the arguments of the selection of fetchVideo()"""
+    return selectionAuto(subtitlesList, videoFileName)
+
+reviewCandidates = 20 # best ranked subtitles kept for each result list of the batch review window
+reviewFields = ('SubFileName', 'SubLanguageID', 'LanguageName', 'ISO639', 'SubFormat', 'SubDownloadLink', 'SubSize', 'MatchedBy', 'MovieName',
+                'IDSubtitleFile', 'SubHash')
+
+def reviewVideo(video):
+    """Compact the results of a video for the batch review window: one row per result
+    list, holding its best ranked subtitles (only the fields needed to download them),
+    the automatic choice being selected. Return the list of rows"""
+    lists = [subtitlesList for subtitlesList in video['results'] if subtitlesList['data']]
+    rows = []
+    for subtitlesList in lists or [{'data': []}]:
+        ranking = selectionAutoRanking(subtitlesList, video['fileName'])[:reviewCandidates]
+        rows.append({'path': video['path'],
+                     'fileName': video['fileName'],
+                     'index': video.get('index', 0),
+                     'lists': len(lists),
+                     'languages': video.get('languages'),
+                     'candidates': [{field: subtitle.get(field) for field in reviewFields} for subtitle in ranking],
+                     'choice': 0 if ranking else -1,
+                     'status': ''})
+    return rows
+
+def subtitlesRoot(videoPath):
+    """Path of the subtitles of a video, without language code nor extension"""
+    # Escape non-alphanumeric characters from the subtitles path
+    return re.escape(videoPath.rsplit('.', 1)[0]).replace("\\", "")
+
+def fetchSubtitles(video, subtitle, videoTitle, languageSuffix, download, bulk=None):
+    """Download the subtitles selected for a video (with the language code in the file name
+    if languageSuffix is set), unless it is held by the download quota, or add it to a
+    bulkDownload (then run by the caller). The paths of the subtitles written are added to
+    video['subtitles'], the paths of the subtitles held to video['held']. Return 0, or 2 on error"""
+    subPath = subtitlesRoot(video['path']) + '.' + subtitle['SubFormat']
+
+    # Write language code into the filename?
+    if languageSuffix:
+        subPath = subtitlesRoot(video['path']) + "_" + subtitle['ISO639'] + '.' + subtitle['SubFormat']
+
+    # Subtitles just written by the downloads queued by the previous runs
+    if subPath in quota.delivered:
+        video.setdefault('subtitles', []).append(subPath)
+        return 0
+
+    # Subtitles already in the local store: no download, and no quota used
+    start = metricsStart()
+    if storeFetch(subtitle, subPath):
+        metricsStage('download', start, path=video['path'], status=0, store=True)
+        video.setdefault('subtitles', []).append(subPath)
+        return 0
 
-    # ==== Search and download subtitles
-    for videoPath in videoPathList:
+    # Near the download limit, the downloads are held until the end of the batch
+    subtitles = {'path': video['path'], 'url': subtitle['SubDownloadLink'], 'subPath': subPath, 'size': subtitle.get('SubSize')}
+    if not quota.reserve((languageRank(subtitle['SubLanguageID']), video.get('index', 0)), subtitles):
+        video.setdefault('held', []).append(subPath)
+        return 0
 
-        searchLanguage = 0
-        searchLanguageResult = 0
-        videoTitle = 'Unknown video title'
-        videoHash = hashFile(videoPath)
-        videoSize = os.path.getsize(videoPath)
-        videoFileName = os.path.basename(videoPath)
+    # Download it later, with the subtitles of the other videos
+    if bulk is not None and subtitle.get('IDSubtitleFile'):
+        bulk.add(video, subtitle, subPath, videoTitle)
+        return 0
 
-        # Count languages marked for this search
-        for SubLanguageID in opt_languages:
-            searchLanguage += len(SubLanguageID.split(','))
+    # Download and unzip the selected subtitles
+    start = metricsStart()
+    process_subtitlesDownload = download(subtitles['url'], subPath, subtitles['size'])
+    metricsStage('download', start, path=video['path'], status=process_subtitlesDownload)
+    if process_subtitlesDownload == 0:
+        storePut(subtitle, subPath)
+        video.setdefault('subtitles', []).append(subPath)
+
+    # If an error occurs, say so
+    if process_subtitlesDownload != 0:
+        superPrint("error", "Subtitling error!", "An error occurred while downloading or writing <b>" + subtitle['LanguageName'] + "</b> subtitles for <b>" + videoTitle + "</b>.")
+        video['error'] = 'download'
+        return 2
+
+    return 0
+
+def fetchVideo(video, selection, download, bulk=None):
+    """Select and download the subtitles found for a video (or add them to a bulkDownload),
+    then set its exit code (2 if the search failed for any of the languages)"""
+    searchLanguageResult = 0
+    searchFailed = False
+    videoTitle = 'Unknown video title'
+    selected = []
+
+    # Subtitles already selected by an interrupted batch: download them
+    if video.get('selected'):
+        video['exitCode'] = 0
+        for subtitle in video['selected']:
+            if fetchSubtitles(video, subtitle, subtitle['MovieName'], subtitle['languageSuffix'], download, bulk) != 0:
+                video['exitCode'] = 2
+                break
+        return video
+
+    # Filename may need string sanitizing to avoid dialog handling errors
+    videoFileName = video['fileName']
+    videoFileName = videoFileName.replace('"', '\\"')
+    videoFileName = videoFileName.replace("'", "\'")
+    videoFileName = videoFileName.replace('`', '\`')
+    videoFileName = videoFileName.replace("&", "&amp;")
+
+    for subtitlesList in video['results']:
+
+        # Parse the results of the XML-RPC query
+        if not subtitlesList['data']:
+            searchFailed = searchFailed or bool(subtitlesList.get('error'))
+            continue
+
+        # Mark search as successful
+        searchLanguageResult += 1
+        subtitlesSelected = ''
+
+        # If there is only one subtitles, auto-select it (only when matched by file hash)
+        if (len(subtitlesList['data']) == 1) and (subtitlesList['data'][0]['MatchedBy'] == 'moviehash'):
+            subtitlesSelected = subtitlesList['data'][0]['SubFileName']
+
+        # Get video title, it may need string sanitizing too
+        videoTitle = subtitlesList['data'][0]['MovieName']
+        videoTitle = videoTitle.replace('"', '\\"')
+        videoTitle = videoTitle.replace("'", "\'")
+        videoTitle = videoTitle.replace('`', '\`')
+        videoTitle = videoTitle.replace("&", "&amp;")
+
+        # If there is more than one subtitles, let the selection mode decide which one will be downloaded
+        if subtitlesSelected == '':
+            start = metricsStart()
+            subtitlesSelected = selection(subtitlesList, videoTitle, videoFileName)
+            metricsStage('select', start, path=video['path'], results=len(subtitlesList['data']))
+
+        # If a subtitles has been selected at this point, download it!
+        if subtitlesSelected:
+            subtitle = next((item for item in subtitlesList['data'] if item['SubFileName'] == subtitlesSelected), subtitlesList['data'][0])
+            languageSuffix = (opt_language_suffix == 'on') or (opt_language_suffix == 'auto' and (searchLanguageResult > 1 or bool(video.get('languages'))))
+            selected.append(dict({field: subtitle[field] for field in searchCacheFields if field in subtitle}, languageSuffix=languageSuffix))
+            if fetchSubtitles(video, subtitle, videoTitle, languageSuffix, download, bulk) != 0:
+                video['exitCode'] = 2
+                return video
+
+    # Every subtitles is selected (some may still be downloaded later)
+    if selected:
+        journalStage(video['path'], 'selected', selected=selected)
+
+    # Did we find subtitles, for any of the languages? (the failed searches are done again by the next runs)
+    if searchFailed:
+        video['exitCode'] = 2
+        video['error'] = 'search'
+    elif searchLanguageResult == 0:
+        video['exitCode'] = 1
+    else:
+        video['exitCode'] = 0
 
-        searchResultPerLanguage = [searchLanguage]
+    return video
 
-        # ==== Search for available subtitles using file hash and size
-        for SubLanguageID in opt_languages:
-            searchList = []
-            searchList.append({'sublanguageid':SubLanguageID, 'moviehash':videoHash, 'moviebytesize':str(videoSize)})
+duplicates = collections.Counter() # copies of videos found by the batches, and the calls they saved
+
+def copySubtitles(subPath, copyPath):
+    """Hardlink (or copy, across file systems) a subtitles file. Return 0, or 2 on error"""
+    try:
+        with atomicPath(copyPath) as tmpPath:
             try:
-                subtitlesList = osd_server.SearchSubtitles(session['token'], searchList)
-            except Exception:
-                # Retry once, we are already connected, the server is probably momentary overloaded
-                time.sleep(3)
-                try:
-                    subtitlesList = osd_server.SearchSubtitles(session['token'], searchList)
-                except Exception:
-                    superPrint("error", "Search error!", "Unable to reach opensubtitles.org servers!\n<b>Search error</b>")
-
-            # No results using search by hash? Retry with filename
-            if (not subtitlesList['data']) and (opt_byname == 'on'):
-                searchList = []
-                searchList.append({'sublanguageid':SubLanguageID, 'query':videoFileName})
+                os.link(subPath, tmpPath)
+            except OSError:
+                shutil.copyfile(subPath, tmpPath)
+        return 0
+    except (OSError, IOError):
+        return 2
+
+def copyVideoSubtitles(videoPath, copyPath, exitCode, subPaths):
+    """Give the subtitles of a video to a copy of this video, return the exit code of the copy"""
+    root = subtitlesRoot(videoPath)
+    copyRoot = subtitlesRoot(copyPath)
+    for subPath in subPaths:
+        if subPath.startswith(root):
+            exitCode = max(exitCode, copySubtitles(subPath, copyRoot + subPath[len(root):]))
+            duplicates['downloads'] += 1
+    return exitCode
+
+def processBatch(token, videoPaths, workers, review=None, copies=None):
+    """Process every video of the list (or lazy iterator) using bounded pools of worker threads:
+    the videos are hashed by the hashing stage, then searched by groups of
+    opt_search_batch. Copies of a video (same device and inode, then same hash and size)
+    are only processed once, then get the subtitles of the first one.
+    If set, review(video) is called with each searched video instead of selecting and
+    downloading its subtitles automatically, and the copies are added
+    to the copies dictionary (path -> paths of its copies) instead.
+    The stage reached by each video is written into the job journal (if used), and the
+    videos found in the journal of an interrupted batch resume from there.
+    Return a dictionary with the exit code of each video path"""
+    exitCodes = {}
+    hashed = []
+    pending = {}
+    order = {} # path -> position in the list, to download the subtitles of the first videos first
+    inodes = {} # (device, inode) -> path of the first video
+    hashes = {} # (hash, size) -> path of the first video
+    waiting = {} if copies is None else copies # path of a video -> paths of its copies, waiting for its subtitles
+    copyOf = {} # path of a copy -> path of the first video
+    processed = {} # path of a processed video -> (exit code, subtitles paths), for the copies found later
+    resumed = collections.deque() # (path, hash, size, selected subtitles) of the hashed videos of the journal
+    workers = max(1, workers)
+    batchSize = max(1, opt_search_batch)
+
+    def addCopy(videoPath, copyPath, hashed):
+        """Give the subtitles of a video to one of its copies (now, or once the video is processed),
+        with the copies of this copy (hardlinks found before it was hashed)"""
+        duplicates['videos'] += 1
+        duplicates['hashes'] += 0 if hashed else 1
+        duplicates['queries'] += len(opt_languages)
+        videoPath = copyOf.get(videoPath, videoPath)
+        for path in [copyPath] + waiting.pop(copyPath, []):
+            copyOf[path] = videoPath
+            if videoPath in processed:
+                exitCodes[path] = copyVideoSubtitles(videoPath, path, *processed[videoPath])
+                journalDone(path, exitCodes[path])
+            else:
+                waiting.setdefault(videoPath, []).append(path)
+
+    def finish(video):
+        """Set the exit code of a video, and of its copies"""
+        exitCodes[video['path']] = video['exitCode']
+        if copies is None:
+            # The downloads held by the download limit are only done at the end of the batch
+            if not video.get('held'):
+                journalDone(video['path'], video['exitCode'], video.get('error'))
+            processed[video['path']] = (video['exitCode'], video.get('subtitles', []))
+            for copyPath in waiting.pop(video['path'], []):
+                exitCodes[copyPath] = copyVideoSubtitles(video['path'], copyPath, *processed[video['path']])
+                journalDone(copyPath, exitCodes[copyPath])
+
+    def numbered(videoPaths):
+        """Remember the position of each video path in the list, skip the hardlinks of the previous videos,
+        and the videos of the journal that are done or hashed already"""
+        for position, videoPath in enumerate(videoPaths):
+            entry = None
+            try:
+                st = os.stat(videoPath)
+                entry = journalEntry(videoPath, st)
+                if entry and entry['exitCode'] in (0, 1):
+                    exitCodes[videoPath] = entry['exitCode']
+                    continue
+                if not entry:
+                    journalScanned(videoPath, st)
+                if (st.st_dev, st.st_ino) in inodes:
+                    addCopy(inodes[(st.st_dev, st.st_ino)], videoPath, False)
+                    continue
+                inodes[(st.st_dev, st.st_ino)] = videoPath
+            except OSError:
+                pass
+            order[videoPath] = position
+            if entry and entry['hash']:
+                resumed.append((videoPath, entry['hash'], entry['size'], entry['selected']))
+                continue
+            yield videoPath
+
+    def group(videoPath, videoHash, videoSize, selected=None):
+        """Add a hashed video to the next group of videos searched, unless it is a copy of a previous video"""
+        nonlocal hashed
+        # Another copy of a previous video?
+        if videoHash not in ('SizeError', 'IOError'):
+            if (videoHash, videoSize) in hashes:
+                addCopy(hashes[(videoHash, videoSize)], videoPath, True)
+                return
+            hashes[(videoHash, videoSize)] = videoPath
+        hashed.append(newVideo(videoPath, videoHash, videoSize))
+        hashed[-1]['index'] = order.pop(videoPath, 0)
+        if selected and not review:
+            hashed[-1]['selected'] = selected
+        if len(hashed) >= batchSize:
+            search(hashed)
+            hashed = []
+
+    def collect(timeout):
+        """Handle the searches that are done, wait at most timeout seconds"""
+        done, notDone = concurrent.futures.wait(pending, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            taskPaths = pending.pop(future)
+            try:
+                for video in future.result():
+                    if review:
+                        video['exitCode'] = review(video)
+                    finish(video)
+            except (OSError, IOError, RuntimeError, TypeError, NameError, KeyError):
+                print("Unexpected error while processing " + ", ".join(taskPaths) + ": " + str(sys.exc_info()[0]), file=sys.stderr)
+                for videoPath in taskPaths:
+                    finish({'path': videoPath, 'exitCode': 2, 'error': sys.exc_info()[0].__name__})
+
+    def search(videos):
+        """Search for subtitles for a group of videos, without queuing too many searches"""
+        while len(pending) >= workers * 2:
+            collect(None)
+        pending[pool.submit(searchVideos, token, videos, review is None)] = [video['path'] for video in videos]
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    try:
+        for videoPath, videoHash, videoSize in hashStream(numbered(videoPaths), workers):
+            if videoHash not in ('SizeError', 'IOError'):
+                journalStage(videoPath, 'hashed', hash=videoHash)
+            group(videoPath, videoHash, videoSize)
+            while resumed:
+                group(*resumed.popleft())
+            collect(0)
+        while resumed:
+            group(*resumed.popleft())
+
+        if hashed:
+            search(hashed)
+        while pending:
+            collect(None)
+    finally:
+        # Interrupted: let the running searches and downloads end while the journal is open
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    # Send the downloads held near the download limit, highest priority first
+    if not review:
+        for videoPath, videoExitCode in quota.release(downloadSubtitles).items():
+            exitCodes[videoPath] = max(exitCodes.get(videoPath, 0), videoExitCode)
+            journalDone(videoPath, exitCodes[videoPath])
+
+    # Copies of videos that never got an exit code (interrupted batch)
+    if copies is None:
+        for videoPath, copyPaths in waiting.items():
+            for copyPath in copyPaths:
+                exitCodes[copyPath] = exitCodes.get(videoPath, 2)
+                journalDone(copyPath, exitCodes[copyPath], 'interrupted')
+
+    return exitCodes
+
+# ==== Watch folders ===========================================================
+# In watch mode this software keeps running: the directory trees are watched for
+# new videos (using inotify on Linux, or by scanning them every opt_watch_interval
+# seconds), and each new video goes through the usual hashing, search, automatic
+# selection and download stages, using the same session.
+#
+# A video is only processed once it has been closed (or moved into the tree) and
+# its size and modification time did not change for opt_watch_settle seconds.
+# Only the videos being written and a bounded history of the processed videos
+# are kept in memory, and at most one batch of videos is processed at a time.
+
+def checkWatchedName(name, include, exclude):
+    """Check if a new file of a watched directory is a video to process (see scanVideos())"""
+    if exclude and any(fnmatch.fnmatch(name, pattern) for pattern in exclude):
+        return False
+    if include and not any(fnmatch.fnmatch(name, pattern) for pattern in include):
+        return False
+    return checkFileName(name)
+
+class inotifyWatcher():
+    """Watch directory trees using the Linux inotify API"""
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+    IN_ISDIR = 0x40000000
+
+    def __init__(self, paths, depth, include, exclude):
+        import ctypes
+        self.ctypes = ctypes
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.roots = paths
+        self.depth = depth
+        self.include = include
+        self.exclude = exclude
+        self.watches = {} # watch descriptor -> (directory, level)
+        self.directories = {} # directory -> watch descriptor
+        self.lastRead = time.time()
+        for path in self.roots:
+            self.addTree(path, 0)
+
+    def close(self):
+        os.close(self.fd)
+
+    def addTree(self, path, level, since=None):
+        """Watch a directory and its subdirectories, return the videos they already
+        contain (only the ones modified after since, if set)"""
+        videos = []
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE | self.IN_ONLYDIR
+        directories = [(path, level)]
+        while directories:
+            directory, level = directories.pop()
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+            if wd < 0:
+                error = self.ctypes.get_errno()
+                if error == 28: # ENOSPC
+                    raise OSError(error, "Too many watches, see /proc/sys/fs/inotify/max_user_watches")
+                continue
+            self.watches[wd] = (directory, level)
+            self.directories[directory] = wd
+
+            try:
+                with os.scandir(directory) as iterator:
+                    for entry in iterator:
+                        if entry.is_dir(follow_symlinks=False):
+                            if (self.depth < 0 or level < self.depth) and \
+                                    not (self.exclude and any(fnmatch.fnmatch(entry.name, pattern) for pattern in self.exclude)):
+                                directories.append((entry.path, level + 1))
+                        elif entry.is_file() and checkWatchedName(entry.name, self.include, self.exclude):
+                            if since is None or entry.stat().st_mtime >= since:
+                                videos.append(entry.path)
+            except OSError:
+                continue
+
+        return videos
+
+    def removeTree(self, path):
+        """Stop watching a directory (moved away) and its subdirectories"""
+        for directory in [directory for directory in self.directories
+                          if directory == path or directory.startswith(path + os.sep)]:
+            wd = self.directories.pop(directory)
+            del self.watches[wd]
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout):
+        """Wait at most timeout seconds for events, return the paths of the videos
+        created, written or moved into the watched directories"""
+        videos = []
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return videos
+        try:
+            data = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return videos
+
+        offset = 0
+        while offset + 16 <= len(data):
+            wd, mask, cookie, length = struct.unpack_from('iIII', data, offset)
+            name = os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b'\0'))
+            offset += 16 + length
+
+            if mask & self.IN_Q_OVERFLOW:
+                # Some events have been lost: look for the videos modified since the last read
+                for path in self.roots:
+                    videos.extend(self.addTree(path, 0, self.lastRead - opt_watch_settle))
+                continue
+            if wd not in self.watches:
+                continue
+            if mask & self.IN_IGNORED:
+                self.directories.pop(self.watches.pop(wd)[0], None)
+                continue
+
+            directory, level = self.watches[wd]
+            path = os.path.join(directory, name)
+            if mask & self.IN_ISDIR:
+                if mask & self.IN_MOVED_FROM:
+                    self.removeTree(path)
+                elif (self.depth < 0 or level < self.depth) and \
+                        not (self.exclude and any(fnmatch.fnmatch(name, pattern) for pattern in self.exclude)):
+                    videos.extend(self.addTree(path, level + 1))
+            elif not mask & self.IN_MOVED_FROM and checkWatchedName(name, self.include, self.exclude):
+                videos.append(path)
+
+        self.lastRead = time.time()
+        return videos
+
+class pollingWatcher():
+    """Watch directory trees by scanning them every opt_watch_interval seconds"""
+    def __init__(self, paths, depth, include, exclude):
+        self.roots = paths
+        self.depth = depth
+        self.include = include
+        self.exclude = exclude
+        self.files = self.scan()
+        self.nextScan = time.time() + opt_watch_interval
+
+    def close(self):
+        self.files = {}
+
+    def scan(self):
+        """Get the size and modification time of every video of the watched directories"""
+        files = {}
+        for videoPath in scanVideos(self.roots, self.depth, self.include, self.exclude):
+            try:
+                st = os.stat(videoPath)
+                files[videoPath] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                continue
+        return files
+
+    def read(self, timeout):
+        """Wait at most timeout seconds, return the paths of the videos created or
+        modified since the previous scan"""
+        time.sleep(max(0, min(timeout, self.nextScan - time.time())))
+        if time.time() < self.nextScan:
+            return []
+
+        files = self.scan()
+        videos = [videoPath for videoPath, state in files.items() if self.files.get(videoPath) != state]
+        self.files = files
+        self.nextScan = time.time() + opt_watch_interval
+        return videos
+
+def watchFolders(paths, depth=-1, include=None, exclude=None, poll=False):
+    """Watch directory trees, and search and download subtitles for the new videos once
+    they are completely written. Never returns (stop it with SIGINT or SIGTERM)"""
+    paths = [os.path.abspath(path) for path in paths if os.path.isdir(path)]
+    if not paths:
+        superPrint("error", "No directory provided!", "Watch mode needs at least one directory to watch.")
+        sys.exit(2)
+
+    watcher = None
+    if not poll:
+        try:
+            watcher = inotifyWatcher(paths, depth, include, exclude)
+        except (OSError, AttributeError) as e:
+            print("inotify is not available (" + str(e) + "), scanning the directories every " + str(opt_watch_interval) + " seconds instead", file=sys.stderr)
+    if watcher is None:
+        watcher = pollingWatcher(paths, depth, include, exclude)
+
+    pending = {} # path -> (time of the next check, size, modification time) of the videos being written
+    ready = collections.OrderedDict() # path -> (size, modification time) of the videos to process
+    processed = collections.OrderedDict() # path -> (size, modification time) of the last processed videos
+    retries = {} # path -> number of failed attempts
+    batchSize = max(1, opt_batch_workers) * max(1, opt_search_batch)
+    session = None
+    sessionUsed = 0
+    cacheOpened = time.time()
+
+    try:
+        while True:
+            # Wait for events, but not longer than the next check of the videos being written
+            timeout = opt_watch_interval
+            if ready:
+                timeout = 0
+            elif pending:
+                timeout = max(0, min(check for check, size, mtime in pending.values()) - time.time())
+            for videoPath in watcher.read(timeout):
+                pending[videoPath] = (time.time() + opt_watch_settle, -1, -1)
+                ready.pop(videoPath, None)
+
+            # A video is completely written once its size and modification time are stable
+            now = time.time()
+            for videoPath, (check, size, mtime) in list(pending.items()):
+                if check > now:
+                    continue
                 try:
-                    subtitlesList = osd_server.SearchSubtitles(session['token'], searchList)
-                except Exception:
-                    # Retry once, we are already connected, the server is probably momentary overloaded
-                    time.sleep(3)
-                    try:
-                        subtitlesList = osd_server.SearchSubtitles(session['token'], searchList)
-                    except Exception:
-                        superPrint("error", "Search error!", "Unable to reach opensubtitles.org servers!\n<b>Search error</b>")
+                    st = os.stat(videoPath)
+                except OSError:
+                    del pending[videoPath] # Deleted, or moved away
+                    continue
+                if (st.st_size, st.st_mtime_ns) == (size, mtime) and now - st.st_mtime >= opt_watch_settle:
+                    del pending[videoPath]
+                    if processed.get(videoPath) != (size, mtime):
+                        ready[videoPath] = (size, mtime)
+                else:
+                    pending[videoPath] = (now + opt_watch_settle, st.st_size, st.st_mtime_ns)
+
+            if not ready:
+                continue
+
+            # Process one batch of videos at a time
+            videoStates = {}
+            while ready and len(videoStates) < batchSize:
+                videoPath, state = ready.popitem(last=False)
+                videoStates[videoPath] = state
+
+            subtitlesIndexes.clear() # Subtitles may have been added since the directories were indexed
+            skippedList = []
+            videoPaths = list(videoStates)
+            if opt_search_overwrite == 'off':
+                videoPaths = list(skipSubtitlesExists(videoPaths, skippedList))
 
-            # Parse the results of the XML-RPC query
-            if subtitlesList['data']:
+            try:
+                # The session token expires after 15 minutes without requests, check it after a pause
+                if session is None or time.time() - sessionUsed > 60:
+                    session = openSession()
+                    if session['status'] != '200 OK':
+                        raise RuntimeError(session['status'])
+                exitCodes = quota.fetchQueued(downloadSubtitles)
+                for videoPath, videoExitCode in processBatch(session['token'], videoPaths, opt_batch_workers).items():
+                    exitCodes[videoPath] = max(exitCodes.get(videoPath, 0), videoExitCode)
+                sessionUsed = time.time()
+                saveSession(session)
+            except Exception as e:
+                print("Connection error (" + str(e) + "), retrying in " + str(opt_watch_interval) + " seconds", file=sys.stderr)
+                for videoPath in videoPaths:
+                    pending[videoPath] = (time.time() + opt_watch_interval, -1, -1)
+                session = None
+                continue
+
+            for videoPath in skippedList:
+                exitCodes[videoPath] = 0
+            for videoPath, videoExitCode in exitCodes.items():
+                print(str(videoExitCode) + " " + videoPath, flush=True)
+                if videoPath not in videoStates:
+                    continue # Queued download, from a previous batch
+
+                # Retry the failed videos a few times
+                if videoExitCode == 2 and retries.get(videoPath, 0) < 3:
+                    retries[videoPath] = retries.get(videoPath, 0) + 1
+                    pending[videoPath] = (time.time() + opt_watch_interval, -1, -1)
+                    continue
+                retries.pop(videoPath, None)
+                processed[videoPath] = videoStates[videoPath]
+                processed.move_to_end(videoPath)
+                if len(processed) > 4096:
+                    processed.popitem(last=False)
+
+            # Save the local cache, and evict its oldest entries from time to time
+            commitCache()
+            if time.time() - cacheOpened > 3600:
+                closeCache()
+                openCache()
+                cacheOpened = time.time()
+    finally:
+        watcher.close()
 
-                # Mark search as successful
-                searchLanguageResult += 1
-                subtitlesSelected = ''
+# ==== Exit codes ==============================================================
 
-                # If there is only one subtitles, auto-select it (only when matched by file hash)
-                if (len(subtitlesList['data']) == 1) and (subtitlesList['data'][0]['MatchedBy'] == 'moviehash'):
-                    subtitlesSelected = subtitlesList['data'][0]['SubFileName']
-
-                # Get video title
-                videoTitle = subtitlesList['data'][0]['MovieName']
-
-                # Title and filename may need string sanitizing to avoid dialog handling errors
-                videoTitle = videoTitle.replace('"', '\\"')
-                videoTitle = videoTitle.replace("'", "\'")
-                videoTitle = videoTitle.replace('`', '\`')
-                videoTitle = videoTitle.replace("&", "&amp;")
-                videoFileName = videoFileName.replace('"', '\\"')
-                videoFileName = videoFileName.replace("'", "\'")
-                videoFileName = videoFileName.replace('`', '\`')
-                videoFileName = videoFileName.replace("&", "&amp;")
-
-                # If there is more than one subtitles and opt_selection_mode != 'auto',
-                # then let the user decide which one will be downloaded
-                if subtitlesSelected == '':
-                    # Automatic subtitles selection?
-                    if opt_selection_mode == 'auto':
-                        subtitlesSelected = selectionAuto(subtitlesList)
-                    else:
-                        # Go through the list of subtitles and handle 'auto' settings activation
-                        for item in subtitlesList['data']:
-                            if opt_display_language == 'auto':
-                                if searchLanguage > 1:
-                                    opt_display_language = 'on'
-                            if opt_display_hi == 'auto':
-                                if item['SubHearingImpaired'] == '1':
-                                    opt_display_hi = 'on'
-                            if opt_display_rating == 'auto':
-                                if item['SubRating'] != '0.0':
-                                    opt_display_rating = 'on'
-                            if opt_display_count == 'auto':
-                                opt_display_count = 'on'
-
-                        # Spawn selection window:
-                        subtitlesSelected = selectionQt(subtitlesList)
-
-                # If a subtitles has been selected at this point, download it!
-                if subtitlesSelected:
-                    subIndex = 0
-                    subIndexTemp = 0
-
-                    # Select the subtitles file to download
-                    for item in subtitlesList['data']:
-                        if item['SubFileName'] == subtitlesSelected:
-                            subIndex = subIndexTemp
-                            break
-                        else:
-                            subIndexTemp += 1
-
-                    subLangId = "_"  + subtitlesList['data'][subIndex]['ISO639']
-                    subLangName = subtitlesList['data'][subIndex]['LanguageName']
-                    subURL = subtitlesList['data'][subIndex]['SubDownloadLink']
-                    subPath = videoPath.rsplit('.', 1)[0] + '.' + subtitlesList['data'][subIndex]['SubFormat']
-
-                    # Write language code into the filename?
-                    if ((opt_language_suffix == 'on') or
-                            (opt_language_suffix == 'auto' and searchLanguageResult > 1)):
-                        subPath = videoPath.rsplit('.', 1)[0] + subLangId + '.' + \
-                        subtitlesList['data'][subIndex]['SubFormat']
-
-                    # Escape non-alphanumeric characters from the subtitles path
-                    subPath = re.escape(subPath)
-
-                    # Download and unzip the selected subtitles (with progressbar)
-                    subPath = subPath.replace("\\", "")
-                    process_subtitlesDownload = downloadQt(subURL, subPath)
-
-                    # If an error occurs, say so
-                    if process_subtitlesDownload != 0:
-                        superPrint("error", "Subtitling error!", "An error occurred while downloading or writing <b>" + subtitlesList['data'][subIndex]['LanguageName'] + "</b> subtitles for <b>" + videoTitle + "</b>.")
-                        osd_server.LogOut(session['token'])
-                        sys.exit(2)
+# Exit code returned by the software. You can use them to improve scripting behaviours.
+# 0: Success, and subtitles downloaded
+# 1: Success, but no subtitles found
+# 2: Failure
+# When a batch of videos is processed, each video gets its own exit code (printed
+# on the standard output) and the batch returns the worst of them.
 
-            # Print a message if no subtitles have been found, for any of the languages
-            if searchLanguageResult == 0:
-                superPrint("info", "No subtitles available :-(", '<b>No subtitles found</b> for this video:\n<i>' + videoFileName + '</i>')
-                ExitCode = 1
-            else:
-                ExitCode = 0
+ExitCode = 2
+
+def batchExitCode(exitCodes):
+    """Combined exit code of a batch: the worst exit code of all its videos"""
+    return max(exitCodes.values(), default=1)
 
-except (OSError, IOError, RuntimeError, TypeError, NameError, KeyError):
+# ==== Main program (execution starts here) ====================================
+# ==============================================================================
 
-    # Do not warn about remote disconnection # bug/feature of python 3.5?
-    if "http.client.RemoteDisconnected" in str(sys.exc_info()[0]):
+if __name__ == "__main__":
+
+    # ==== Argument parsing
+
+    # Setup ArgumentParser
+    parser = argparse.ArgumentParser(prog='OpenSubtitlesDownloadQt.py',
+                                     description='This software is designed to help you find and download subtitles for your favorite videos!',
+                                     formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument('-s', '--search', help="Search mode: hash, filename, hash_then_filename, hash_and_filename (default: hash_then_filename)")
+    parser.add_argument('-t', '--select', help="Selection mode: manual, default, auto")
+    parser.add_argument('-a', '--auto', help="Force automatic selection and download of the best subtitles found", action='store_true')
+    parser.add_argument('-l', '--lang', help="Specify the language in which the subtitles should be downloaded (default: eng).\nSyntax:\n-l eng,fre: search in both language\n-l eng -l fre: download both language", nargs='?', action='append')
+    parser.add_argument('-r', '--refresh', help="Ignore the cached search results (they are still updated)", action='store_true')
+    parser.add_argument('-d', '--depth', help="Maximum depth of the subdirectories scanned for videos (default: no limit)", type=int, default=-1)
+    parser.add_argument('-i', '--include', help="Only search subtitles for the videos (found in directories) matching this pattern (ex: -i '*S01E*')", action='append')
+    parser.add_argument('-x', '--exclude', help="Skip the files and directories matching this pattern (ex: -x 'Sample*')", action='append')
+    parser.add_argument('-j', '--jobs', help="Maximum number of videos processed at the same time (default: " + str(opt_batch_workers) + ")", type=int)
+    parser.add_argument('--headless', help="Never use (nor load) the Qt GUI: messages are printed on stderr,\nand subtitles are selected automatically", action='store_true')
+    parser.add_argument('-w', '--watch', help="Keep running, and download subtitles for the new videos of the directories\n(implies --headless)", action='store_true')
+    parser.add_argument('--metrics', help="Write the time spent by each stage (and its bytes, retries and cache hits)\nas JSON lines into this file (or on stderr with '-')", metavar='FILE')
+    parser.add_argument('--poll', help="Watch mode: scan the directories periodically instead of using inotify\n(ex: for network shares)", action='store_true')
+    parser.add_argument('--audit', help="Print the videos missing subtitles in each language, as 'csv' or 'json',\nwithout any network access (the report can be piped into a download run,\nusing '-' as the file path)", choices=['csv', 'json'])
+    parser.add_argument('--resume', help="Resume the interrupted batch run with the same arguments: skip the videos already done,\nwithout hashing nor searching again the others (automatic selection mode)", action='store_true')
+
+    parser.add_argument('filePathListArg', help="The video file(s) for which subtitles should be searched and downloaded", nargs='+')
+
+    # Only use ArgumentParser if we have arguments...
+    if len(sys.argv) > 1:
+        result = parser.parse_args()
+        headless = result.headless or result.watch or bool(result.audit)
+
+    # ==== Choose a conf file and launch configuration window if it does not exists
+    if os.getenv("XDG_CONFIG_HOME"):
+        confdir = os.path.join(os.getenv("XDG_CONFIG_HOME"), "OpenSubtitlesDownload")
+        confpath = os.path.join(confdir, "OpenSubtitlesDownload.conf")
+    else:
+        confdir = os.path.join(os.getenv("HOME"), ".config/OpenSubtitlesDownload/")
+        confpath = os.path.join(confdir, "OpenSubtitlesDownload.conf")
+    cachepath = os.path.join(confdir, "cache.db")
+    sessionpath = os.path.join(confdir, "session.json")
+
+    if not os.path.isfile(confpath): # Config file not found, call config window
+        try:
+            os.stat(confdir)
+        except:
+            os.makedirs(confdir) # Create the conf folder if it doesn't exists
+
+        if not headless:
+            spawnSettingsWindow()
+
+        if not os.path.isfile(confpath) and not (headless and result.lang): # Config file not created -> exit
+            superPrint("error", "No settings!", "No settings file found: run OpenSubtitlesDownloadQt.py once without --headless, or use --lang")
+            sys.exit(ExitCode)
+    else:
+        # Load settings
+        if not readSettings() and not headless:
+            spawnSettingsWindow()
+
+    storepath = opt_store_path or os.path.join(confdir, "store")
+
+    # ==== Get valid video paths
+
+    if 'result' in locals():
+        # The paths read from stdin are part of the arguments of the job (see journalKey())
+        if '-' in result.filePathListArg:
+            stdinPaths = list(readVideoPaths(sys.stdin))
+            result.filePathListArg = [path for arg in result.filePathListArg for path in (stdinPaths if arg == '-' else [arg])]
+
+        # Go through the paths taken from arguments, and lazily extract only valid video paths
+        videoPathList = scanVideos(result.filePathListArg, result.depth, result.include, result.exclude)
+
+        # Arguments override the settings
+        if result.lang and any(result.lang):
+            opt_languages[:] = [languages for languages in result.lang if languages]
+        if result.auto or result.select == 'auto' or headless:
+            opt_selection_mode = 'auto'
+        elif result.select == 'manual':
+            opt_selection_mode = 'manual'
+        if result.jobs:
+            opt_batch_workers = result.jobs
+        localCacheRefresh = result.refresh
+
+        # Only the automatic batches use the job journal
+        if result.resume and (opt_selection_mode != 'auto' or result.watch or result.audit):
+            superPrint("error", "Invalid arguments!", "--resume only resumes a batch in automatic selection mode (--auto or --headless), not the selection windows, --watch nor --audit.")
+            sys.exit(2)
+
+        if result.metrics:
+            openMetrics(result.metrics)
+    else:
+        superPrint("error", "No file provided!", "No file provided!")
+        sys.exit(2)
+
+    # ==== Audit of the subtitles files, without network access
+
+    if result.audit:
+        try:
+            ExitCode = printAudit(auditVideos(result.filePathListArg, result.depth, result.include, result.exclude, opt_batch_workers), result.audit)
+        finally:
+            closeMetrics()
         sys.exit(ExitCode)
 
-    # An unknown error occur, let's apologize before exiting
-    superPrint("error", "Unexpected error!", "OpenSubtitlesDownloadQt encountered an <b>unknown error</b>, sorry about that...\n\n" + \
-               "Error: <b>" + str(sys.exc_info()[0]).replace('<', '[').replace('>', ']') + "</b>\n" + \
-               "Line: <b>" + str(sys.exc_info()[-1].tb_lineno) + "</b>\n\n" + \
-               "Just to be safe, please check:\n- www.opensubtitles.org availability\n- Your downloads limit (200 subtitles per 24h)\n- Your Internet connection status\n- That are using the latest version of this software ;-)")
+    # ==== Watch folders
+
+    if result.watch:
+        # Let SIGTERM save the local cache, like SIGINT does
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        openCache()
+        try:
+            watchFolders(result.filePathListArg, result.depth, result.include, result.exclude, result.poll)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            closeCache()
+            closeMetrics()
+        sys.exit(0)
+
+    # ==== Batch of videos
+
+    # If videoPathList is empty, abort!
+    firstVideoPath = next(videoPathList, None)
+    if firstVideoPath is None:
+        closeMetrics(files=0)
+        parser.print_help()
+        sys.exit(1)
+    videoPathList = itertools.chain([firstVideoPath], videoPathList)
+
+    # Check if the subtitles exists videoPathList
+    skippedList = []
+    if opt_search_overwrite == 'off':
+        videoPathList = skipSubtitlesExists(videoPathList, skippedList)
+
+    # ==== Search and download subtitles ===========================================
+
+    session = None
+    try:
+        if opt_selection_mode != 'auto' and not headless:
+            # ==== Selection windows opened right away, the connection and searches run in worker threads
+            openCache()
+            try:
+                # Send the downloads queued by the previous runs first (download limit)
+                for videoPath, videoExitCode in quota.fetchQueued(downloadQt).items():
+                    print(str(videoExitCode) + " " + videoPath)
+                exitCodes = processGui(videoPathList)
+            finally:
+                closeCache()
+                session = sharedSession
+        else:
+            # ==== Connection (or reuse of the previous session)
+            try:
+                session = openSession()
+            except Exception:
+                superPrint("error", "Connection error!", "Unable to reach opensubtitles.org servers!\n\nPlease check:\n- Your Internet connection status\n- www.opensubtitles.org availability\n- Your downloads limit (200 subtitles per 24h)\n\nThe subtitles search and download service is powered by opensubtitles.org. Be sure to donate if you appreciate the service provided!")
+                sys.exit(2)
+
+            # Connection refused?
+            if session['status'] != '200 OK':
+                superPrint("error", "Connection error!", "Opensubtitles.org servers refused the connection: " + session['status'] + ".\n\nPlease check:\n- Your Internet connection status\n- www.opensubtitles.org availability\n- Your downloads limit (200 subtitles per 24h)\n\nThe subtitles search and download service is powered by opensubtitles.org. Be sure to donate if you appreciate the service provided!")
+                sys.exit(2)
+
+            # ==== Search and download subtitles, for every video of the batch
+            # Let SIGTERM save the local cache and the job journal, like SIGINT does
+            signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(2))
+            openCache()
+            try:
+                openJournal(journalKey(result.filePathListArg, result.depth, result.include, result.exclude), result.resume)
+                # Send the downloads queued by the previous runs first (download limit)
+                for videoPath, videoExitCode in quota.fetchQueued(downloadSubtitles).items():
+                    print(str(videoExitCode) + " " + videoPath)
+                exitCodes = processBatch(session['token'], videoPathList, opt_batch_workers)
+            finally:
+                closeCache()
+        ExitCode = batchExitCode(exitCodes)
+        closeMetrics(files=len(exitCodes), exitCodes={str(code): list(exitCodes.values()).count(code) for code in set(exitCodes.values())}, duplicates=dict(duplicates))
+
+        # Show the errors met by the batch workers
+        errorsShown = superPrintQueued()
+
+        if len(exitCodes) == 1:
+            # Print a message if no subtitles have been found, for any of the languages
+            if ExitCode == 1:
+                superPrint("info", "No subtitles available :-(", '<b>No subtitles found</b> for this video:\n<i>' + os.path.basename(list(exitCodes)[0]) + '</i>')
+            elif ExitCode == 2 and not errorsShown:
+                superPrint("error", "Subtitling error!", "An error occurred while downloading or writing the subtitles for this video:\n<i>" + os.path.basename(list(exitCodes)[0]) + '</i>')
+        elif len(exitCodes) > 1:
+            # Print the exit code of each video, you can use them to improve scripting behaviours
+            for videoPath, videoExitCode in exitCodes.items():
+                print(str(videoExitCode) + " " + videoPath)
+
+            # Print a summary of the batch if some subtitles are missing
+            if ExitCode != 0:
+                superPrint("info", "Subtitles batch finished", "Subtitles downloaded for <b>" + str(list(exitCodes.values()).count(0)) + "</b> of " + str(len(exitCodes)) + " videos.\n" + \
+                           "No subtitles found for <b>" + str(list(exitCodes.values()).count(1)) + "</b> videos.\n" + \
+                           "Errors for <b>" + str(list(exitCodes.values()).count(2)) + "</b> videos.")
+
+        # Print the calls saved by the copies of the videos
+        if duplicates['videos']:
+            print("Copies of other videos: " + str(duplicates['videos']) + ", saved " + str(duplicates['hashes']) + " hashes, " + \
+                  str(duplicates['queries']) + " search queries and " + str(duplicates['downloads']) + " downloads")
+
+        # Print a single summary of the downloads queued because of the download limit
+        if quota.queued:
+            superPrint("info", "Download limit reached!", "<b>" + str(quota.queued) + "</b> subtitles have not been downloaded, to stay under the download limit of " + \
+                       str(opt_download_limit) + " subtitles per 24 hours.\nThey will be downloaded by the next runs.")
+
+        # Print a single summary of the videos skipped because they already have subtitles
+        if skippedList:
+            superPrint("info", "Subtitles already downloaded!", "Subtitles files already exist for <b>" + str(len(skippedList)) + "</b> videos, they have been skipped:\n<i>" + \
+                       "\n".join(os.path.basename(path) for path in skippedList[:10]) + ("\n..." if len(skippedList) > 10 else "") + "</i>")
+
+    except (OSError, IOError, RuntimeError, TypeError, NameError, KeyError):
+
+        # Do not warn about remote disconnection # bug/feature of python 3.5?
+        if "http.client.RemoteDisconnected" in str(sys.exc_info()[0]):
+            sys.exit(ExitCode)
+
+        # An unknown error occur, let's apologize before exiting
+        superPrint("error", "Unexpected error!", "OpenSubtitlesDownloadQt encountered an <b>unknown error</b>, sorry about that...\n\n" + \
+                   "Error: <b>" + str(sys.exc_info()[0]).replace('<', '[').replace('>', ']') + "</b>\n" + \
+                   "Line: <b>" + str(sys.exc_info()[-1].tb_lineno) + "</b>\n\n" + \
+                   "Just to be safe, please check:\n- www.opensubtitles.org availability\n- Your downloads limit (200 subtitles per 24h)\n- Your Internet connection status\n- That are using the latest version of this software ;-)")
+
+    except Exception:
 
-except Exception:
+        # Catch unhandled exceptions but do not spawn an error window
+        print("Unexpected error (line " + str(sys.exc_info()[-1].tb_lineno) + "): " + str(sys.exc_info()[0]))
 
-    # Catch unhandled exceptions but do not spawn an error window
-    print("Unexpected error (line " + str(sys.exc_info()[-1].tb_lineno) + "): " + str(sys.exc_info()[0]))
+    finally:
+        # Summary of the runs ended before the end of the batch (connection error, interruption)
+        closeMetrics()
 
-# Disconnect from opensubtitles.org server, then exit
-if session and session['token']:
-    osd_server.LogOut(session['token'])
+    # Keep the session for the next instances (instead of disconnecting from opensubtitles.org server), then exit
+    if session and session['token']:
+        saveSession(session)
 
-sys.exit(ExitCode)
+    sys.exit(ExitCode)
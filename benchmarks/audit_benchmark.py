@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# OpenSubtitlesDownloadQt.py / library audit benchmark
+# Build a library of empty video files (100 per directory), with subtitles files
+# named after the naming rules of the download path (with or without language
+# code), then measure the time needed to audit it with one and several worker
+# threads. Then check the coverage of every video against the files created,
+# and against the check used to skip the videos that already have subtitles.
+# Finally, pipe the audit report of a small library into a download run (using
+# the stand-in server of e2e_benchmark.py), and check that only the missing
+# languages have been downloaded.
+#
+# Usage: python3 benchmarks/audit_benchmark.py [-v videos] [-j workers]
+
+import io
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import OpenSubtitlesDownloadQt as osd
+
+# (subtitles files of a video, expected coverage of 'eng' and 'fre')
+subtitlesKinds = [
+    ([], [False, False]),
+    (['%s.srt'], [True, False]),
+    (['%s_en.srt'], [True, False]),
+    (['%s_fr.srt'], [False, True]),
+    (['%s.en.srt', '%s-fre.ass'], [True, True]),
+]
+
+def buildLibrary(root, videos):
+    """Create the library, return the expected coverage of each video path"""
+    expected = {}
+    for index in range(videos):
+        directory = os.path.join(root, 'Show %03d' % (index // 1000), 'Season %02d' % (index // 100 % 10))
+        if index % 100 == 0:
+            os.makedirs(directory)
+        stem = 'Show.S%02dE%03d.720p' % (index // 100 % 10, index % 100)
+        files, coverage = subtitlesKinds[index % len(subtitlesKinds)]
+        for name in ['%s.mkv'] + files:
+            open(os.path.join(directory, name % stem), 'w').close()
+        expected[os.path.join(directory, stem + '.mkv')] = coverage
+    return expected
+
+def checkPipe(root, videos=20):
+    """Audit a library, download the subtitles missing from the report (CSV, as piped into
+    a run using '-' as path), then audit it again: return the number of errors"""
+    from e2e_benchmark import standInServer
+    expected = buildLibrary(root, videos)
+    for index, path in enumerate(expected):
+        with open(path, 'wb') as f:
+            f.truncate((1 << 20) + index) # a different hash for each video
+    existing = {os.path.join(directory, name) for directory, subdirectories, files in os.walk(root) for name in files if not name.endswith('.mkv')}
+
+    server = standInServer(0, 0, 0, 2, 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    osd.headless = True
+    osd.osd_server_url = 'http://127.0.0.1:%d/xml-rpc' % server.server_address[1]
+    osd.osd_server = osd.newServerProxy()
+    osd.opt_search_rate = 0
+    osd.opt_download_limit = sys.maxsize
+    osd.opt_search_overwrite = 'on'
+    osd.cachepath = osd.sessionpath = osd.storepath = ''
+
+    report = io.StringIO()
+    with contextlib.redirect_stdout(report):
+        osd.printAudit(osd.auditVideos([root]), 'csv')
+    report.seek(0)
+    session = osd.openSession()
+    exitCodes = osd.processBatch(session['token'], osd.scanVideos(osd.readVideoPaths(report)), 4)
+    server.shutdown()
+
+    errors = 0
+    results = osd.auditVideos([root])
+    if len(exitCodes) != sum(not all(coverage) for coverage in expected.values()) or any(exitCodes.values()):
+        print("FAILED  pipe: exit codes %s" % sorted(exitCodes.values()))
+        errors += 1
+    if any(not all(coverage) for path, coverage in results):
+        print("FAILED  pipe: %d videos still missing subtitles" % sum(not all(coverage) for path, coverage in results))
+        errors += 1
+    if any(os.path.getsize(path) for path in existing):
+        print("FAILED  pipe: %d existing subtitles overwritten" % sum(1 for path in existing if os.path.getsize(path)))
+        errors += 1
+    if not errors:
+        print("OK       audit | download of %d videos missing subtitles" % len(exitCodes))
+    return errors
+
+def timed(workers, root):
+    start = time.perf_counter()
+    results = osd.auditVideos([root], workers=workers)
+    return results, time.perf_counter() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='library audit benchmark')
+    parser.add_argument('-v', '--videos', help="Number of videos in the library (default: 100000)", type=int, default=100000)
+    parser.add_argument('-j', '--jobs', help="Number of worker threads (default: 8)", type=int, default=8)
+    result = parser.parse_args()
+
+    osd.opt_languages[:] = ['eng,fre,'] # as written by the settings window
+    osd.opt_language_suffix = 'auto'
+
+    with tempfile.TemporaryDirectory() as root:
+        expected = buildLibrary(root, result.videos)
+
+        print("== %d videos" % result.videos)
+        results, timeSingle = timed(1, root)
+        print("1 worker:   %8.2f s (%d videos/s)" % (timeSingle, len(results) / timeSingle))
+        results, timeWorkers = timed(result.jobs, root)
+        print("%d workers: %8.2f s (%d videos/s, x%.2f)" % (result.jobs, timeWorkers, len(results) / timeWorkers, timeSingle / timeWorkers))
+
+        mismatches = sum(1 for path, coverage in results if coverage != expected.get(path))
+        print("%-8s coverage of %d videos (expected %d)" % ("FAILED" if mismatches or len(results) != len(expected) else "OK", len(results), len(expected)))
+        inconsistent = sum(1 for path, coverage in results if any(coverage) != osd.checkSubtitlesExists(path))
+        print("%-8s consistent with checkSubtitlesExists()" % ("FAILED" if inconsistent else "OK"))
+
+    with tempfile.TemporaryDirectory() as root:
+        errors = checkPipe(root)
+
+    sys.exit(1 if mismatches or inconsistent or len(results) != len(expected) or errors else 0)
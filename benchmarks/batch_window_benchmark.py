@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# OpenSubtitlesDownloadQt.py / batch review window benchmark
+# Add the search results of hundreds of videos to the batch review window, one
+# video at a time (as the searches complete), and measure the time needed to
+# show each video and the memory retained by the window, compared with keeping
+# the complete search results. Then check that the subtitles chosen for each
+# video are the ones of the automatic selection mode.
+#
+# Usage: QT_QPA_PLATFORM=offscreen python3 benchmarks/batch_window_benchmark.py [-v videos] [-r results]
+
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import OpenSubtitlesDownloadQt as osd
+
+def searchedVideo(generator, index, results):
+    """A video with random search results (every field sent by the server)"""
+    video = osd.newVideo('/videos/Show.S01E%03d.720p.HDTV.x264-LOL.mkv' % index, '%016x' % index, 1000000)
+    video['index'] = index
+    data = []
+    for i in range(results):
+        language = generator.choice(['eng', 'fre'])
+        data.append({'SubFileName': 'Show.S01E%03d.%s.%s.srt' % (index, generator.choice(['720p', '1080p', 'HDTV', 'WEB-DL']), i),
+                     'SubLanguageID': language, 'LanguageName': language, 'ISO639': language[:2], 'SubFormat': 'srt',
+                     'SubDownloadLink': 'http://dl.opensubtitles.org/en/download/src-api/vrf-%d/sid-%d/%d.gz' % (i, index, i),
+                     'SubSize': str(generator.randrange(100000)), 'MatchedBy': generator.choice(['moviehash', 'fulltext']),
+                     'MovieName': 'Show', 'SubHearingImpaired': '0', 'SubRating': '0.0', 'SubDownloadsCnt': '10',
+                     'IDSubtitleFile': str(i), 'SubHash': '%032x' % i, 'MovieHash': video['hash'], 'QueryNumber': '0',
+                     'SubAddDate': '2020-01-01 00:00:00', 'UserNickName': 'user', 'SubAuthorComment': 'x' * 40})
+    video['results'] = [{'data': data}]
+    return video
+
+def retained(function):
+    """Return the result of function() and the memory (in MB) it retains"""
+    tracemalloc.start()
+    result = function()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size / 1024 / 1024
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='batch review window benchmark')
+    parser.add_argument('-v', '--videos', help="Number of videos in the batch (default: 500)", type=int, default=500)
+    parser.add_argument('-r', '--results', help="Number of results for each video (default: 200)", type=int, default=200)
+    result = parser.parse_args()
+
+    osd.headless = False
+    osd.opt_languages[:] = ['eng,fre']
+    osd.loadQt()
+
+    window = osd.batchWindow()
+    window.show()
+
+    def fillWindow():
+        timings = []
+        generator = random.Random(0)
+        for index in range(result.videos):
+            video = searchedVideo(generator, index, result.results)
+            start = time.perf_counter()
+            window.appendRows(osd.reviewVideo(video))
+            osd.Application.processEvents()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def keepResults():
+        generator = random.Random(0)
+        return [searchedVideo(generator, index, result.results) for index in range(result.videos)]
+
+    timings, sizeWindow = retained(fillWindow)
+    videos, sizeResults = retained(keepResults)
+
+    print("== %d videos, %d results each" % (result.videos, result.results))
+    print("time to show a video:    average %6.2f ms  max %6.2f ms" % (sum(timings) / len(timings), max(timings)))
+    print("complete search results: %8.1f MB" % sizeResults)
+    print("batch review window:     %8.1f MB (x%.1f less)" % (sizeWindow, sizeResults / sizeWindow))
+
+    mismatches = 0
+    for row, video in zip(window.model.rows, videos):
+        expected = osd.selectionAuto(video['results'][0], video['fileName'])
+        if row['candidates'][row['choice']]['SubFileName'] != expected:
+            mismatches += 1
+    print("%-8s automatic choices of %d videos" % ("FAILED" if mismatches else "OK", len(videos)))
+
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# OpenSubtitlesDownloadQt.py / offline end-to-end benchmark
+# Start a local stand-in for the opensubtitles.org XML-RPC server (LogIn, LogOut,
+# NoOperation, SearchSubtitles, DownloadSubtitles and gzip download links, with
+# configurable latency and error rate), generate synthetic video libraries (sparse files, in a
+# show / season directory tree), then run the headless batch engine on them and
+# report files/second, per stage latency percentiles and peak RSS.
+#
+# The server, and the engine for each library size, run in their own processes,
+# so they don't compete for the GIL and the peak RSS is measured per library.
+# Results can be saved (--json) and compared with a previous run (--compare).
+#
+# Usage: python3 benchmarks/e2e_benchmark.py [-s 10,1000,50000] [--latency ms] [--error-rate 0.01] [--cache path]
+
+import os
+import sys
+import gzip
+import json
+import base64
+import time
+import random
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+import collections
+import socketserver
+import xmlrpc.client
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+stages = ['scan', 'hash', 'search', 'select', 'download']
+
+# ==== Stand-in server =========================================================
+
+class standInHandler(SimpleXMLRPCRequestHandler):
+    """XML-RPC handler (with keep-alive connections), also serving the gzip download links"""
+    protocol_version = 'HTTP/1.1'
+    rpc_paths = ('/xml-rpc',)
+
+    def do_GET(self):
+        self.server.delay()
+        if self.server.failure():
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = self.server.downloads[int(self.path.rsplit('/', 2)[1]) % len(self.server.downloads)][1]
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class standInServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    """Stand-in for the opensubtitles.org XML-RPC server"""
+    daemon_threads = True
+
+    def __init__(self, port, latency, errorRate, results, missRate):
+        SimpleXMLRPCServer.__init__(self, ('127.0.0.1', port), requestHandler=standInHandler, logRequests=False, allow_none=True)
+        self.latency = latency
+        self.errorRate = errorRate
+        self.results = results
+        self.missRate = missRate
+        self.random = random.Random(0)
+        # Subtitles files served by the download links: (uncompressed size, gzip content)
+        self.downloads = []
+        for i in range(16):
+            lines = ["%d\n00:00:%02d,000 --> 00:00:%02d,500\nSubtitles line %d of file %d\n" % (n + 1, n % 60, n % 60, n, i) for n in range(20 + i * 10)]
+            content = "\n".join(lines).encode()
+            self.downloads.append((len(content), gzip.compress(content)))
+        for function in (self.LogIn, self.LogOut, self.NoOperation, self.SearchSubtitles, self.DownloadSubtitles):
+            self.register_function(function)
+
+    def delay(self):
+        """Simulate the network and server latency"""
+        if self.latency > 0:
+            time.sleep(self.latency * self.random.uniform(0.5, 1.5))
+
+    def failure(self):
+        """Randomly fail a request"""
+        return self.errorRate > 0 and self.random.random() < self.errorRate
+
+    def call(self):
+        self.delay()
+        if self.failure():
+            raise xmlrpc.client.Fault(503, "Service Unavailable")
+
+    def LogIn(self, username, password, language, useragent):
+        self.call()
+        return {'status': '200 OK', 'token': 'benchmark%016x' % self.random.getrandbits(64)}
+
+    def LogOut(self, token):
+        self.call()
+        return {'status': '200 OK'}
+
+    def NoOperation(self, token):
+        self.call()
+        return {'status': '200 OK'}
+
+    def subtitle(self, identifier, queryNumber, language, name, matchedBy):
+        size = self.downloads[identifier % len(self.downloads)][0]
+        return {'IDSubtitleFile': str(identifier), 'SubFileName': name + '.' + str(identifier) + '.srt',
+                'SubFormat': 'srt', 'SubSize': str(size), 'SubLanguageID': language, 'ISO639': language[:2],
+                'LanguageName': language, 'MovieName': name.split('.')[0], 'MatchedBy': matchedBy,
+                'SubHearingImpaired': '0', 'SubRating': str(identifier % 10), 'SubDownloadsCnt': str(identifier % 1000),
+                'SubDownloadLink': 'http://%s:%d/download/%d/%s.gz' % (self.server_address[0], self.server_address[1], identifier, language),
+                'QueryNumber': str(queryNumber)}
+
+    def SearchSubtitles(self, token, queries):
+        self.call()
+        data = []
+        for queryNumber, query in enumerate(queries):
+            key = query.get('moviehash', query.get('query', ''))
+            generator = random.Random(key)
+            if 'moviehash' in query and generator.random() < self.missRate:
+                continue # No match by hash, the client should retry by filename
+            for language in query['sublanguageid'].strip(',').split(','):
+                for i in range(self.results):
+                    identifier = generator.randrange(1000000)
+                    if 'moviehash' in query:
+                        subtitle = self.subtitle(identifier, queryNumber, language, 'Movie.' + key, 'moviehash')
+                        subtitle['MovieHash'] = key
+                    else:
+                        subtitle = self.subtitle(identifier, queryNumber, language, key.rsplit('.', 1)[0], 'fulltext')
+                    data.append(subtitle)
+        return {'status': '200 OK', 'data': data or False}
+
+    def DownloadSubtitles(self, token, identifiers):
+        self.call()
+        return {'status': '200 OK',
+                'data': [{'idsubtitlefile': str(identifier),
+                          'data': base64.b64encode(self.downloads[int(identifier) % len(self.downloads)][1]).decode()}
+                         for identifier in identifiers]}
+
+def runServer(arguments):
+    """Serve forever, the port is printed on the first line of stdout"""
+    server = standInServer(arguments.port, arguments.latency / 1000, arguments.error_rate, arguments.results, arguments.miss_rate)
+    print(server.server_address[1], flush=True)
+    server.serve_forever()
+
+# ==== Synthetic libraries =====================================================
+
+def createLibrary(directory, count, seed=0):
+    """Create a library of count (sparse) video files, 20 episodes per season and
+    10 seasons per show, with a few other files in each season directory"""
+    generator = random.Random(seed)
+    extensions = ['mkv'] * 8 + ['avi', 'mp4']
+    for i in range(count):
+        show, season, episode = i // 200, (i // 20) % 10 + 1, i % 20 + 1
+        seasonPath = os.path.join(directory, "Show %04d" % show, "Season %02d" % season)
+        if episode == 1:
+            os.makedirs(seasonPath)
+            for name in ("folder.jpg", "season.nfo"):
+                open(os.path.join(seasonPath, name), 'wb').close()
+        name = "Show.%04d.S%02dE%02d.720p.HDTV.x264-GROUP.%s" % (show, season, episode, generator.choice(extensions))
+        with open(os.path.join(seasonPath, name), 'wb') as f:
+            # Random sizes make random hashes, without writing anything on disk
+            f.truncate(generator.randrange(200 << 20, 4 << 30))
+
+# ==== Engine run ==============================================================
+
+def percentiles(values):
+    """Latency percentiles of a stage, in milliseconds"""
+    if not values:
+        return {}
+    values = sorted(values)
+    def percentile(p):
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 3)
+    return {'count': len(values), 'p50': percentile(0.50), 'p90': percentile(0.90),
+            'p99': percentile(0.99), 'max': round(values[-1] * 1000, 3)}
+
+def runEngine(arguments):
+    """Run the headless batch engine on a library, print the results as JSON"""
+    sys.path.insert(0, root)
+    import OpenSubtitlesDownloadQt as osd
+
+    timings = collections.defaultdict(list)
+
+    def timed(stage, function):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                timings[stage].append(time.perf_counter() - start)
+        return wrapper
+
+    def timedScan(iterator):
+        while True:
+            start = time.perf_counter()
+            path = next(iterator, None)
+            timings['scan'].append(time.perf_counter() - start)
+            if path is None:
+                return
+            yield path
+
+    # Headless, automatic selection, no rate limiting nor download limit
+    osd.headless = True
+    osd.osd_server_url = 'http://127.0.0.1:%d/xml-rpc' % arguments.port
+    osd.osd_server = osd.newServerProxy()
+    osd.opt_languages[:] = [arguments.languages]
+    osd.opt_selection_mode = 'auto'
+    osd.opt_search_rate = 0
+    osd.opt_download_limit = sys.maxsize
+    osd.cachepath = arguments.cache or ''
+    osd.sessionpath = ''
+
+    osd.hashFileCached = timed('hash', osd.hashFileCached)
+    osd.searchSubtitles = timed('search', osd.searchSubtitles)
+    osd.selectionAuto = timed('select', osd.selectionAuto)
+    osd.downloadSubtitles = timed('download', osd.downloadSubtitles)
+    osd.downloadSubtitlesBulk = timed('download', osd.downloadSubtitlesBulk)
+
+    start = time.perf_counter()
+    session = osd.openSession()
+    osd.openCache()
+    try:
+        exitCodes = osd.processBatch(session['token'], timedScan(osd.scanVideos([arguments.engine])), arguments.workers)
+    finally:
+        osd.closeCache()
+    elapsed = time.perf_counter() - start
+
+    codes = collections.Counter(exitCodes.values())
+    print(json.dumps({'files': len(exitCodes),
+                      'seconds': round(elapsed, 3),
+                      'filesPerSecond': round(len(exitCodes) / elapsed, 1),
+                      'peakRSS': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, # KiB on Linux
+                      'exitCodes': {str(code): count for code, count in codes.items()},
+                      'stages': {stage: percentiles(timings[stage]) for stage in stages}}))
+
+# ==== Report ==================================================================
+
+def printResults(results, baseline):
+    """Print the results of each library size, compared with the baseline results (if any)"""
+    for size, result in results.items():
+        reference = baseline.get(size)
+        comparison = ""
+        if reference:
+            comparison = "  (baseline: %.1f files/s, x%.2f)" % (reference['filesPerSecond'], result['filesPerSecond'] / reference['filesPerSecond'])
+        print("\n== %s files: %.1f files/s, %.2f s, peak RSS %.1f MiB, exit codes %s%s" % \
+              (size, result['filesPerSecond'], result['seconds'], result['peakRSS'] / 1024, result['exitCodes'], comparison))
+        print("  %-9s %8s %10s %10s %10s %10s" % ("stage", "count", "p50 (ms)", "p90 (ms)", "p99 (ms)", "max (ms)"))
+        for stage in stages:
+            latency = result['stages'].get(stage)
+            if not latency:
+                continue
+            line = "  %-9s %8d %10.3f %10.3f %10.3f %10.3f" % (stage, latency['count'], latency['p50'], latency['p90'], latency['p99'], latency['max'])
+            if reference and reference['stages'].get(stage):
+                line += "  (p50 x%.2f)" % (latency['p50'] / max(reference['stages'][stage]['p50'], 0.001))
+            print(line)
+
+def checkResults(size, result, libraryPath, errorRate):
+    """Check that every video has been processed, and that its subtitles have been written"""
+    errors = 0
+    if result['files'] != size:
+        print("FAILED: %d videos processed instead of %d" % (result['files'], size))
+        errors += 1
+    if errorRate == 0:
+        subtitles = sum(1 for directory, subdirectories, files in os.walk(libraryPath) for name in files if name.endswith('.srt'))
+        if result['exitCodes'].get('0', 0) != size or subtitles != size:
+            print("FAILED: %d videos with subtitles, %d subtitles files written, for %d videos" % (result['exitCodes'].get('0', 0), subtitles, size))
+            errors += 1
+    return errors
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='OpenSubtitlesDownloadQt.py offline end-to-end benchmark')
+    parser.add_argument('-s', '--sizes', help="Library sizes (default: 10,1000,50000)", default='10,1000,50000')
+    parser.add_argument('-j', '--workers', help="Worker threads of the batch engine (default: 4)", type=int, default=4)
+    parser.add_argument('-l', '--languages', help="Languages searched (default: eng)", default='eng')
+    parser.add_argument('--latency', help="Average latency of the server, in milliseconds (default: 0)", type=float, default=0)
+    parser.add_argument('--error-rate', help="Fraction of the server requests that fail (default: 0)", type=float, default=0)
+    parser.add_argument('--miss-rate', help="Fraction of the videos not found by hash (default: 0.1)", type=float, default=0.1)
+    parser.add_argument('--results', help="Subtitles found per video and language (default: 5)", type=int, default=5)
+    parser.add_argument('--cache', help="Use this local cache file, kept between the runs (otherwise every run is cold)", metavar='PATH')
+    parser.add_argument('--directory', help="Where to create the libraries (default: temporary directory)")
+    parser.add_argument('--json', help="Save the results into this file")
+    parser.add_argument('--compare', help="Compare with the results saved by a previous run")
+    parser.add_argument('--port', help=argparse.SUPPRESS, type=int, default=0)
+    parser.add_argument('--serve', help=argparse.SUPPRESS, action='store_true')
+    parser.add_argument('--engine', help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.serve:
+        runServer(arguments)
+        sys.exit(0)
+    if arguments.engine:
+        runEngine(arguments)
+        sys.exit(0)
+
+    baseline = {}
+    if arguments.compare:
+        with open(arguments.compare) as f:
+            baseline = json.load(f)['results']
+
+    server = subprocess.Popen([sys.executable, __file__, '--serve', '--port', str(arguments.port),
+                               '--latency', str(arguments.latency), '--error-rate', str(arguments.error_rate),
+                               '--miss-rate', str(arguments.miss_rate), '--results', str(arguments.results)],
+                              stdout=subprocess.PIPE, universal_newlines=True)
+    port = int(server.stdout.readline())
+    print("stand-in server on port %d (latency %.1f ms, error rate %.3f, miss rate %.2f)" % (port, arguments.latency, arguments.error_rate, arguments.miss_rate))
+
+    results = {}
+    errors = 0
+    workDirectory = tempfile.mkdtemp(prefix='osd-benchmark-', dir=arguments.directory)
+    try:
+        for size in [int(size) for size in arguments.sizes.split(',')]:
+            libraryPath = os.path.join(workDirectory, 'library-%d' % size)
+            start = time.perf_counter()
+            createLibrary(libraryPath, size)
+            print("library of %d files created in %.1f s" % (size, time.perf_counter() - start), flush=True)
+
+            command = [sys.executable, __file__, '--engine', libraryPath, '--port', str(port),
+                       '--workers', str(arguments.workers), '--languages', arguments.languages]
+            if arguments.cache:
+                command += ['--cache', os.path.abspath(arguments.cache)]
+            output = subprocess.run(command, stdout=subprocess.PIPE, universal_newlines=True, check=True).stdout
+            results[str(size)] = json.loads(output.strip().splitlines()[-1])
+            errors += checkResults(size, results[str(size)], libraryPath, arguments.error_rate)
+            shutil.rmtree(libraryPath)
+    finally:
+        server.terminate()
+        shutil.rmtree(workDirectory, ignore_errors=True)
+
+    printResults(results, baseline)
+    if arguments.json:
+        with open(arguments.json, 'w') as f:
+            json.dump({'arguments': {key: value for key, value in vars(arguments).items() if key not in ('json', 'compare')},
+                       'results': results}, f, indent=2)
+
+    sys.exit(1 if errors else 0)
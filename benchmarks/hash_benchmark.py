@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# OpenSubtitlesDownloadQt.py / hashing microbenchmark
+# Check that hashFile() produces bit-identical hashes compared to the original
+# (struct.unpack based) implementation and to known golden values, then compare
+# the speed of both implementations.
+#
+# Usage: python3 benchmarks/hash_benchmark.py [-n iterations]
+
+import os
+import sys
+import time
+import random
+import struct
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import OpenSubtitlesDownloadQt as osd
+
+# ==== Reference implementation ================================================
+
+def hashFileReference(path):
+    """Original implementation of hashFile(), coming from SubDownloader"""
+    longlongformat = 'Q' # unsigned long long little endian
+    bytesize = struct.calcsize(longlongformat)
+    format = "<%d%s" % (65536//bytesize, longlongformat)
+
+    f = open(path, "rb")
+    filesize = os.fstat(f.fileno()).st_size
+    hash = filesize
+
+    buffer = f.read(65536)
+    hash += sum(struct.unpack(format, buffer))
+    f.seek(-65536, os.SEEK_END)
+    buffer = f.read(65536)
+    hash += sum(struct.unpack(format, buffer))
+    hash &= 0xFFFFFFFFFFFFFFFF
+
+    f.close()
+    return "%016x" % hash
+
+# ==== Golden values ===========================================================
+# (file size, random seed or None for a file filled with 0xFF, expected hash)
+
+goldenValues = [
+    (131072, None, '000000000001c000'),
+    (131072, 1, 'a55b4992a54fe71e'),
+    (131073, 2, '1746e90cdf1a5cfc'),
+    (131079, 3, '72e78eb024f3cffe'),
+    (131080, 4, '65844df3ad506019'),
+    (131081, 5, '7b5012d6e3cf2718'),
+    (196608, 6, 'cca2e906dd774a73'),
+    (1048579, 7, '9c69421b22643e6a'),
+]
+
+def createFile(directory, size, seed):
+    """Create a file with deterministic content"""
+    path = os.path.join(directory, "video_" + str(size) + "_" + str(seed) + ".mkv")
+    with open(path, 'wb') as f:
+        if seed is None:
+            f.write(b'\xff' * size)
+        else:
+            f.write(random.Random(seed).randbytes(size))
+    return path
+
+def checkGoldenValues(directory):
+    """Compare hashFile() against the reference implementation and the golden values"""
+    errors = 0
+    for size, seed, expected in goldenValues:
+        path = createFile(directory, size, seed)
+        reference = hashFileReference(path)
+        current = osd.hashFile(path)
+        status = "OK"
+        if current != reference or current != expected:
+            status = "FAILED"
+            errors += 1
+        print("%-8s size: %8d  seed: %-4s  expected: %s  reference: %s  hashFile: %s" % (status, size, seed, expected, reference, current))
+    return errors
+
+# ==== Microbenchmark ==========================================================
+
+def benchmark(function, paths, iterations):
+    """Return the average time (in µs) spent to hash one file"""
+    start = time.perf_counter()
+    for i in range(iterations):
+        for path in paths:
+            function(path)
+    return (time.perf_counter() - start) / (iterations * len(paths)) * 1000000
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='hashFile() golden values check and microbenchmark')
+    parser.add_argument('-n', '--iterations', help="Number of iterations (default: 200)", type=int, default=200)
+    result = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = [createFile(directory, 131072 + i * 4099, 100 + i) for i in range(16)]
+
+        # Pure python kernel (never let hashFile() load NumPy)
+        print("== pure python kernel")
+        osd.numpyLoaded = True
+        errors = checkGoldenValues(directory)
+        timeReference = benchmark(hashFileReference, paths, result.iterations)
+        timeCurrent = benchmark(osd.hashFile, paths, result.iterations)
+        print("reference: %8.1f µs/file" % timeReference)
+        print("hashFile:  %8.1f µs/file (x%.2f)" % (timeCurrent, timeReference / timeCurrent))
+
+        # NumPy kernel, if available
+        try:
+            start = time.perf_counter()
+            import numpy
+            osd.numpy = numpy
+            print("\n== numpy kernel (loaded by the first hash, in %.1f ms)" % ((time.perf_counter() - start) * 1000))
+            errors += checkGoldenValues(directory)
+            timeCurrent = benchmark(osd.hashFile, paths, result.iterations)
+            print("hashFile:  %8.1f µs/file (x%.2f)" % (timeCurrent, timeReference / timeCurrent))
+        except ImportError:
+            print("\n== numpy kernel: NumPy is not available")
+
+    sys.exit(1 if errors else 0)
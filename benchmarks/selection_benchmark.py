@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# OpenSubtitlesDownloadQt.py / automatic selection microbenchmark
+# Check that selectionAuto() selects the same subtitles as the original (nested
+# loops based) implementation, on random result lists and on golden cases, then
+# compare the speed of both implementations (and of the full ranking) on lists
+# of 1000 results.
+#
+# Usage: python3 benchmarks/selection_benchmark.py [-n iterations] [-r results]
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import OpenSubtitlesDownloadQt as osd
+
+# ==== Reference implementation ================================================
+
+def selectionAutoReference(subtitlesList, videoFileName):
+    """Original implementation of selectionAuto()"""
+
+    if len(osd.opt_languages) == 1:
+        splitted_languages_list = list(reversed(osd.opt_languages[0].split(',')))
+    else:
+        splitted_languages_list = osd.opt_languages
+
+    videoFileParts = videoFileName.replace('-', '.').replace(' ', '.').replace('_', '.').lower().split('.')
+    maxScore = -1
+
+    for subtitle in subtitlesList['data']:
+        score = 0
+        # points to respect languages priority
+        score += splitted_languages_list.index(subtitle['SubLanguageID']) * 100
+        # extra point if the sub is found by hash
+        if subtitle['MatchedBy'] == 'moviehash':
+            score += 1
+        # points for filename mach
+        subFileParts = subtitle['SubFileName'].replace('-', '.').replace(' ', '.').replace('_', '.').lower().split('.')
+        for subPart in subFileParts:
+            for filePart in videoFileParts:
+                if subPart == filePart:
+                    score += 1
+        if score > maxScore:
+            maxScore = score
+            subtitlesSelected = subtitle['SubFileName']
+
+    return subtitlesSelected
+
+# ==== Result lists ============================================================
+
+words = ['the', 'show', 'movie', 's01e02', 's02e05', '720p', '1080p', '2160p', 'hdtv', 'webrip', 'web-dl',
+         'bluray', 'x264', 'x265', 'hevc', 'aac', 'dts', 'proper', 'repack', 'extended', 'group', 'lol',
+         'dimension', 'killers', 'fleet', 'rarbg', 'yify', 'eng', 'fre', 'spa', 'sdh', 'hi', 'forced']
+
+def subtitlesResults(generator, count, languages):
+    """Random search results, without repeated tokens in the file names"""
+    data = []
+    for i in range(count):
+        tokens = generator.sample(words, generator.randrange(3, 10))
+        separator = generator.choice(['.', ' ', '_', '-'])
+        data.append({'SubFileName': separator.join(tokens) + '.srt',
+                     'SubLanguageID': generator.choice(languages),
+                     'MatchedBy': generator.choice(['moviehash', 'fulltext'])})
+    return {'data': data}
+
+# (languages, video file name, [(SubFileName, SubLanguageID, MatchedBy)], expected SubFileName)
+goldenValues = [
+    ('eng', 'The.Show.S01E02.720p.HDTV.x264-LOL.mkv',
+     [('The.Show.S01E02.1080p.WEB-DL.srt', 'eng', 'fulltext'),
+      ('The.Show.S01E02.720p.HDTV.x264-LOL.srt', 'eng', 'fulltext'),
+      ('The.Show.S01E02.720p.srt', 'eng', 'moviehash')],
+     'The.Show.S01E02.720p.HDTV.x264-LOL.srt'),
+    ('fre,eng', 'The Show S01E02 720p.mkv',
+     [('The.Show.S01E02.720p.eng.srt', 'eng', 'moviehash'),
+      ('show.srt', 'fre', 'fulltext')],
+     'show.srt'),
+    ('eng,fre', 'movie.mkv',
+     [('a.srt', 'fre', 'fulltext'),
+      ('b.srt', 'eng', 'fulltext'),
+      ('c.srt', 'eng', 'fulltext')],
+     'b.srt'),
+]
+
+def checkGoldenValues(iterations):
+    """Compare selectionAuto() against the golden values and the reference implementation"""
+    errors = 0
+    for languages, videoFileName, results, expected in goldenValues:
+        osd.opt_languages[:] = [languages]
+        subtitlesList = {'data': [{'SubFileName': name, 'SubLanguageID': language, 'MatchedBy': matchedBy}
+                                  for name, language, matchedBy in results]}
+        current = osd.selectionAuto(subtitlesList, videoFileName)
+        reference = selectionAutoReference(subtitlesList, videoFileName)
+        status = "OK"
+        if current != expected or reference != expected:
+            status = "FAILED"
+            errors += 1
+        print("%-8s %-40s expected: %-40s reference: %-40s selectionAuto: %s" % (status, videoFileName, expected, reference, current))
+
+    generator = random.Random(0)
+    mismatches = 0
+    for i in range(iterations):
+        languages = generator.sample(['eng', 'fre', 'spa', 'ger'], generator.randrange(1, 5))
+        osd.opt_languages[:] = [",".join(languages)]
+        subtitlesList = subtitlesResults(generator, generator.randrange(1, 50), languages)
+        videoFileName = ".".join(generator.sample(words, 6)) + ".mkv"
+        if osd.selectionAuto(subtitlesList, videoFileName) != selectionAutoReference(subtitlesList, videoFileName):
+            mismatches += 1
+    print("%-8s %d random result lists" % ("FAILED" if mismatches else "OK", iterations))
+
+    return errors + mismatches
+
+# ==== Microbenchmark ==========================================================
+
+def benchmark(function, subtitlesList, videoFileName, iterations):
+    """Return the average time (in ms) spent to select a subtitles"""
+    start = time.perf_counter()
+    for i in range(iterations):
+        function(subtitlesList, videoFileName)
+    return (time.perf_counter() - start) / iterations * 1000
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='selectionAuto() golden values check and microbenchmark')
+    parser.add_argument('-n', '--iterations', help="Number of iterations (default: 100)", type=int, default=100)
+    parser.add_argument('-r', '--results', help="Number of results in the list (default: 1000)", type=int, default=1000)
+    result = parser.parse_args()
+
+    errors = checkGoldenValues(1000)
+
+    languages = ['eng', 'fre', 'spa']
+    osd.opt_languages[:] = [",".join(languages)]
+    subtitlesList = subtitlesResults(random.Random(1), result.results, languages)
+    videoFileName = "The.Show.S01E02.720p.HDTV.x264-LOL.mkv"
+
+    print("\n== %d results" % result.results)
+    timeReference = benchmark(selectionAutoReference, subtitlesList, videoFileName, result.iterations)
+    timeCurrent = benchmark(osd.selectionAuto, subtitlesList, videoFileName, result.iterations)
+    print("reference:     %8.3f ms/selection" % timeReference)
+    print("selectionAuto: %8.3f ms/selection (x%.2f)" % (timeCurrent, timeReference / timeCurrent))
+    timeRanking = benchmark(osd.selectionAutoRanking, subtitlesList, videoFileName, result.iterations)
+    print("full ranking:  %8.3f ms/ranking   (x%.2f)" % (timeRanking, timeReference / timeRanking))
+
+    sys.exit(1 if errors else 0)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# OpenSubtitlesDownloadQt.py / startup benchmark
+# Measure the import time of the script (using 'python -X importtime'), check
+# that the headless mode never loads PyQt5, and time a few complete startups
+# of the command line interface.
+#
+# Usage: python3 benchmarks/startup_benchmark.py [-n runs]
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+script = os.path.join(root, 'OpenSubtitlesDownloadQt.py')
+
+# ==== Import time =============================================================
+
+def importTime(code):
+    """Run 'code' with -X importtime, return the list of (cumulative µs, module)"""
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                            cwd=root, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                            universal_newlines=True, check=True).stderr
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        imports.append((int(fields[1]), fields[2].strip()))
+    return imports
+
+# ==== Startup time ============================================================
+
+def startupTime(arguments, runs):
+    """Return the best and average wall time (in ms) of a complete startup"""
+    timings = []
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, script] + arguments,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), sum(timings) / len(timings)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='OpenSubtitlesDownloadQt.py startup benchmark')
+    parser.add_argument('-n', '--runs', help="Number of startups timed (default: 10)", type=int, default=10)
+    result = parser.parse_args()
+    errors = 0
+
+    print("== import OpenSubtitlesDownloadQt")
+    imports = importTime('import OpenSubtitlesDownloadQt')
+    total = [cumulative for cumulative, module in imports if module == 'OpenSubtitlesDownloadQt'][0]
+    print("cumulative import time: %8.1f ms" % (total / 1000))
+    for cumulative, module in sorted(imports, reverse=True)[1:11]:
+        print("  %8.1f ms  %s" % (cumulative / 1000, module))
+
+    qtModules = [module for cumulative, module in imports if module.startswith('PyQt5')]
+    if qtModules:
+        print("FAILED: PyQt5 is imported without any window: " + ", ".join(qtModules))
+        errors += 1
+    else:
+        print("OK: PyQt5 is not imported")
+
+    try:
+        qt = importTime('import PyQt5.QtWidgets')
+        print("\n(for reference, importing PyQt5.QtWidgets alone: %.1f ms)" % (max(qt)[0] / 1000))
+    except subprocess.CalledProcessError:
+        print("\n(PyQt5 is not available)")
+
+    print("\n== startup (%d runs)" % result.runs)
+    best, average = startupTime(['--headless', '--help'], result.runs)
+    print("--headless --help: best %6.1f ms  average %6.1f ms" % (best, average))
+    best, average = startupTime(['--help'], result.runs)
+    print("--help:            best %6.1f ms  average %6.1f ms" % (best, average))
+
+    sys.exit(1 if errors else 0)
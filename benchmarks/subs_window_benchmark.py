@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# OpenSubtitlesDownloadQt.py / subtitles selection window benchmark
+# Measure the time needed to open the subtitles selection window with a large
+# list of results (model/view table), compared with filling a QTableWidget with
+# one item per cell (original implementation). Then check that sorting by
+# downloads and filtering by name select the expected subtitles.
+#
+# Usage: QT_QPA_PLATFORM=offscreen python3 benchmarks/subs_window_benchmark.py [-r results]
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import OpenSubtitlesDownloadQt as osd
+
+def subtitlesResults(count):
+    """Random search results"""
+    generator = random.Random(0)
+    return {'data': [{'SubFileName': 'Movie.%05d.%s.srt' % (i, generator.choice(['720p', '1080p', 'HDTV', 'WEB-DL'])),
+                      'LanguageName': generator.choice(['English', 'French', 'Spanish']),
+                      'SubHearingImpaired': generator.choice(['0', '1']),
+                      'SubRating': '%.1f' % generator.uniform(0, 10),
+                      'SubDownloadsCnt': str(generator.randrange(100000)),
+                      'MovieName': 'Movie'} for i in range(count)]}
+
+def openReference(subtitlesList):
+    """Fill a QTableWidget, one item per cell (as the original implementation did)"""
+    QtWidgets = osd.QtWidgets
+    table = QtWidgets.QTableWidget()
+    table.setColumnCount(5)
+    table.setRowCount(len(subtitlesList['data']))
+    for row, sub in enumerate(subtitlesList['data']):
+        for column, field in enumerate(['SubFileName', 'LanguageName', 'SubHearingImpaired', 'SubRating', 'SubDownloadsCnt']):
+            table.setItem(row, column, QtWidgets.QTableWidgetItem(sub[field]))
+        table.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
+    table.selectRow(0)
+    table.show()
+    osd.Application.processEvents()
+    return table
+
+def openWindow(subtitlesList):
+    """Open the subtitles selection window"""
+    window = osd.subsWindow(subtitlesList, 'Movie', 'Movie.mkv')
+    window.show()
+    osd.Application.processEvents()
+    return window
+
+def timed(function, subtitlesList):
+    start = time.perf_counter()
+    widget = function(subtitlesList)
+    return widget, (time.perf_counter() - start) * 1000
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='subtitles selection window benchmark')
+    parser.add_argument('-r', '--results', help="Number of results in the list (default: 10000)", type=int, default=10000)
+    result = parser.parse_args()
+
+    osd.headless = False
+    osd.opt_display_language = osd.opt_display_hi = osd.opt_display_rating = osd.opt_display_count = 'on'
+    osd.loadQt()
+    subtitlesList = subtitlesResults(result.results)
+
+    print("== %d results" % result.results)
+    reference, timeReference = timed(openReference, subtitlesList)
+    reference.close()
+    window, timeWindow = timed(openWindow, subtitlesList)
+    print("QTableWidget (reference): %8.1f ms" % timeReference)
+    print("subsWindow (model/view):  %8.1f ms (x%.1f)" % (timeWindow, timeReference / timeWindow))
+
+    errors = 0
+    data = subtitlesList['data']
+
+    # Sort by downloads (descending), the first row is the most downloaded subtitles
+    window.subTable.sortByColumn(4, osd.QtCore.Qt.DescendingOrder)
+    window.subTable.selectRow(0)
+    window.doAccept()
+    expected = max(data, key=lambda sub: int(sub['SubDownloadsCnt']))['SubFileName']
+    print("%-8s sort by downloads: %s (expected %s)" % ("OK" if window.selectedSub == expected else "FAILED", window.selectedSub, expected))
+    errors += window.selectedSub != expected
+
+    # Filter by name
+    window.filterEdit.setText('movie.00042.')
+    window.doAccept()
+    expected = data[42]['SubFileName']
+    print("%-8s filter by name: %s (expected %s)" % ("OK" if window.selectedSub == expected else "FAILED", window.selectedSub, expected))
+    errors += window.selectedSub != expected
+
+    sys.exit(1 if errors else 0)